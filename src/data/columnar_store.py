@@ -0,0 +1,117 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from data.util import get_project_root
+
+# Part of every schema, bump it when the layout below changes
+store_version = 1
+store_dir = get_project_root() / "data/interim/columns"
+
+
+def write_store(name, data, source, units=None, parameters=None):
+    """
+    Writes each column of data to its own .npy file under store_dir/name, with a schema.json describing the columns.
+    Timezone-aware times are stored as UTC np.datetime64, with their timezone in the schema.
+
+    :param name: store name
+    :param data: columns of numbers or times
+    :type data: pd.DataFrame
+    :param source: path of the raw file data was parsed from, relative to the project root
+    :param units: units of each column, by column name
+    :type units: dict
+    :param parameters: anything else the parsing depended on, as JSON-serializable values
+    :return: the store's directory
+    :rtype: pathlib.Path
+    """
+    directory = store_dir / name
+    directory.mkdir(parents=True, exist_ok=True)
+    schema_path = directory / "schema.json"
+    if schema_path.exists():
+        schema_path.unlink()  # readers only trust columns listed in a schema, so drop it while they're rewritten
+
+    columns = []
+    for index, column in enumerate(data.columns):
+        values = data[column]
+        timezone = None
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            timezone = str(values.dt.tz)
+            values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+        array = values.to_numpy()
+        file_name = "column_{}.npy".format(index)
+        np.save(directory / file_name, array, allow_pickle=False)
+        columns.append({"name": str(column), "file": file_name, "dtype": str(array.dtype),
+                        "units": (units or {}).get(column), "timezone": timezone})
+
+    schema = {"version": store_version, "source": get_source_signature(source, parameters), "rows": len(data),
+              "columns": columns}
+    temporary_path = directory / "schema.json.{}.tmp".format(os.getpid())
+    with open(temporary_path, "w") as file:
+        json.dump(schema, file, indent=2)
+    os.replace(temporary_path, schema_path)
+    return directory
+
+
+def open_columns(name, source=None, parameters=None):
+    """
+    Opens a store's columns as read-only memory maps, without reading them.
+
+    :param source: the raw file the store should have been made from. If given, a store made from an older version of
+        it, or with other parameters, counts as missing.
+    :return: (schema, {column name: np.memmap}), or None if there is no current store
+    :rtype: (dict, dict)
+    """
+    schema = read_schema(name)
+    if not is_schema_current(schema, source, parameters):
+        return None
+    directory = store_dir / name
+    return schema, {column["name"]: np.load(directory / column["file"], mmap_mode="r", allow_pickle=False)
+                    for column in schema["columns"]}
+
+
+def read_frame(name, source=None, parameters=None):
+    """
+    A store as a dataframe, with timezone-aware times restored.
+
+    :return: the data, or None if there is no current store, see open_columns
+    :rtype: pd.DataFrame
+    """
+    opened = open_columns(name, source, parameters)
+    if opened is None:
+        return None
+    schema, columns = opened
+    data = pd.DataFrame({name: np.asarray(values) for name, values in columns.items()})
+    for column in schema["columns"]:
+        if column["timezone"] is not None:
+            data[column["name"]] = data[column["name"]].dt.tz_localize("UTC").dt.tz_convert(column["timezone"])
+    return data
+
+
+def is_current(name, source=None, parameters=None):
+    """
+    Whether there is a store of the name, made from the current version of source if given, see open_columns.
+
+    :rtype: bool
+    """
+    return is_schema_current(read_schema(name), source, parameters)
+
+
+def is_schema_current(schema, source=None, parameters=None):
+    if schema is None or schema["version"] != store_version:
+        return False
+    return source is None or schema["source"] == get_source_signature(source, parameters)
+
+
+def read_schema(name):
+    try:
+        with open(store_dir / name / "schema.json") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def get_source_signature(source, parameters=None):
+    status = os.stat(get_project_root() / source)
+    return {"path": str(source), "mtime_ns": status.st_mtime_ns, "size": status.st_size, "parameters": parameters}
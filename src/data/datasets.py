@@ -0,0 +1,31 @@
+from collections import namedtuple
+
+import util.exceptions as ex
+from util.location_util import Location
+
+# A flux tower site and where its data is, see data/raw/README.md
+#   weather_file - tab-separated, with columns time, windspeed (m/s), temp (C), latent_heat and sensible_heat (W/m^2)
+#       and pressure (mb), relative to the project root
+#   radiation_file - MesoWest CSV export with the incoming shortwave radiation in radiation_column (W/m^2)
+#   date - day of the first weather record, if the weather file only has times of day (later days are found where
+#       the time of day goes back); None if its time column holds whole timestamps
+Site = namedtuple("Site", ["name", "location", "albedo", "weather_file", "radiation_file", "radiation_column",
+                           "date"])
+
+murray = Site(
+    name="murray",
+    location=Location(40.67250, 111.80220, "US/Mountain"),  # Mountain Daylight Time is UTC+6
+    albedo=.18,
+    weather_file="data/processed/murray_weather.txt",
+    radiation_file="data/raw/murray_solar.csv",
+    radiation_column="solar_radiation_set_1",
+    date="2005-08-20",
+)
+
+sites = {site.name: site for site in [murray]}
+
+
+def get_site(name):
+    if name not in sites:
+        raise ex.InvalidArgumentError("Unrecognized site: " + str(name))
+    return sites[name]
@@ -0,0 +1,65 @@
+import argparse
+import time
+from collections import namedtuple
+
+import data.columnar_store as columnar_store
+import data.datasets as datasets
+import data.murray_data_loader as murray_data_loader
+import data.validation_data_loader as validation_data
+
+# A raw file and how to parse it; parameters are anything else the parsing depends on
+Source = namedtuple("Source", ["name", "path", "parse", "units", "parameters"])
+
+radiation_units = {"Rs down": "W/m^2", "Rs up": "W/m^2", "L down": "W/m^2", "L up": "W/m^2"}
+
+
+def get_sources():
+    sources = [
+        Source("dugway", validation_data.dugway_file, validation_data.read_dugway_data, radiation_units, None),
+        Source("bllast", validation_data.bllast_file, validation_data.read_bllast_data, radiation_units, None),
+    ]
+    for site in datasets.sites.values():
+        sources.extend([
+            Source(site.name + "_radiation", site.radiation_file,
+                   lambda site=site: murray_data_loader.parse_radiation_data(site),
+                   {"time": "local time", "radiation": "W/m^2"}, site.location.timezone),
+            Source(site.name + "_weather", site.weather_file,
+                   lambda site=site: murray_data_loader.parse_weather_data(site),
+                   {"time": "local time", "windspeed": "m/s", "temp": "C", "latent_heat": "W/m^2",
+                    "sensible_heat": "W/m^2", "pressure": "mb"}, site.date),
+        ])
+    return {source.name: source for source in sources}
+
+
+def ingest(source, force=False):
+    """
+    Parses a raw file into the columnar store under data/interim, unless it's already there and current. The
+    loaders then read the store instead of the raw file.
+
+    :type source: Source
+    :param force: rewrite the store even if it's current
+    :type force: bool
+    :return: whether the store was written
+    :rtype: bool
+    """
+    if not force and columnar_store.open_columns(source.name, source.path, source.parameters) is not None:
+        return False
+    columnar_store.write_store(source.name, source.parse(), source.path, source.units, source.parameters)
+    return True
+
+
+def main():
+    sources = get_sources()
+    parser = argparse.ArgumentParser(description="Convert the raw data files into memory-mapped columns.")
+    parser.add_argument("--sources", nargs="+", choices=list(sources), default=list(sources))
+    parser.add_argument("--force", action="store_true", help="rewrite stores that are already current")
+    args = parser.parse_args()
+
+    for name in args.sources:
+        start = time.perf_counter()
+        written = ingest(sources[name], args.force)
+        print("{}: {} in {:.2f}s".format(name, "ingested" if written else "up to date", time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
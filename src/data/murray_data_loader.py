@@ -1,21 +1,38 @@
-import pandas as pd
+import json
+import os
+
 import numpy as np
-import dateutil
+import pandas as pd
 
+import data.columnar_store as columnar_store
+import data.datasets as datasets
+import data.resample as resample
 from data.util import get_project_root
+import util.instrumentation as instrumentation
+from util.time_util import to_utc_datetime64
+
+# The loaders read the layouts described by data.datasets.Site, and default to the Murray site
+albedo = datasets.murray.albedo
 
-albedo = .18
+# Part of every cache signature, bump it when the parsing below changes
+loader_version = 3
+cache_dir = get_project_root() / "data/interim/loader_cache"
+# The radiation is sampled every 15 minutes and the weather every 30, so this takes the radiation at the weather times
+default_alignment = {"method": "asof", "tolerance": "0s"}
+default_chunk_rows = 2**16
+_memory_cache = dict()
 
 
-def get_radiation_data():
+def get_radiation_data(site=datasets.murray):
     """
 
-    :return: NumPy array of (intensity W/m^2, date_time) in (float, np.datetime64)
-    :rtype: np.ndarray
+    :return: (times as UTC np.datetime64, net shortwave W/m^2 as float)
+    :rtype: (np.array, np.array)
     """
-    data = pd.read_csv(get_project_root() / "data/raw/murray_solar.csv", header=6, skiprows=[7],
-                       parse_dates=["Date_Time"])
-    return (data["Date_Time"].to_numpy(), data["solar_radiation_set_1"].to_numpy()*(1-albedo))
+    instrumentation.count("loader.get_radiation_data")
+    data = load_source(site.name + "_radiation", site.radiation_file, lambda: parse_radiation_data(site),
+                       site.location.timezone)
+    return to_utc_datetime64(data["time"]), data["radiation"].to_numpy()*(1-site.albedo)
 
 
 def get_surface_data():
@@ -23,21 +40,242 @@ def get_surface_data():
     return data
 
 
-def get_weather_data():
-    date_parser = lambda time: dateutil.parser.parse("2005-08-20 " + time + ":00 MDT")
-    data = pd.read_csv(get_project_root() / "data/processed/murray_weather.txt", sep="\t", parse_dates=["time"],
-                       date_parser=date_parser)
+@instrumentation.timed("load")
+def get_weather_data(site=datasets.murray):
+    instrumentation.count("loader.get_weather_data")
+    return load_source(site.name + "_weather", site.weather_file, lambda: parse_weather_data(site),
+                       site.date).copy()
+
+
+@instrumentation.timed("load")
+def get_energy_balance_data(alignment=None, site=datasets.murray):
+    """
+    A site's observations with the radiation data aligned to the weather times. Parsed files are cached in memory
+    and under data/interim, so repeat calls only pay for the alignment and a copy.
+
+    :param alignment: keyword arguments for data.resample.align, e.g. {"method": "mean", "interval": "30min"}.
+        Defaults to default_alignment.
+    :type alignment: dict
+    :type site: data.datasets.Site
+    :return: a new dataframe each call, free for the caller to modify
+    :rtype: pd.DataFrame
+    """
+    instrumentation.count("loader.get_energy_balance_data")
+    weather = load_source(site.name + "_weather", site.weather_file, lambda: parse_weather_data(site), site.date)
+    radiation_times, radiation = get_radiation_data(site)
+    return get_energy_balance_frame(weather, radiation_times, radiation, alignment, site.location.timezone)
+
+
+def iterate_energy_balance_data(alignment=None, site=datasets.murray, chunk_rows=default_chunk_rows,
+                                overlap="6h"):
+    """
+    Like get_energy_balance_data, but reads the files lazily and yields the frame in pieces of up to chunk_rows
+    weather records, so memory stays bounded however long the record is. Nothing is cached.
+
+    :param overlap: radiation this far either side of a piece is kept to align it, as a pandas Timedelta string. It
+        has to cover the alignment's interval or tolerance.
+    :return: generator of pd.DataFrame, in time order
+    """
+    instrumentation.count("loader.iterate_energy_balance_data")
+    overlap = pd.Timedelta(overlap).to_timedelta64()
+    radiation_chunks = iterate_radiation_data(site, chunk_rows)
+    radiation_times = np.array([], dtype="datetime64[ns]")
+    radiation = np.array([], dtype=float)
+    radiation_left = True
+    for weather in iterate_weather_data(site, chunk_rows):
+        if len(weather) == 0:
+            continue
+        first, last = to_utc_datetime64(localize(weather["time"], site.location.timezone))[[0, -1]]
+        while radiation_left and (len(radiation_times) == 0 or radiation_times[-1] < last + overlap):
+            chunk = next(radiation_chunks, None)
+            if chunk is None:
+                radiation_left = False
+            else:
+                radiation_times = np.concatenate([radiation_times, chunk[0]])
+                radiation = np.concatenate([radiation, chunk[1]])
+        keep = radiation_times >= first - overlap
+        yield get_energy_balance_frame(weather, radiation_times[keep], radiation[keep], alignment,
+                                       site.location.timezone)
+        keep = radiation_times >= last - overlap
+        radiation_times, radiation = radiation_times[keep], radiation[keep]
+
+
+def get_energy_balance_frame(weather, radiation_times, radiation, alignment=None, timezone=None):
+    """
+    :param radiation_times: UTC times of the radiation, as from get_radiation_data
+    :param timezone: the site's, to compare the weather's local times to radiation_times in; None if the weather
+        times are UTC too
+    """
+    data = weather[["time", "pressure", "temp", "sensible_heat", "latent_heat"]].copy()
+    aligned = resample.align(radiation_times, radiation, localize(data["time"], timezone),
+                             **(alignment or default_alignment))
+    data["net_radiation"] = aligned
+    data["net_solar"] = aligned
     return data
 
 
-def get_energy_balance_data():
-    data = get_weather_data()
-    data = data[["time", "pressure", "temp", "sensible_heat", "latent_heat"]]
-    radiation_data = get_radiation_data()[1]
-    #This is hacky, would be easier to do a join if it breaks.
-    radiation_on_half_hours = [x for index, x in enumerate(radiation_data) if index % 2 == 0][:-1]
-    data["net_radiation"] = radiation_on_half_hours
-    data["net_solar"] = radiation_on_half_hours
+def parse_radiation_data(site):
+    return next(iterate_radiation_frames(site, chunk_rows=None))
+
+
+def iterate_radiation_data(site, chunk_rows=default_chunk_rows):
+    for data in iterate_radiation_frames(site, chunk_rows):
+        yield to_utc_datetime64(data["time"]), data["radiation"].to_numpy()*(1-site.albedo)
+
+
+def iterate_radiation_frames(site, chunk_rows):
+    reader = pd.read_csv(get_project_root() / site.radiation_file, header=6, skiprows=[7],
+                         usecols=["Date_Time", site.radiation_column], chunksize=chunk_rows)
+    for data in ([reader] if chunk_rows is None else reader):
+        # Times are like "08/20/2005 00:00 MDT". The zone abbreviation tells the two runs of the hour the clocks go
+        # back apart, so the times stay in order.
+        local_times = data["Date_Time"].str.rsplit(" ", n=1)
+        times = pd.to_datetime(local_times.str[0], format="%m/%d/%Y %H:%M")
+        daylight_saving = local_times.str[1].str.endswith("DT").to_numpy()
+        yield pd.DataFrame({"time": times.dt.tz_localize(site.location.timezone, ambiguous=daylight_saving),
+                            "radiation": data[site.radiation_column].to_numpy(dtype=float)})
+
+
+def localize(times, timezone):
+    """
+    Local times of a site, such as the weather's, made timezone-aware, with repeated times in the hour the clocks go
+    back taken in order. Times are returned as they are without a timezone.
+
+    :type times: pd.Series
+    """
+    if timezone is None:
+        return times
+    return times.dt.tz_localize(timezone, ambiguous="infer")
+
+
+def parse_weather_data(site):
+    return next(iterate_weather_data(site, chunk_rows=None))
+
+
+def iterate_weather_data(site, chunk_rows=default_chunk_rows):
+    reader = pd.read_csv(get_project_root() / site.weather_file, sep="\t", chunksize=chunk_rows)
+    previous = None  # (time of day, day number) of the last record, to carry days over between chunks
+    for data in ([reader] if chunk_rows is None else reader):
+        if site.date is None:
+            data["time"] = pd.to_datetime(data["time"])
+        else:
+            data["time"], previous = get_weather_times(site.date, data["time"], previous)
+        yield data
+
+
+def get_weather_times(date, times_of_day, previous=None):
+    """
+    Timestamps for times of day like "13:30" that start on date and run on into later days.
+
+    :param previous: (time of day, day number) of the record before these, from an earlier call
+    :return: (timestamps, (time of day, day number) of the last record)
+    :rtype: (pd.Series, (np.timedelta64, int))
+    """
+    time_of_day = pd.to_timedelta(times_of_day + ":00").to_numpy()
+    last_time_of_day, last_day = previous if previous is not None else (time_of_day[:1], 0)
+    new_day = np.diff(np.concatenate([np.reshape(last_time_of_day, -1), time_of_day])) < np.timedelta64(0)
+    day = last_day + np.cumsum(new_day)
+    times = np.datetime64(date, "ns") + day * np.timedelta64(1, "D") + time_of_day
+    if len(times) == 0:
+        return pd.Series(times, index=times_of_day.index), previous
+    return pd.Series(times, index=times_of_day.index), (time_of_day[-1], day[-1])
+
+
+def load_source(name, source, parse, parameters=None):
+    """
+    A raw file parsed into a frame, memoized in this process. While data.ingest's columnar store of the file is
+    current, the frame is read from its memory-mapped columns; otherwise the file is parsed, and the result cached in
+    an .npz file instead, see load_cached.
+
+    :param name: name of the store and of the cache entry
+    :param source: path of the raw file relative to the project root
+    :param parse: function that parses the file into a dataframe
+    :param parameters: anything else the parsing depends on, as JSON-serializable values
+    :return: a frame shared between callers, so callers that hand it out should copy it
+    :rtype: pd.DataFrame
+    """
+    if columnar_store.is_current(name, source, parameters):
+        instrumentation.count("loader.stores_read")
+        return load_cached(name, [source], lambda: columnar_store.read_frame(name), parameters, use_disk=False)
+    return load_cached(name, [source], parse, parameters)
+
+
+def load_cached(name, sources, read, parameters=None, use_disk=True):
+    """
+    Returns read() for the given source files, memoized in this process and in an .npz file under data/interim. Both
+    are invalidated when a source's modification time or size changes. The returned frame is shared, so callers that
+    hand it out should copy it.
+
+    :param name: cache entry name
+    :param sources: paths relative to the project root that read() depends on
+    :param read: function that parses the sources into a dataframe
+    :param parameters: anything else the parsing depends on, as JSON-serializable values
+    :param use_disk: whether to read from and write to the .npz file, or only memoize in this process
+    :type use_disk: bool
+    :rtype: pd.DataFrame
+    """
+    signature = get_signature(sources, parameters)
+    cached = _memory_cache.get(name)
+    if cached is not None and cached[0] == signature:
+        instrumentation.count("loader.memory_cache_hits")
+        return cached[1]
+
+    path = cache_dir / (name + ".npz")
+    data = read_cache_file(path, signature) if use_disk else None
+    if data is None:
+        instrumentation.count("loader.files_parsed" if use_disk else "loader.files_read")
+        data = read()
+        if use_disk:
+            write_cache_file(path, signature, data)
+    else:
+        instrumentation.count("loader.disk_cache_hits")
+    _memory_cache[name] = (signature, data)
     return data
 
 
+def get_signature(sources, parameters=None):
+    files = []
+    for source in sources:
+        status = os.stat(get_project_root() / source)
+        files.append([source, status.st_mtime_ns, status.st_size])
+    return json.dumps({"version": loader_version, "files": files, "parameters": parameters})
+
+
+def read_cache_file(path, signature):
+    if not path.exists():
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as stored:
+            if str(stored["signature"]) != signature:
+                return None
+            data = pd.DataFrame({str(column): stored["column_" + str(index)]
+                                 for index, column in enumerate(stored["columns"])})
+            for column, timezone in zip(data.columns, stored["timezones"]):
+                if timezone:
+                    data[column] = data[column].dt.tz_localize("UTC").dt.tz_convert(str(timezone))
+            return data
+    except (OSError, ValueError, KeyError):  # unreadable or from an older layout, rebuild it
+        return None
+
+
+def write_cache_file(path, signature, data):
+    # Timezone-aware times are stored as UTC np.datetime64 with their timezone, as in data.columnar_store
+    arrays, timezones = dict(), []
+    for index, column in enumerate(data.columns):
+        values = data[column]
+        timezones.append(str(values.dt.tz) if isinstance(values.dtype, pd.DatetimeTZDtype) else "")
+        if timezones[-1]:
+            values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+        arrays["column_" + str(index)] = values.to_numpy()
+    if any(array.dtype == object for array in arrays.values()):
+        return  # only plain numeric and datetime columns are stored on disk
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_suffix(".{}.tmp".format(os.getpid()))
+    with open(temporary_path, "wb") as file:
+        np.savez(file, signature=np.array(signature), columns=np.array(list(data.columns)),
+                 timezones=np.array(timezones), **arrays)
+    os.replace(temporary_path, path)
+
+
+def clear_memory_cache():
+    _memory_cache.clear()
@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+
+import util.exceptions as ex
+from util.time_util import to_utc_datetime64
+
+methods = ("asof", "mean", "integral")
+directions = ("backward", "forward", "nearest")
+labels = ("start", "end")
+
+
+def align(source_times, values, target_times, method="asof", interval=None, tolerance=None, **options):
+    """
+    Puts a series sampled at source_times onto target_times, e.g. 1 minute radiation onto 30 minute flux tower
+    records.
+
+    :param source_times: sorted times of the samples
+    :param values: np.array with one row per source time; extra columns are aligned together
+    :param target_times: times to align to; naive times are compared to naive source times as they are, aware times
+        are compared in UTC
+    :param method: "asof" (sample at or near each target time, see asof), "mean" (time-weighted mean over the block
+        each target time labels, see block_mean) or "integral" (see block_integral)
+    :type method: str
+    :param interval: block length for "mean" and "integral", as a pandas Timedelta string like "30min". Defaults to
+        the median spacing of target_times.
+    :param tolerance: for "asof", the furthest a sample can be from its target time, e.g. "0s" for exact matches
+    :param options: passed on to the method, e.g. label, direction, min_coverage or max_gap
+    :return: np.array with one row per target time, NaN where there is no data
+    :rtype: np.array
+    """
+    if method == "asof":
+        return asof(source_times, values, target_times, tolerance=tolerance, **options)
+    elif method == "mean":
+        return block_mean(source_times, values, target_times, interval=interval, **options)
+    elif method == "integral":
+        return block_integral(source_times, values, target_times, interval=interval, **options)
+    raise ex.InvalidArgumentError("Unrecognized alignment method: " + str(method))
+
+
+def asof(source_times, values, target_times, tolerance=None, direction="nearest"):
+    """
+    Takes, for each target time, the sample at that time or the nearest one in the given direction.
+
+    :param tolerance: furthest a sample can be from its target time, as a pandas Timedelta string; None for no limit
+    :param direction: "backward" (last sample at or before), "forward" (first sample at or after) or "nearest"
+    :type direction: str
+    :return: np.array of float with one row per target time, NaN where no sample is close enough
+    :rtype: np.array
+    """
+    if direction not in directions:
+        raise ex.InvalidArgumentError("Unrecognized direction: " + str(direction))
+    source, target = get_nanoseconds(source_times, target_times)
+    values = np.asarray(values, dtype=float)
+    if len(source) == 0:
+        return np.full((len(target),) + values.shape[1:], np.nan)
+
+    before = np.searchsorted(source, target, side="right") - 1
+    after = np.searchsorted(source, target, side="left")
+    has_before = before >= 0
+    has_after = after < len(source)
+    before = np.clip(before, 0, len(source) - 1)
+    after = np.clip(after, 0, len(source) - 1)
+    distance_before = np.where(has_before, target - source[before], np.inf)
+    distance_after = np.where(has_after, source[after] - target, np.inf)
+
+    if direction == "backward":
+        index, distance = before, distance_before
+    elif direction == "forward":
+        index, distance = after, distance_after
+    else:
+        use_after = distance_after < distance_before
+        index = np.where(use_after, after, before)
+        distance = np.where(use_after, distance_after, distance_before)
+
+    found = np.isfinite(distance)
+    if tolerance is not None:
+        found &= distance <= get_nanoseconds_in(tolerance)
+    aligned = values[index]
+    aligned[~found] = np.nan
+    return aligned
+
+
+def block_mean(source_times, values, target_times, interval=None, label="end", min_coverage=.5, max_gap=None):
+    """
+    Time-weighted mean of the samples over the block each target time labels. The series is taken to be linear
+    between samples, so irregular and partially missing sampling is weighted by the time each sample covers, and the
+    edges of a block are interpolated.
+
+    :param interval: block length as a pandas Timedelta string; defaults to the median spacing of target_times
+    :param label: "end" if a target time t labels the block (t - interval, t], as for most flux towers, "start" if it
+        labels [t, t + interval)
+    :type label: str
+    :param min_coverage: fraction of the block that has to be covered by data, otherwise the block is NaN
+    :type min_coverage: float
+    :param max_gap: samples further apart than this (a pandas Timedelta string) aren't interpolated between
+    :return: np.array of float with one row per target time
+    :rtype: np.array
+    """
+    integral, covered, interval_seconds = integrate_blocks(source_times, values, target_times, interval, label,
+                                                           max_gap)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = integral / covered
+    mean[~(covered >= np.maximum(min_coverage * interval_seconds, np.finfo(float).tiny))] = np.nan
+    return mean
+
+
+def block_integral(source_times, values, target_times, interval=None, label="end", min_coverage=.5, max_gap=None):
+    """
+    Integral of the samples over time in seconds across the block each target time labels, e.g. J/m^2 from W/m^2.
+    Missing parts of a block count as zero. Arguments are as for block_mean.
+
+    :return: np.array of float with one row per target time
+    :rtype: np.array
+    """
+    integral, covered, interval_seconds = integrate_blocks(source_times, values, target_times, interval, label,
+                                                           max_gap)
+    integral[~(covered >= np.maximum(min_coverage * interval_seconds, np.finfo(float).tiny))] = np.nan
+    return integral
+
+
+def integrate_blocks(source_times, values, target_times, interval, label, max_gap):
+    if label not in labels:
+        raise ex.InvalidArgumentError("Unrecognized block label: " + str(label))
+    source, target = get_nanoseconds(source_times, target_times)
+    values = np.asarray(values, dtype=float)
+    if interval is None:
+        interval = np.median(np.diff(target)) if len(target) > 1 else 0
+    else:
+        interval = get_nanoseconds_in(interval)
+    if interval <= 0:
+        raise ex.InvalidArgumentError("The block interval has to be positive")
+
+    # Seconds from the first sample keep full float precision over multi-year records
+    origin = source[0] if len(source) else 0
+    seconds = (source - origin) / 1e9
+    block_ends = (target - origin) / 1e9
+    block_starts = block_ends - interval / 1e9
+    if label == "start":
+        block_starts, block_ends = block_ends, block_ends + interval / 1e9
+    max_gap_seconds = None if max_gap is None else get_nanoseconds_in(max_gap) / 1e9
+
+    start_integral, start_covered = get_cumulative_integral(seconds, values, block_starts, max_gap_seconds)
+    end_integral, end_covered = get_cumulative_integral(seconds, values, block_ends, max_gap_seconds)
+    return end_integral - start_integral, end_covered - start_covered, interval / 1e9
+
+
+def get_cumulative_integral(seconds, values, at, max_gap_seconds):
+    """
+    Integral and covered time of the piecewise linear series from its first sample up to each of the times in at.
+    Segments with a NaN end or longer than max_gap_seconds are skipped.
+    """
+    shape = (len(at),) + values.shape[1:]
+    if len(seconds) < 2:
+        return np.zeros(shape), np.zeros(shape)
+    values = values.reshape(len(seconds), -1)
+    steps = np.diff(seconds)
+    valid = np.isfinite(values[:-1]) & np.isfinite(values[1:])
+    if max_gap_seconds is not None:
+        valid &= (steps <= max_gap_seconds)[:, np.newaxis]
+    filled = np.where(np.isfinite(values), values, 0)
+    areas = np.where(valid, (filled[:-1] + filled[1:]) / 2 * steps[:, np.newaxis], 0)
+    covered = np.where(valid, steps[:, np.newaxis], 0)
+    zeros = np.zeros((1, values.shape[1]))
+    cumulative_areas = np.concatenate([zeros, np.cumsum(areas, axis=0)])
+    cumulative_covered = np.concatenate([zeros, np.cumsum(covered, axis=0)])
+
+    # The part of the segment each time falls in, interpolating the value at that time
+    at = np.clip(at, seconds[0], seconds[-1])
+    segment = np.clip(np.searchsorted(seconds, at, side="right") - 1, 0, len(steps) - 1)
+    partial = (at - seconds[segment])[:, np.newaxis]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.where(steps[segment] > 0, partial[:, 0] / steps[segment], 0)[:, np.newaxis]
+    start_value = filled[segment]
+    value_at = start_value + (filled[segment + 1] - start_value) * fraction
+    segment_valid = valid[segment]
+    integral = cumulative_areas[segment] + np.where(segment_valid, partial * (start_value + value_at) / 2, 0)
+    covered_at = cumulative_covered[segment] + np.where(segment_valid, partial, 0)
+    return integral.reshape(shape), covered_at.reshape(shape)
+
+
+def get_nanoseconds(source_times, target_times):
+    source = to_utc_datetime64(source_times).astype(np.int64)
+    target = to_utc_datetime64(target_times).astype(np.int64)
+    if np.any(np.diff(source) < 0):
+        raise ex.InvalidArgumentError("Source times have to be sorted")
+    return source, target
+
+
+def get_nanoseconds_in(duration):
+    return pd.Timedelta(duration).value
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+import data.columnar_store as columnar_store
+from data.util import get_project_root
+from util.location_util import Location
+
+# Sites of the radiation validation data sets, see data/raw/README.md
+dugway = Location(40.142, 113.267, "US/Mountain")
+lannemezan = Location(43 + 6/60 + 32.9/3600, -21/60 - 32.1/3600, "Europe/Paris")  # longitude is positive west
+
+dugway_file = "data/raw/dugway.dat"
+bllast_file = "data/raw/BLLAST_IOP5.mat"
+
+
+def get_dugway_data():
+    """
+    SLTEST solar radiation at Dugway, July 19, 2001. Times are local (Mountain Daylight Time).
+
+    :return: columns "time" (timezone-aware), "Rs down", "Rs up" and "L down" in W/m^2
+    :rtype: pd.DataFrame
+    """
+    stored = columnar_store.read_frame("dugway", dugway_file)
+    return stored if stored is not None else read_dugway_data()
+
+
+def read_dugway_data():
+    data = pd.read_csv(get_project_root() / dugway_file, sep="\t", header=4)
+    data["time"] = pd.to_datetime(pd.DataFrame({
+        "year": data["Year"] + 2000, "month": data["Month"], "day": data["Day"],
+        "hour": data["Hour"], "minute": data["Minute"], "second": data["Second"]})).dt.tz_localize(dugway.timezone)
+    return data[["time", "Rs down", "Rs up", "L down"]]
+
+
+def get_bllast_data():
+    """
+    BLLAST IOP 5 radiation above a larch forest near Lannemezan, June 25, 2011, every second.
+
+    :return: columns "time" (timezone-aware), "Rs down", "Rs up", "L down" and "L up" in W/m^2
+    :rtype: pd.DataFrame
+    """
+    stored = columnar_store.read_frame("bllast", bllast_file)
+    return stored if stored is not None else read_bllast_data()
+
+
+def read_bllast_data():
+    import scipy.io
+    raw = scipy.io.loadmat(str(get_project_root() / bllast_file))
+    # Times are UTC, in days since the start of 2011 counting Jan 1 as day 1
+    days = raw["date"].ravel()
+    time = pd.Timestamp("2010-12-31", tz="UTC") + pd.to_timedelta(np.round(days * 86400), unit="s")
+    return pd.DataFrame({
+        "time": time.tz_convert(lannemezan.timezone),
+        "Rs down": raw["shortdownward"].ravel(),
+        "Rs up": raw["shortupward"].ravel(),
+        "L down": raw["rldownwardco"].ravel(),
+        "L up": raw["rlupwardco"].ravel(),
+    })
@@ -1,6 +1,8 @@
 import yaml
 import pandas as pd
+import data.datasets as datasets
 from data.util import get_project_root
+from util.exceptions import ConfigValueNotRecognized
 
 
 class Config:
@@ -10,16 +12,22 @@ class Config:
         self.experiment_name = None
         self.penman_monteith_params = None
         self.longwave_model = None
+        self.radiation_alignment = None
+        self.site = datasets.murray
         self.surface_data = None
         self.output_dir = None
         self.experiment = None
 
-    def load(self):
-        with open(get_project_root() / "src/experiments/config/config.yaml") as config:
-            self.config = yaml.load(config, Loader=yaml.FullLoader)
-        conf = self.config
+    def load(self, experiment_name=None):
+        """
+        :param experiment_name: experiment to load, matched against the experiment keys as text (so "5.2" finds
+            5.2); defaults to active_experiment
+        """
+        conf = self.read().config
 
         self.experiment_name = conf["active_experiment"]
+        if experiment_name is not None:
+            self.experiment_name = self.find_experiment(experiment_name)
         self.set_output_dir(get_project_root() / conf["output_root_dir"] / str(self.experiment_name))
 
 
@@ -30,10 +38,33 @@ class Config:
         if "longwave_model" in self.experiment:
             self.longwave_model = self.experiment["longwave_model"]
 
-        if "surface_materials_tuning_params" not in self.experiment:
+        if "site" in self.experiment:
+            self.site = datasets.get_site(self.experiment["site"])
+
+        if "radiation_alignment" in self.experiment:
+            self.radiation_alignment = self.experiment["radiation_alignment"]
+
+        if "surface_materials_tuning_params" not in self.experiment and "compare_mappings" not in self.experiment:
             self.load_surface_data(self.experiment["surface_materials_mapping"])
         return self
 
+    def read(self):
+        """
+        Reads config.yaml without loading an experiment.
+        """
+        with open(get_project_root() / "src/experiments/config/config.yaml") as config:
+            self.config = yaml.load(config, Loader=yaml.FullLoader)
+        return self
+
+    def find_experiment(self, experiment_name):
+        for name in self.config["experiments"]:
+            if str(name) == str(experiment_name):
+                return name
+        raise ConfigValueNotRecognized("Unrecognized experiment: " + str(experiment_name))
+
+    def get_experiment_names(self):
+        return list(self.config["experiments"])
+
     def set_output_dir(self, output_dir):
         self.output_dir = output_dir
         self.output_dir.mkdir(parents=True, exist_ok=True)
@@ -48,15 +79,34 @@ class Config:
             self.penman_monteith_params["tuning_params"] = experiment["tuning_params"]
 
     def load_surface_data(self, mapping_name):
+        self.surface_data = self.get_surface_data([mapping_name]).drop(columns="Mapping")
+
+    def get_surface_data(self, mapping_names=None):
+        """
+        The materials of several mappings of surface_materials, stacked, with a "Mapping" column naming each row's
+        mapping.
+
+        :param mapping_names: names of mappings in surface_materials; defaults to all of them
+        :rtype: pd.DataFrame
+        """
         sm_conf = self.config["surface_materials"]
         coverage = pd.read_csv(get_project_root() / sm_conf["coverage_data"])
         materials = pd.read_csv(get_project_root() / sm_conf["materials_data"])
-        mapping = sm_conf["mappings"][mapping_name]
-
-        surface_materials = pd.DataFrame(columns=["Surface Type", "Material"])
-        for surface, material in mapping.items():
-            surface_materials.loc[len(surface_materials.index)] = [surface, material]
+        if mapping_names is None:
+            mapping_names = self.get_mapping_names()
+        surface_materials = pd.DataFrame(
+            [(name, surface, material) for name in mapping_names
+             for surface, material in self.get_mapping(name).items()],
+            columns=["Mapping", "Surface Type", "Material"])
 
         # This is an inner join - if a type isn't mapped in the config, it's skipped
-        joined = coverage.merge(surface_materials, on="Surface Type").merge(materials, on="Material")
-        self.surface_data = joined
+        return coverage.merge(surface_materials, on="Surface Type").merge(materials, on="Material")
+
+    def get_mapping(self, mapping_name):
+        mappings = self.config["surface_materials"]["mappings"]
+        if mapping_name not in mappings:
+            raise ConfigValueNotRecognized("Unrecognized surface materials mapping: " + str(mapping_name))
+        return mappings[mapping_name]
+
+    def get_mapping_names(self):
+        return list(self.config["surface_materials"]["mappings"])
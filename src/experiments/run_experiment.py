@@ -1,7 +1,21 @@
+import argparse
+import contextlib
+import fnmatch
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
 from experiments.config.config import Config
-from model import lumps
+from model import ensemble, lumps, surface_mappings
 from model.storage.tuning.learn_materials_coefficients import get_best_model_output
 from model.penman_monteith.tuning.learn_parameters import calculate_normalized_squared_error
+from data.util import get_project_root
+import data.datasets as datasets
+import data.murray_data_loader as data_loader
+import util.instrumentation as instrumentation
 
 
 def evaluate_model(model_output):
@@ -18,9 +32,21 @@ def write_anse(error, file):
     file.close()
 
 
-def main():
-    config = Config().load()
-    if "surface_materials_tuning_params" not in config.experiment:
+def run(config):
+    """
+    Runs the loaded experiment, writing its outputs to config.output_dir.
+
+    :return: average normalized squared error
+    :rtype: float
+    """
+    if "compare_mappings" in config.experiment:
+        return compare_mappings(config)
+    if "ensemble_params" in config.experiment:
+        data = ensemble.get_ensemble_output(config)
+        data.to_csv(config.output_dir / "model_output.csv")
+        lumps.make_lumps_chart(config, data)
+        ensemble.make_ensemble_chart(config, data)
+    elif "surface_materials_tuning_params" not in config.experiment:
         data = lumps.get_model_output(config)
         data.to_csv(config.output_dir / "model_output.csv")
         lumps.make_hysteresis_charts(config, data)
@@ -28,7 +54,150 @@ def main():
     else:
         data = get_best_model_output(config)
         lumps.make_lumps_chart(config, data)
-    write_anse(evaluate_model(data), config.output_dir / "anse")
+    error = evaluate_model(data)
+    write_anse(error, config.output_dir / "anse")
+    return error
+
+
+def compare_mappings(config):
+    """
+    Runs the model for the surface materials mappings of compare_mappings ("all" or a list of names) in one pass, see
+    model.surface_mappings.
+
+    :return: the lowest average normalized squared error of the mappings
+    :rtype: float
+    """
+    mapping_names = config.experiment["compare_mappings"]
+    comparison = surface_mappings.compare_mappings(config, None if mapping_names == "all" else mapping_names)
+    print(comparison.table.to_string())
+    comparison.table.to_csv(config.output_dir / "comparison.csv")
+    for name in ["storage", "sensible", "latent"]:
+        getattr(comparison, name).to_csv(config.output_dir / "{}.csv".format(name))
+    error = comparison.table["anse"].min()
+    write_anse(error, config.output_dir / "anse")
+    return error
+
+
+def run_named(experiment_name):
+    """
+    Loads and runs one experiment, with what it prints going to log.txt in its output directory, and when
+    instrumentation is on, its trace to trace.json. An experiment that fails to load or run gets a row with its
+    error, and the traceback goes to its log.txt if it got as far as having an output directory.
+
+    :return: a row of the batch summary
+    :rtype: dict
+    """
+    start = time.perf_counter()
+    instrumentation.reset()
+    config = Config()
+    output_dir = None  # materials tuning moves config.output_dir to a subdirectory, so keep the experiment's own
+    error, failure = float("nan"), None
+    try:
+        config.load(experiment_name)
+        output_dir = config.output_dir
+        with open(output_dir / "log.txt", "w") as log, contextlib.redirect_stdout(log):
+            error = run(config)
+    except Exception as exception:  # one failing experiment shouldn't stop the batch
+        failure = "{}: {}".format(type(exception).__name__, exception)
+        output_dir = output_dir or config.output_dir
+        if output_dir is not None:
+            with open(output_dir / "log.txt", "a") as log:
+                log.write(traceback.format_exc())
+    if instrumentation.is_enabled() and output_dir is not None:
+        instrumentation.write_trace(output_dir / "trace.json")
+    return {"experiment": str(experiment_name), "anse": error, "seconds": time.perf_counter() - start,
+            "failure": failure}
+
+
+def select_experiments(patterns, config=None):
+    """
+    :param patterns: experiment names, shell-style patterns like "6.*", or "all"
+    :return: matching experiment names as text, in config.yaml order
+    :rtype: list
+    """
+    names = [str(name) for name in (config or Config().read()).get_experiment_names()]
+    return [name for name in names if any(pattern == "all" or fnmatch.fnmatchcase(name, pattern)
+                                          for pattern in patterns)]
+
+
+def run_batch(experiment_names, processes=None):
+    """
+    Runs experiments across a process pool and summarizes them. The observations are loaded first, once for each site
+    the experiments use, so the workers share their columnar store or, without one, the loader's on-disk cache rather
+    than each parsing the raw files.
+
+    :param processes: number of worker processes; None uses every core, 1 runs in this process
+    :return: "anse", "seconds" and "failure" of each experiment, in the given order
+    :rtype: pd.DataFrame
+    """
+    config = Config().read()
+    experiments = [config.config["experiments"][config.find_experiment(name)] for name in experiment_names]
+    for site_name in {experiment.get("site", datasets.murray.name) for experiment in experiments}:
+        if site_name in datasets.sites:  # an unknown site fails its experiments, not the batch
+            data_loader.get_energy_balance_data(site=datasets.get_site(site_name))
+
+    if processes == 1:
+        rows = []
+        for name in experiment_names:
+            rows.append(run_named(name))
+            print_row(rows[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as executor:
+            futures = [executor.submit(run_named, name) for name in experiment_names]
+            for future in as_completed(futures):
+                print_row(future.result())
+            rows = [future.result() for future in futures]
+    return pd.DataFrame(rows, columns=["experiment", "anse", "seconds", "failure"]).set_index("experiment")
+
+
+def print_row(row):
+    if row["failure"] is None:
+        print("{experiment}: ANSE {anse:.4f} in {seconds:.1f}s".format(**row))
+    else:
+        print("{experiment}: failed in {seconds:.1f}s, {failure}".format(**row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run experiments from config.yaml.")
+    parser.add_argument("experiments", nargs="*",
+                        help='experiment names, patterns like "6.*", or "all"; defaults to active_experiment')
+    parser.add_argument("--processes", type=int, default=None, help="worker processes; defaults to every core")
+    parser.add_argument("--trace", action="store_true",
+                        help="time the model's stages and write them to trace.json in each experiment's output "
+                             "directory; setting the {} environment variable does the same".format(
+                            instrumentation.trace_variable))
+    parser.add_argument("--observations", action="store_true",
+                        help="only chart the Murray observations, to observations.png in the results directory")
+    args = parser.parse_args()
+    if args.trace:
+        instrumentation.enable()
+        os.environ[instrumentation.trace_variable] = "1"  # for the worker processes
+
+    if args.observations:
+        output = get_project_root() / Config().read().config["output_root_dir"] / "observations.png"
+        output.parent.mkdir(parents=True, exist_ok=True)
+        lumps.make_pure_observations_chart(output)
+        print("Wrote " + str(output))
+        return
+
+    if not args.experiments:
+        config = Config().load()
+        output_dir = config.output_dir
+        run(config)
+        if instrumentation.is_enabled():
+            instrumentation.write_trace(output_dir / "trace.json")
+            print(instrumentation.format_summary())
+        return
+
+    config = Config().read()
+    experiment_names = select_experiments(args.experiments, config)
+    if not experiment_names:
+        parser.error("no experiments match " + ", ".join(args.experiments))
+    summary = run_batch(experiment_names, args.processes)
+    print(summary.to_string())
+    output = get_project_root() / config.config["output_root_dir"] / "summary.csv"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    summary.to_csv(output)
 
 
 if __name__ == "__main__":
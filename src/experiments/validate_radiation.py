@@ -0,0 +1,88 @@
+import argparse
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import data.validation_data_loader as validation_data
+import model.radiation.solar_radiation_calculator as rad
+from data.util import get_project_root
+
+datasets = {
+    "dugway": (validation_data.get_dugway_data, validation_data.dugway),
+    "bllast": (validation_data.get_bllast_data, validation_data.lannemezan),
+}
+
+
+def validate(dataset_name, repeats=3):
+    """
+    Runs the radiation model at every observation time of a validation data set and compares it to the observed
+    incoming shortwave radiation.
+
+    :param dataset_name: key of datasets
+    :type dataset_name: str
+    :param repeats: the throughput is the best of this many runs
+    :type repeats: int
+    :return: error statistics ("rmse", "mae", "bias", "r", and the same for daytime only), "timestamps_per_second"
+        and "peak_memory_mb" of the model run
+    :rtype: dict
+    """
+    get_data, location = datasets[dataset_name]
+    data = get_data()
+    times = data["time"]
+    observed = data["Rs down"].to_numpy()
+
+    def run_model():
+        return rad.get_radiation_record(times, location, fields=("elevation_angle", "flux"))
+
+    best_seconds = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run_model()
+        best_seconds = min(best_seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        modeled = run_model()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    daytime = modeled["elevation_angle"] > 0
+    results = {"dataset": dataset_name, "timestamps": len(times)}
+    results.update(get_error_statistics(observed, modeled["flux"]))
+    results.update({"day_" + name: value
+                    for name, value in get_error_statistics(observed[daytime], modeled["flux"][daytime]).items()})
+    results["timestamps_per_second"] = len(times) / best_seconds
+    results["peak_memory_mb"] = peak_bytes / 2**20
+    return results
+
+
+def get_error_statistics(observed, modeled):
+    difference = modeled - observed
+    return {
+        "rmse": np.sqrt(np.mean(difference * difference)),
+        "mae": np.mean(np.abs(difference)),
+        "bias": np.mean(difference),
+        "r": np.corrcoef(observed, modeled)[0, 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate and benchmark the solar radiation model.")
+    parser.add_argument("--datasets", nargs="+", choices=list(datasets), default=list(datasets))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default=get_project_root() / "src/experiments/results/radiation_validation.csv")
+    args = parser.parse_args()
+
+    summary = pd.DataFrame([validate(name, args.repeats) for name in args.datasets]).set_index("dataset")
+    print(summary.round(3).to_string())
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    summary.to_csv(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import model.penman_monteith.penman_monteith as penman_monteith
+import model.storage.objective_hysteresis_model as ohm
+from model import lumps
+import util.instrumentation as instrumentation
+from util.exceptions import ConfigValueNotRecognized
+
+# Plotting modules are imported inside the chart functions, so importing the model doesn't load matplotlib
+
+# The parameters of each member. coefficients is (members, 3), the coverage-weighted (a1, a2, a3) of each member,
+# alpha and beta are (members,).
+Members = namedtuple("Members", ["coefficients", "alpha", "beta"])
+
+outputs = ["storage", "model_sensible", "model_latent"]
+default_percentiles = [5, 50, 95]
+default_memory_budget = 2**28  # bytes
+arrays_per_block = 6  # storage, Q_H and Q_E of a block, and the temporaries of computing and sorting them
+
+
+def get_ensemble_output(config):
+    """
+    Runs the experiment's ensemble: members drawn around its materials and its (tuned) alpha and beta, as described
+    by ensemble_params. Every member uses the OHM storage, whatever the experiment's storage_source.
+
+    :type config: experiments.config.config.Config
+    :return: the model output of the nominal parameters, with a column per output and percentile, e.g. storage_p5
+    :rtype: pd.DataFrame
+    """
+    params = config.experiment["ensemble_params"]
+    percentiles = params.get("percentiles", default_percentiles)
+    data = lumps.get_model_output(config)
+
+    members = sample_members(config.surface_data, config.penman_monteith_params["alpha"],
+                             config.penman_monteith_params["beta"], params, params["members"], params.get("seed"))
+    net_radiation = data["net_radiation"].to_numpy(dtype=float)
+    d_net_radiation_d_t = ohm.get_rate_of_change(net_radiation, data["time"].to_numpy())
+    bands = get_percentile_bands(members, net_radiation, d_net_radiation_d_t, data["temp"].to_numpy(dtype=float),
+                                 data["pressure"].to_numpy(dtype=float), percentiles,
+                                 params.get("memory_budget", default_memory_budget),
+                                 params.get("vapor_pressure_table", False))
+    for output in outputs:
+        for percentile, values in zip(percentiles, bands[output]):
+            data[get_band_column(output, percentile)] = values
+    return data
+
+
+def sample_members(materials, alpha, beta, distributions, members, seed=None):
+    """
+    Draws ensemble members around nominal parameters. Coverage fractions are drawn per surface type, and the
+    coefficients per material, so surfaces mapped to the same material share them within a member.
+
+    :param materials: materials dataframe, see ohm.calculate_storage_heat_flux; a "Material" column, if any, groups
+        the rows by material
+    :type materials: pd.DataFrame
+    :param distributions: the distribution of each of "fraction", "a1", "a2", "a3", "alpha" and "beta", see sample.
+        Parameters without one stay at their nominal values.
+    :type distributions: dict
+    :param members: number of members
+    :type members: int
+    :param seed: seed of the random generator, for reproducible ensembles
+    :rtype: Members
+    """
+    rng = np.random.default_rng(seed)
+    if "Material" in materials:
+        material_index = pd.factorize(materials["Material"])[0]
+    else:
+        material_index = np.arange(len(materials))
+    material_rows = np.unique(material_index, return_index=True)[1]
+
+    fractions = sample(materials["Fraction"].to_numpy(dtype=float), distributions.get("fraction"), members, rng)
+    weights = fractions/fractions.sum(axis=1, keepdims=True)  # as in ohm.get_weighted_coefficients
+    coefficients = np.stack([
+        (weights*sample(materials[column].to_numpy(dtype=float)[material_rows], distributions.get(column), members,
+                        rng)[:, material_index]).sum(axis=1)
+        for column in ["a1", "a2", "a3"]], axis=1)
+    return Members(coefficients, sample([alpha], distributions.get("alpha"), members, rng)[:, 0],
+                   sample([beta], distributions.get("beta"), members, rng)[:, 0])
+
+
+def sample(nominal, distribution, members, rng):
+    """
+    :param nominal: nominal value of each column of the sample
+    :param distribution: None for no spread, or
+        "distribution" - "normal" (the default) or "uniform"
+        "scale" - standard deviation of a normal, half-width of a uniform
+        "relative" - whether scale is a fraction of each nominal value, defaults to false
+        "bounds" - [low, high] to clip the values to, either may be null
+    :type distribution: dict
+    :type rng: np.random.Generator
+    :return: array of shape (members, len(nominal))
+    :rtype: np.array
+    """
+    nominal = np.asarray(nominal, dtype=float)
+    shape = (members, len(nominal))
+    if not distribution:
+        return np.broadcast_to(nominal, shape).copy()
+
+    scale = distribution["scale"]*(np.abs(nominal) if distribution.get("relative") else 1)
+    name = distribution.get("distribution", "normal")
+    if name == "normal":
+        values = rng.normal(nominal, scale, shape)
+    elif name == "uniform":
+        values = rng.uniform(nominal - scale, nominal + scale, shape)
+    else:
+        raise ConfigValueNotRecognized("Unrecognized distribution: " + str(name))
+
+    low, high = distribution.get("bounds") or (None, None)
+    if low is not None or high is not None:
+        values = np.clip(values, low, high)
+    return values
+
+
+def get_percentile_bands(members, net_radiation, d_net_radiation_d_t, temp, pressure,
+                         percentiles=default_percentiles, memory_budget=default_memory_budget,
+                         vapor_pressure_table=False):
+    """
+    Evaluates storage and Penman-Monteith for every member as array operations, a block of time steps at a time, so
+    the (members, block) arrays stay within memory_budget bytes, and reduces each block to percentiles across the
+    members. The percentiles are exact, as each time step's are independent of the others.
+
+    :type members: Members
+    :param net_radiation: np.array of float, Q* ordered by time (length N)
+    :param d_net_radiation_d_t: np.array of float, time rate of change co-indexed with net_radiation
+    :param temp: np.array of float, temperature (C) co-indexed with net_radiation
+    :param pressure: np.array of float, pressure (hPa) co-indexed with net_radiation
+    :param percentiles: percentiles to compute, from 0 to 100
+    :param memory_budget: bytes the member-by-time arrays may take
+    :type memory_budget: int
+    :param vapor_pressure_table: whether Penman-Monteith looks de_s/dT up in a table, see
+        penman_monteith.calc_sensible_and_latent_heat
+    :type vapor_pressure_table: bool
+    :return: array of shape (len(percentiles), N) for each of outputs
+    :rtype: dict
+    """
+    length = len(net_radiation)
+    count = len(members.alpha)
+    block = max(1, int(memory_budget)//(count*arrays_per_block*8))
+    alpha = members.alpha[:, np.newaxis]
+    beta = members.beta[:, np.newaxis]
+
+    bands = {output: np.empty((len(percentiles), length)) for output in outputs}
+    for start in range(0, length, block):
+        rows = slice(start, min(start + block, length))
+        storage = ohm.calculate_storage_heat_flux_batch(members.coefficients, net_radiation[rows],
+                                                        d_net_radiation_d_t[rows])
+        sensible, latent = penman_monteith.calc_sensible_and_latent_heat(
+            alpha, beta, net_radiation[np.newaxis, rows], storage, temp[np.newaxis, rows],
+            pressure[np.newaxis, rows], vapor_pressure_table)
+        for output, values in zip(outputs, [storage, sensible, latent]):
+            bands[output][:, rows] = np.percentile(values, percentiles, axis=0)
+    return bands
+
+
+def get_band_column(output, percentile):
+    return "{}_p{:g}".format(output, percentile)
+
+
+@instrumentation.timed("plotting")
+def make_ensemble_chart(config, ensemble_output):
+    """
+    The observations, with each output's band between the lowest and highest percentiles, and its middle percentile.
+    """
+    from model.visualization import styles
+    from model.visualization.plot import BaseFilter
+    from model.visualization.plot_filters import Save, SetBottomLegend, TimeFormatXAxis
+    from model.visualization.line_plot import LinePlot, YData
+    percentiles = sorted(config.experiment["ensemble_params"].get("percentiles", default_percentiles))
+    data = ensemble_output
+    x_axis = data["time"]
+    names = {"storage": "Storage", "model_sensible": "Sensible Heat", "model_latent": "Latent Heat"}
+    output_styles = {"storage": styles.storage, "model_sensible": styles.sensible, "model_latent": styles.latent}
+
+    class Bands(BaseFilter):
+        def apply(self, fig, ax):
+            for output in outputs:
+                ax.fill_between(x_axis, data[get_band_column(output, percentiles[0])],
+                                data[get_band_column(output, percentiles[-1])], color=output_styles[output].args[0],
+                                alpha=.2, label="{} {:g}-{:g}%".format(names[output], percentiles[0],
+                                                                      percentiles[-1]))
+
+    middle = percentiles[len(percentiles)//2]
+    y_data = [
+        YData(data["residual"], "Storage from Residual", styles.storage.plus(styles.observation)),
+        YData(data["sensible_heat"], "Observed Sensible Heat", styles.sensible.plus(styles.observation)),
+        YData(data["latent_heat"], "Observed Latent Heat", styles.latent.plus(styles.observation)),
+    ] + [YData(data[get_band_column(output, middle)], "{} {:g}%".format(names[output], middle),
+               output_styles[output].plus(styles.model)) for output in outputs]
+
+    LinePlot(x_axis, y_data).with_pre_filter(Bands()).with_post_filter(
+        TimeFormatXAxis(config.site.location.timezone),
+        SetBottomLegend(),
+        Save(config.output_dir / "ensemble.png")
+    ).run()
@@ -1,60 +1,85 @@
-import pandas as pd
 import numpy as np
+import pandas as pd
 import data.murray_data_loader as data_loader
 import model.storage.objective_hysteresis_model as ohm
-from matplotlib import pyplot as plt
-import model.radiation.solar_radiation_calculator as rad
-import util.location_util
-import util.time_util as time_util
-import model.penman_monteith.penman_monteith as penman_monteith
+import model.radiation.ephemeris_cache as ephemeris_cache
+import model.pipeline as pipeline
 from model.penman_monteith.tuning import learn_parameters
 import model.radiation.longwave_radiation as longwave
+import util.instrumentation as instrumentation
+
+from model.pipeline import get_storage_column
+# Plotting modules are imported inside the chart functions, so importing the model doesn't load matplotlib
 
-from model.storage.residual import set_residual
-from util.exceptions import ConfigValueNotRecognized
-from model.visualization import styles
-from model.visualization.plot_filters import Save, SetBottomLegend, TimeFormatXAxis
-from model.visualization.line_plot import LinePlot, YData
 
 def get_model_output(config):
-    data = data_loader.get_energy_balance_data()
+    """
+    Runs the model over the experiment's site. Stage outputs are memoized (see model.pipeline), so runs that only
+    change, say, alpha and beta reuse the loaded data and storage. Set the experiment's chunk_rows to process the
+    record in pieces of that many rows (see iterate_model_output) instead of all at once.
+
+    :rtype: pd.DataFrame
+    """
+    if config.experiment.get("chunk_rows"):
+        return pd.concat(iterate_model_output(config, config.experiment["chunk_rows"]), ignore_index=True)
+    tune_sensible_and_latent(config)
+    return pipeline.run(config)
+
+
+def iterate_model_output(config, chunk_rows=data_loader.default_chunk_rows):
+    """
+    Runs the model over the experiment's site a piece at a time, reading the data lazily, so memory stays bounded
+    for records of any length. Each piece is run with its neighbouring rows, so the rate of change of Q* (and so the
+    storage) at piece edges is the same as for the whole record. Penman-Monteith tuning still uses the whole record,
+    and runs once up front.
+
+    :return: generator of pd.DataFrame, in time order, that concatenate to get_model_output's
+    """
+    tune_sensible_and_latent(config)
+    pieces = data_loader.iterate_energy_balance_data(config.radiation_alignment, config.site, chunk_rows)
+    carry = None  # last two rows read; the last hasn't been yielded, as its rate of change needs the next row
+    for data in pieces:
+        if carry is not None:
+            data = pd.concat([carry, data])
+        first = 0 if carry is None else len(carry) - 1
+        carry = data.iloc[-2:].copy()
+        estimate_fluxes(config, data)
+        yield data.iloc[first:-1]
+    if carry is not None:
+        estimate_fluxes(config, carry)
+        yield carry.iloc[-1:]
+
+
+def estimate_fluxes(config, data):
     if config.longwave_model:
         estimate_longwave(config, data)
     estimate_storage(config, data)
     estimate_sensible_and_latent(config, data)
-    return data
 
 
 def estimate_longwave(config, data):
-    if config.longwave_model == "burridge_gadd":
-        constant_lwr = longwave.burridge_gadd_parameterization()
-        data["longwave"] = constant_lwr
-    else:
-        raise ConfigValueNotRecognized("Unrecognized longwave radiation model: " + config.longwave_model)
-    data["net_all_wave"] = data["net_radiation"] + data["longwave"]
-    data["net_radiation"] = data["net_all_wave"]
+    pipeline.add_longwave(data, config.longwave_model)
 
 
 def estimate_storage(config, data):
-    radiative_fluxes = data["net_radiation"].to_numpy()
-    times = data["time"].to_numpy()
-    data["storage"] = ohm.storage_heat_flux(config, radiative_fluxes, time=times)
-    set_residual(data)
+    pipeline.add_storage(data, ohm.get_weighted_coefficients(config.surface_data))
 
 
 def estimate_sensible_and_latent(config, data):
-    storage_column = "storage"
-    if "storage_source" in config.experiment:
-        storage_column = config.experiment["storage_source"] # used to set it to residual
+    params = config.penman_monteith_params
+    pipeline.add_sensible_and_latent(data, params["alpha"], params["beta"], get_storage_column(config))
+
+
+def tune_sensible_and_latent(config):
     if "tuning_params" in config.penman_monteith_params and "disabled" not in config.penman_monteith_params:
-        learn_parameters.auto_tune(config, storage_column)
-    for index, row in data.iterrows():
-        estimate_sensible, estimate_latent = penman_monteith.sensible_and_latent_heat(
-            config, row["net_radiation"], row[storage_column], row["temp"], row["pressure"])
-        data.at[index, "model_sensible"] = estimate_sensible
-        data.at[index, "model_latent"] = estimate_latent
-
-def make_pure_observations_chart():
+        learn_parameters.auto_tune(config, get_storage_column(config))
+
+
+@instrumentation.timed("plotting")
+def make_pure_observations_chart(path="observations.png"):
+    from model.visualization import styles
+    from model.visualization.plot_filters import Save, SetBottomLegend, TimeFormatXAxis
+    from model.visualization.line_plot import LinePlot, YData
     data = data_loader.get_energy_balance_data()
     x_axis = data["time"]
     y_data = [
@@ -73,14 +98,16 @@ def make_pure_observations_chart():
         TimeFormatXAxis("US/Mountain"),
         SetBottomLegend(scale_factor=.2, anchor_end=-.2),
         Format(),
-        Save("observations.png")
+        Save(path)
     ).run()
 
-make_pure_observations_chart()
-
 
+@instrumentation.timed("plotting")
 def make_lumps_chart(config, model_output):
-    model_rad, model_times, murray = get_modeled_shortwave_radiation()
+    from model.visualization import styles
+    from model.visualization.plot_filters import Save, SetBottomLegend, TimeFormatXAxis
+    from model.visualization.line_plot import LinePlot, YData
+    model_rad, model_times, location = get_modeled_shortwave_radiation(config.site, model_output["time"])
     data = model_output
 
     x_axis = data["time"]
@@ -107,14 +134,16 @@ def make_lumps_chart(config, model_output):
         y_data = new_y_data
 
     LinePlot(x_axis, y_data).with_post_filter(
-        TimeFormatXAxis(murray.timezone),
+        TimeFormatXAxis(location.timezone),
         SetBottomLegend(),
         Save(config.output_dir / "full_model.png")
     ).run()
 
 
+@instrumentation.timed("plotting")
 def make_hysteresis_charts(config, model_output):
-    model_ohm, model_rad, model_times, murray = get_modeled_radiation(config)
+    from matplotlib import pyplot as plt
+    model_ohm, model_rad, model_times, location = get_modeled_radiation(config, model_output["time"])
     base_radiation = model_output["net_solar"]
     if config.longwave_model == "burridge_gadd":
         base_radiation = model_output["net_all_wave"]
@@ -128,37 +157,31 @@ def make_hysteresis_charts(config, model_output):
     fig.savefig(config.output_dir / "hysteresis.png")
 
 
-def get_modeled_radiation(config):
-    # The way this is currently written, it only uses half the available datapoints (because
-    # the passed model_output has already downsampled the radiation data to match the lower
-    # resolution of the weather data).
-    model_rad, model_times, murray = get_modeled_shortwave_radiation()
+def get_modeled_radiation(config, times):
+    # Modeled every minute, unlike the observed radiation in model_output, which has been aligned
+    # to the lower resolution of the weather data (see the radiation_alignment experiment option).
+    model_rad, model_times, location = get_modeled_shortwave_radiation(config.site, times)
     if config.longwave_model == "burridge_gadd":
-        model_rad = [x + longwave.burridge_gadd_param for x in model_rad]
-
-    model_ohm = ohm.storage_heat_flux(config, np.array(model_rad), time=np.array(model_times))
-    return model_ohm, model_rad, model_times, murray
-
+        model_rad = model_rad + longwave.burridge_gadd_param
 
-def get_modeled_shortwave_radiation():
-    murray = util.location_util.Location(40.67250, 111.80220, "US/Mountain")  # Mountain Daylight Time is UTC+6
-    model_rad, model_times = get_model_radiation(murray)
-    return model_rad, model_times, murray
+    model_ohm = ohm.storage_heat_flux(config, model_rad, time=np.array(model_times))
+    return model_ohm, model_rad, model_times, location
 
 
-def get_model_radiation(murray):
-    model_times = make_day_time_series(murray)
-    model_rad = [rad.calc_radiation_flux(date_time, murray, albedo=data_loader.albedo) for date_time in model_times]
-    return model_rad, model_times
+def get_modeled_shortwave_radiation(site, times):
+    """
+    Clear-sky radiation every minute over the whole days the given local times fall on.
+    """
+    times = pd.DatetimeIndex(times)
+    start = times.min().floor("D")
+    end = times.max().floor("D") + pd.Timedelta("1D")
+    model_rad, model_times = get_model_radiation(site, start, end)
+    return model_rad, model_times, site.location
 
 
-def make_day_time_series(location):
-    hours = range(0, 24)
-    minutes = range(0, 60)
-    model_times = [pd.Timestamp(
-        time_util.make_date_time(year=2005, month=8, day=20, hour=hour, minute=minute, timezone=location.timezone))
-        for hour in hours
-        for minute in minutes]
-    return model_times
+def get_model_radiation(site, start, end):
+    model_times, radiation_variables = ephemeris_cache.get_clear_sky_radiation(
+        site.location, start=start, end=end, step="1min", albedo=site.albedo)
+    return radiation_variables["flux"], model_times
 
 
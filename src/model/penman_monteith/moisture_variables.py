@@ -1,6 +1,4 @@
-import math
 import numpy as np
-from matplotlib import pyplot as plt
 
 L_v = 2.5e6  # J/kg
 R_v = 461  # J/K/kg
@@ -18,28 +16,92 @@ def get_psychrometric_constant(pressure):
 def clausius_clapeyron_e_s(T, is_C=True):
     if is_C:
         T = as_kelvin(T)
-    return e_0 * math.exp(L_v/R_v*(1/T_0 - 1/T)) #hPa * e^(J/kg/(J/kg/K) * 1/K) = hPa * unitless^unitless = hPa
+    return e_0 * np.exp(L_v/R_v*(1/T_0 - 1/T)) #hPa * e^(J/kg/(J/kg/K) * 1/K) = hPa * unitless^unitless = hPa
 
 
 def slope_e_s(T, is_C=True):
+    return saturation_vapor_pressure_and_slope(T, is_C)[1]
+
+
+def saturation_vapor_pressure_and_slope(T, is_C=True):
+    """
+    e_s (hPa) and its slope de_s/dT (hPa/K) from a single exponential. T may be a float or an np.array.
+
+    :return: (e_s, de_s/dT)
+    """
     if is_C:
         T = as_kelvin(T)
-    return L_v/R_v * 1/(T*T) * clausius_clapeyron_e_s(T, is_C=False)
+    e_s = clausius_clapeyron_e_s(T, is_C=False)
+    return e_s, L_v/R_v * 1/(T*T) * e_s
 
 
 def as_kelvin(temp_in_C):
     return temp_in_C + 273.15
 
 
+class SaturationVaporPressureTable:
+    """
+    Tabulated e_s and de_s/dT, read with linear interpolation. Cheaper than the exponential for very large arrays
+    (gridded or ensemble runs).
+
+    Linear interpolation is off by at most step^2/8 * max|f''| over the table, which is kept in max_error_e_s (hPa)
+    and max_error_slope (hPa/K). With the default 0.01 C step that's under 1e-5 hPa and 1e-6 hPa/K. Temperatures
+    outside the table fall back to the exact functions.
+    """
+
+    def __init__(self, t_min=-50, t_max=60, step=0.01):
+        """
+        :param t_min: lowest tabulated temperature, C
+        :param t_max: highest tabulated temperature, C
+        :param step: table resolution, C
+        """
+        self.temps = np.arange(t_min, t_max + step/2, step)
+        self.e_s_values, self.slope_values = saturation_vapor_pressure_and_slope(self.temps)
+
+        T = as_kelvin(self.temps)
+        k = L_v/R_v
+        e_s_second_derivative = self.e_s_values * (k*k/T**4 - 2*k/T**3)
+        slope_second_derivative = k * self.e_s_values * (k*k/T**6 - 6*k/T**5 + 6/T**4)
+        self.max_error_e_s = step*step/8 * np.abs(e_s_second_derivative).max()
+        self.max_error_slope = step*step/8 * np.abs(slope_second_derivative).max()
+
+    def e_s(self, T):
+        """e_s (hPa) at T (C)"""
+        return self._lookup(T, self.e_s_values, clausius_clapeyron_e_s)
+
+    def slope(self, T):
+        """de_s/dT (hPa/K) at T (C)"""
+        return self._lookup(T, self.slope_values, slope_e_s)
+
+    def _lookup(self, T, values, exact_function):
+        T = np.asarray(T, dtype=float)
+        result = np.interp(T, self.temps, values)
+        outside = (T < self.temps[0]) | (T > self.temps[-1])
+        if np.any(outside):
+            result = np.where(outside, exact_function(T), result)
+        return result
+
+
+_table = None
+
+
+def get_saturation_vapor_pressure_table():
+    """Shared SaturationVaporPressureTable with the default range and resolution, built on first use."""
+    global _table
+    if _table is None:
+        _table = SaturationVaporPressureTable()
+    return _table
+
+
 def plot_sat_vapor_pressure_and_slope():
     """
         Test to see if the slope equation is correct by comparing to finite difference.
     """
+    from matplotlib import pyplot as plt
     temps = np.linspace(0, 40, num=100)
     delta_T = 40/100
-    e_s = [clausius_clapeyron_e_s(temp) for temp in temps]
+    e_s, delta = saturation_vapor_pressure_and_slope(temps)
     finite_difference_delta = finite_difference(e_s, delta_T)
-    delta = [slope_e_s(temp) for temp in temps]
 
     fig, ax = plt.subplots()
 
@@ -55,5 +117,3 @@ def finite_difference(series, delta):
     brackets = zip(series[0:-1], series[1:])
     return [(top - bottom)/delta for (bottom, top) in brackets]
 
-
-plot_sat_vapor_pressure_and_slope()
@@ -1,4 +1,5 @@
 import model.penman_monteith.moisture_variables as moisture_vars
+import util.instrumentation as instrumentation
 
 
 def sensible_and_latent_heat(config, net_radiation, heat_storage, temp, pressure):
@@ -8,9 +9,23 @@ def sensible_and_latent_heat(config, net_radiation, heat_storage, temp, pressure
     return calc_sensible_and_latent_heat(alpha, beta, net_radiation, heat_storage, temp, pressure)
 
 
-def calc_sensible_and_latent_heat(alpha, beta, net_radiation, heat_storage, temp, pressure):
+@instrumentation.timed("penman_monteith")
+def calc_sensible_and_latent_heat(alpha, beta, net_radiation, heat_storage, temp, pressure,
+                                  vapor_pressure_table=False):
+    """
+    Partitions the available energy (Q* - delta_Q_s) into sensible and latent heat. The inputs may be floats or
+    co-indexed np.arrays (temp in C, pressure in hPa), as long as they broadcast against each other.
+
+    :param vapor_pressure_table: whether to look de_s/dT up in moisture_variables.get_saturation_vapor_pressure_table
+        rather than evaluate the exponential, for large runs that can take its error bound
+    :type vapor_pressure_table: bool
+    :return: (Q_H, Q_E)
+    """
     gamma = moisture_vars.get_psychrometric_constant(pressure)
-    delta = moisture_vars.slope_e_s(temp)
+    if vapor_pressure_table:
+        delta = moisture_vars.get_saturation_vapor_pressure_table().slope(temp)
+    else:
+        delta = moisture_vars.slope_e_s(temp)
 
     available_heat = net_radiation - heat_storage # Q* - delta_Q_s term
 
@@ -1,22 +1,34 @@
-import data.murray_data_loader as data_loader
 from data import util
 import model.penman_monteith.penman_monteith as penman_monteith
-import model.storage.objective_hysteresis_model as ohm
+import model.penman_monteith.moisture_variables as moisture_vars
+import model.pipeline as pipeline
 from collections import namedtuple
 import numpy as np
 import pandas as pd
-import seaborn as seaborn
-import matplotlib.pyplot as plt
-from model.storage.residual import set_residual
+import util.evaluation_journal as evaluation_journal
+import util.instrumentation as instrumentation
+import util.search as search
+from util.exceptions import ConfigValueNotRecognized
 
 
 def auto_tune(config, storage_column="storage"):
     params = config.penman_monteith_params["tuning_params"]
     alpha_range = (params["alpha"][0], params["alpha"][1])
     beta_range = (params["beta"][0], params["beta"][1])
-    number = params["number"]
+    number = params.get("number")
+    method = params.get("method", "grid")
     file_root = config.output_dir / "pm_autotune"
-    best = optimize(alpha_range, beta_range, number, file_root, storage_column, config)
+    if method == "grid":
+        best = optimize(alpha_range, beta_range, number, file_root, storage_column, config)
+    elif method == "least_squares":
+        error_surface_number = number if params.get("error_surface") else None
+        best = optimize_least_squares(alpha_range, beta_range, file_root, storage_column, config,
+                                      error_surface_number)
+    elif method == "refine":
+        best = optimize_refine(alpha_range, beta_range, number, file_root, storage_column, config,
+                               **search.get_refine_options(params))
+    else:
+        raise ConfigValueNotRecognized("Unrecognized Penman-Monteith tuning method: " + str(method))
     config.penman_monteith_params["alpha"] = best["alpha"]
     config.penman_monteith_params["beta"] = best["beta"]
     best.to_csv(file_root / "final_params.csv")
@@ -30,49 +42,240 @@ def optimize(alpha_range, beta_range, number, file_root, storage_column="storage
     # errors = pd.read_csv(file_root, index_col=0)
     best = errors[errors["error"] == errors["error"].min()].iloc[0]
     print(best)
+    plot_errors(errors, file_root)
+    return best
+
+
+def optimize_least_squares(alpha_range, beta_range, file_root, storage_column="storage", config=None,
+                           error_surface_number=None):
+    """
+    Finds the exact alpha and beta that minimize the average normalized squared error within the given ranges.
+    Pass error_surface_number to also write the grid of errors (errors.csv and its heatmap) like optimize does.
+    """
+    file_root.mkdir(parents=True, exist_ok=True)
+    data = get_observations(config)
+    alpha, beta, error = fit_least_squares(data, storage_column, alpha_range, beta_range)
+    best = pd.Series({"alpha": alpha, "beta": beta, "error": error})
+    print(best)
+    if error_surface_number:
+        errors = get_errors(alpha_range, beta_range, error_surface_number, storage_column, config)
+        errors.to_csv(file_root / "errors.csv")
+        plot_errors(errors, file_root)
+    return best
+
+
+def optimize_refine(alpha_range, beta_range, number, file_root, storage_column="storage", config=None, **options):
+    """
+    Coarse-to-fine search, see util.search.refine_grid: a number x number grid, then finer grids around the best
+    points until the spacing is within tolerance or the budget is spent. Writes every evaluated point to errors.csv.
+    """
+    file_root.mkdir(parents=True, exist_ok=True)
+    data = get_observations(config)
+    progress = instrumentation.Progress("Penman-Monteith points evaluated", total=options.get("budget"))
+    evaluate, known = journal_evaluations(config, get_point_evaluator(data, storage_column, progress),
+                                          options.pop("warm_start", False),
+                                          **get_data_description(data, storage_column))
+    points, point_errors = search.refine_grid(evaluate, [alpha_range, beta_range], number, initial=known, **options)
+    progress.close()
+    errors = pd.DataFrame({"alpha": points[:, 0], "beta": points[:, 1], "error": point_errors})
+    errors.to_csv(file_root / "errors.csv")
+    best = errors.iloc[search.get_best_index(point_errors)]
+    print(best)
+    return best
+
+
+@instrumentation.timed("plotting")
+def plot_errors(errors, file_root):
+    import seaborn as seaborn
+    import matplotlib.pyplot as plt
     errors = errors.round(decimals=3)
     pivoted = errors.pivot(index="beta", columns="alpha")
     fig, ax = plt.subplots(figsize=(7, 10))
     seaborn.heatmap(pivoted)
     fig.savefig(file_root / "heatmap.png")
     plt.close(fig)
-    return best
+
+
+def fit_least_squares(data, storage_column="storage", alpha_range=None, beta_range=None):
+    """
+    Q_H and Q_E are linear in alpha and beta once gamma/delta and the available energy are known:
+        Q_H = A - alpha*u - beta,  Q_E = alpha*u + beta,  where A = Q* - delta_Q_s and u = A/(1 + gamma/delta)
+    so the average normalized squared error is a quadratic in (alpha, beta) and its minimum is a weighted least
+    squares solution. With ranges, the minimum is taken over that box instead.
+
+    :param data: observations, as from get_observations
+    :type data: pd.DataFrame
+    :return: (alpha, beta, average normalized squared error)
+    :rtype: (float, float, float)
+    """
+    design, target = get_least_squares_system(data, storage_column)
+    (alpha, beta), *_ = np.linalg.lstsq(design, target, rcond=None)
+    if alpha_range is not None and beta_range is not None and not (
+            alpha_range[0] <= alpha <= alpha_range[1] and beta_range[0] <= beta <= beta_range[1]):
+        alpha, beta = fit_on_box_edges(design, target, alpha_range, beta_range)
+    error = get_least_squares_error(design, target, alpha, beta)
+    return float(alpha), float(beta), float(error)
+
+
+def get_least_squares_system(data, storage_column="storage"):
+    # The rows of both error terms, each scaled by its normalization, stacked into one system design @ (alpha, beta)
+    # ~= target. The means of the normalization cancel out in the differences.
+    sensible_stats = _get_statistical_vars(data["sensible_heat"])
+    latent_stats = _get_statistical_vars(data["latent_heat"])
+    temp = data["temp"].to_numpy()
+    gamma = moisture_vars.get_psychrometric_constant(data["pressure"].to_numpy())
+    delta = moisture_vars.slope_e_s(temp)
+    available_heat = data["net_radiation"].to_numpy() - data[storage_column].to_numpy()
+    u = available_heat/(1 + gamma/delta)
+    ones = np.ones(len(u))
+    design = np.vstack([
+        np.column_stack([u, ones])/sensible_stats.std,
+        np.column_stack([u, ones])/latent_stats.std,
+    ])
+    target = np.hstack([
+        (available_heat - data["sensible_heat"].to_numpy())/sensible_stats.std,
+        data["latent_heat"].to_numpy()/latent_stats.std,
+    ])
+    return design, target
+
+
+def get_least_squares_error(design, target, alpha, beta):
+    # Each row's error is the mean of its sensible and latent terms, so the average is over both halves
+    residual = design @ np.array([alpha, beta]) - target
+    return residual @ residual/len(residual)
+
+
+def fit_on_box_edges(design, target, alpha_range, beta_range):
+    # The error is convex, so when the unconstrained minimum is outside the box the constrained one is on its edge:
+    # fix each parameter at each bound in turn, solve for the other and clip it to its range.
+    candidates = []
+    for fixed_column, bounds, free_range in [(0, alpha_range, beta_range), (1, beta_range, alpha_range)]:
+        free_column = 1 - fixed_column
+        for bound in bounds:
+            remaining = target - design[:, fixed_column]*bound
+            column = design[:, free_column]
+            free = np.clip(column @ remaining/(column @ column), free_range[0], free_range[1])
+            parameters = [0, 0]
+            parameters[fixed_column], parameters[free_column] = bound, free
+            candidates.append(parameters)
+    return min(candidates, key=lambda parameters: get_least_squares_error(design, target, *parameters))
 
 
 def get_errors(alpha_range, beta_range, number, storage_column, config=None):
-    alphas = np.linspace(alpha_range[0], alpha_range[1], num=number)
-    betas = np.linspace(beta_range[0], beta_range[1], num=number)
-    error_matrix = pd.DataFrame(columns=["alpha", "beta", "error"])
-    for alpha in alphas:
-        for beta in betas:
-            error = calculate_error(alpha, beta, storage_column, config)
-            error_matrix.loc[len(error_matrix.index)] = [alpha, beta, error]
-    return error_matrix
+    data = get_observations(config)
+    points = search.get_grid([alpha_range[0], beta_range[0]], [alpha_range[1], beta_range[1]], [number, number])
+    progress = instrumentation.Progress("Penman-Monteith points evaluated", total=len(points))
+    evaluate, _ = journal_evaluations(config, get_point_evaluator(data, storage_column, progress),
+                                      **get_data_description(data, storage_column))
+    errors = pd.DataFrame({"alpha": points[:, 0], "beta": points[:, 1], "error": evaluate(points)})
+    progress.close()
+    return errors
+
+
+def get_point_evaluator(data, storage_column="storage", progress=None):
+    return lambda points: get_point_errors(data, points[:, 0], points[:, 1], storage_column, progress=progress)
+
+
+def get_data_description(data, storage_column="storage"):
+    columns = ["net_radiation", storage_column, "temp", "pressure", "sensible_heat", "latent_heat"]
+    return {"model": "penman_monteith", "data": data[columns].to_numpy(dtype=float)}
+
+
+def journal_evaluations(config, evaluate, warm_start=False, **description):
+    """
+    Wraps a function from parameter points to errors with the evaluation journal (see util.evaluation_journal), so
+    points evaluated by earlier runs over the same data and model options are looked up instead. Experiments turn
+    this on with journal: true.
+
+    :param description: everything the errors depend on besides the parameters, see evaluation_journal.get_context
+    :return: (the wrapped function, the (points, errors) recorded so far if warm_start, otherwise None)
+    """
+    if config is None or not config.experiment.get("journal", False):
+        return evaluate, None
+    journal = evaluation_journal.get_journal()
+    context = evaluation_journal.get_context(**description)
+    return journal.journaled(evaluate, context), journal.get_evaluations(context) if warm_start else None
+
+
+def get_error_surface(data, alphas, betas, storage_column="storage", max_elements=2**24):
+    """
+    Average normalized squared error for every combination of alphas and betas. The observations, their statistics
+    and gamma/delta are prepared once; the errors are then evaluated over the alpha x beta x time tensor with
+    broadcasting, a block of alphas at a time so the tensor stays under max_elements.
+
+    :param data: observations, as from get_observations
+    :type data: pd.DataFrame
+    :return: np.array of shape (len(alphas), len(betas))
+    :rtype: np.array
+    """
+    terms = get_error_terms(data, storage_column)
+    alphas = np.asarray(alphas, dtype=float)
+    betas = np.asarray(betas, dtype=float)
+    errors = np.empty((len(alphas), len(betas)))
+    block = max(1, max_elements // max(1, len(betas) * len(terms.available_heat)))
+    for start in range(0, len(alphas), block):
+        errors[start:start + block] = get_terms_error(terms, alphas[start:start + block, None, None],
+                                                      betas[None, :, None])
+    return errors
+
+
+def get_point_errors(data, alphas, betas, storage_column="storage", max_elements=2**24, progress=None):
+    """
+    Like get_error_surface, but for the (alpha, beta) pairs zip(alphas, betas) rather than every combination.
+
+    :param progress: reporter to update as each block of pairs is evaluated
+    :type progress: util.instrumentation.Progress
+    :return: np.array of shape (len(alphas),)
+    :rtype: np.array
+    """
+    terms = get_error_terms(data, storage_column)
+    alphas = np.asarray(alphas, dtype=float)
+    betas = np.asarray(betas, dtype=float)
+    errors = np.empty(len(alphas))
+    block = max(1, max_elements // max(1, len(terms.available_heat)))
+    for start in range(0, len(alphas), block):
+        errors[start:start + block] = get_terms_error(terms, alphas[start:start + block, None],
+                                                      betas[start:start + block, None])
+        if progress is not None:
+            progress.update(len(errors[start:start + block]),
+                            best_error=float(np.fmin.reduce(errors[:start + block])))
+    return errors
+
+
+ErrorTerms = namedtuple("ErrorTerms", ["available_heat", "gamma", "delta", "actual_sensible", "actual_latent",
+                                       "sensible_stats", "latent_stats"])
+
+
+def get_error_terms(data, storage_column="storage"):
+    return ErrorTerms(
+        available_heat=data["net_radiation"].to_numpy() - data[storage_column].to_numpy(),
+        gamma=moisture_vars.get_psychrometric_constant(data["pressure"].to_numpy()),
+        delta=moisture_vars.slope_e_s(data["temp"].to_numpy()),
+        actual_sensible=data["sensible_heat"].to_numpy(),
+        actual_latent=data["latent_heat"].to_numpy(),
+        sensible_stats=_get_statistical_vars(data["sensible_heat"]),
+        latent_stats=_get_statistical_vars(data["latent_heat"]))
+
+
+@instrumentation.timed("error")
+def get_terms_error(terms, alpha, beta):
+    # alpha and beta broadcast against each other and, along their last axis, against the observations
+    with instrumentation.stage("penman_monteith"):
+        estimate_sensible = penman_monteith.calc_sensible_heat(alpha, beta, terms.available_heat, terms.gamma,
+                                                               terms.delta)
+        estimate_latent = penman_monteith.calc_latent_heat(alpha, beta, terms.available_heat, terms.gamma,
+                                                           terms.delta)
+    error_by_row = average_error_by_row(terms.actual_latent, terms.actual_sensible, estimate_latent, estimate_sensible,
+                                        terms.latent_stats, terms.sensible_stats)
+    return average_rows(error_by_row)
 
 
 def calculate_error(alpha, beta, storage_column, config=None):
     data = get_observations(config)
-    sensible_stats = get_statistical_vars("sensible_heat")
-    latent_stats = get_statistical_vars("latent_heat")
-    error_total = 0
-    for row in data.iterrows():
-        error = calculate_error_row(alpha, beta, row[1], latent_stats, sensible_stats, storage_column)
-        error_total = error_total + error
-    average_error = error_total/len(data.index)
-    print("a:" + str(alpha) + " b:" + str(beta) + "\terror: " + str(average_error))
-    return average_error
-
-
-def calculate_error_row(alpha, beta, observation_row, latent_stats, sensible_stats, storage_column):
-    estimate_sensible, estimate_latent = penman_monteith.calc_sensible_and_latent_heat(
-        alpha, beta, observation_row["net_radiation"], observation_row[storage_column],
-        observation_row["temp"], observation_row["pressure"])
-    actual_sensible, actual_latent = observation_row["sensible_heat"], observation_row["latent_heat"]
-    error = average_error_by_row(actual_latent, actual_sensible, estimate_latent, estimate_sensible, latent_stats,
-                                 sensible_stats)
-    return error
+    return get_error_surface(data, [alpha], [beta], storage_column)[0, 0]
 
 
+@instrumentation.timed("error")
 def calculate_normalized_squared_error(actual_latent, actual_sensible, estimate_latent, estimate_sensible):
     sensible_stats = _get_statistical_vars(actual_sensible)
     latent_stats = _get_statistical_vars(actual_latent)
@@ -85,7 +288,18 @@ def average_error(actual_latent, actual_sensible, estimate_latent, estimate_sens
                          sensible_stats):
     error_by_row = average_error_by_row(actual_latent, actual_sensible, estimate_latent, estimate_sensible, latent_stats,
                                sensible_stats)
-    return error_by_row.sum()/len(error_by_row)
+    return average_rows(error_by_row)
+
+
+def average_rows(error_by_row):
+    """
+    The average over the last axis of errors by row, e.g. from average_error_by_row. Rows with missing observations
+    count towards the length but not the sum, so every tuner ranks candidates the same way on gappy data.
+
+    :type error_by_row: np.array
+    """
+    error_by_row = np.asarray(error_by_row, dtype=float)
+    return np.nansum(error_by_row, axis=-1)/error_by_row.shape[-1]
 
 
 def average_error_by_row(actual_latent, actual_sensible, estimate_latent, estimate_sensible, latent_stats, sensible_stats):
@@ -111,11 +325,6 @@ def normalize(stats, value):
 Vars = namedtuple("vars", ["mean", "std"])
 
 
-def get_statistical_vars(column_name):
-    data = get_observations()
-    return _get_statistical_vars(data[column_name])
-
-
 def _get_statistical_vars(series):
     mean = series.mean()
     standard_deviation = series.std()
@@ -123,14 +332,7 @@ def _get_statistical_vars(series):
 
 
 def get_observations(config=None):
-    data = data_loader.get_energy_balance_data()
-    if config:
-        materials = config.surface_data
-    else:
-        materials = data_loader.get_surface_data()
-    radiative_fluxes = data["net_radiation"].to_numpy()
-    times = data["time"].to_numpy()
-    data["storage"] = ohm.calculate_storage_heat_flux(materials, radiative_fluxes, time=times)
-    set_residual(data)
-    return data
+    # The observed radiation without the longwave model, with the storage of the config's materials (or
+    # surface_types.csv without a config)
+    return pipeline.run(config, "storage", longwave={"model": None})
 
@@ -0,0 +1,164 @@
+import json
+from collections import OrderedDict, namedtuple
+
+import data.datasets as datasets
+import data.murray_data_loader as data_loader
+import model.penman_monteith.penman_monteith as penman_monteith
+import model.radiation.longwave_radiation as longwave
+import model.storage.objective_hysteresis_model as ohm
+from model.storage.residual import set_residual
+from util.exceptions import ConfigValueNotRecognized
+
+# A step of a pipeline. run(parameters, *outputs of inputs) returns the stage's output, and must not modify its
+# inputs, as outputs are shared through the cache.
+Stage = namedtuple("Stage", ["name", "inputs", "run"])
+
+
+class Pipeline:
+    """
+    Stages run in dependency order, each output memoized in a bounded LRU. An output is keyed by the stage's own
+    parameters and, recursively, its inputs' keys, so changing a stage's parameters reruns it and the stages that
+    depend on it, and nothing upstream.
+    """
+
+    def __init__(self, stages, max_entries=32):
+        self.stages = OrderedDict((stage.name, stage) for stage in stages)
+        self.max_entries = max_entries
+        self.runs = {name: 0 for name in self.stages}  # times each stage has been computed
+        self._cache = OrderedDict()
+
+    def run(self, parameters, target=None):
+        """
+        :param parameters: each stage's parameters by stage name, as JSON-serializable values, which are what the
+            outputs are keyed by
+        :type parameters: dict
+        :param target: stage to return the output of; defaults to the last
+        :return: the stage's output, shared with the cache, so copy it before modifying it
+        """
+        target = target or next(reversed(self.stages))
+        return self._run(parameters, target, self.get_key(parameters, target))
+
+    def get_key(self, parameters, name):
+        inputs = tuple(self.get_key(parameters, input_name) for input_name in self.stages[name].inputs)
+        return name, json.dumps(parameters.get(name), sort_keys=True), inputs
+
+    def _run(self, parameters, name, key):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        stage = self.stages[name]
+        inputs = [self._run(parameters, input_name, input_key)
+                  for input_name, input_key in zip(stage.inputs, key[2])]
+        output = stage.run(parameters.get(name), *inputs)
+        self.runs[name] += 1
+        self._cache[key] = output
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return output
+
+    def clear(self):
+        self._cache.clear()
+
+
+def load_observations(parameters):
+    return data_loader.get_energy_balance_data(parameters["alignment"], datasets.get_site(parameters["site"]))
+
+
+def estimate_longwave(parameters, data):
+    if parameters["model"] is None:
+        return data
+    data = data.copy()
+    add_longwave(data, parameters["model"])
+    return data
+
+
+def estimate_storage(parameters, data):
+    data = data.copy()
+    add_storage(data, parameters["coefficients"])
+    return data
+
+
+def estimate_sensible_and_latent(parameters, data):
+    data = data.copy()
+    add_sensible_and_latent(data, parameters["alpha"], parameters["beta"], parameters["storage_column"])
+    return data
+
+
+def add_longwave(data, longwave_model):
+    if longwave_model == "burridge_gadd":
+        constant_lwr = longwave.burridge_gadd_parameterization()
+        data["longwave"] = constant_lwr
+    else:
+        raise ConfigValueNotRecognized("Unrecognized longwave radiation model: " + longwave_model)
+    data["net_all_wave"] = data["net_radiation"] + data["longwave"]
+    data["net_radiation"] = data["net_all_wave"]
+
+
+def add_storage(data, coefficients):
+    radiative_fluxes = data["net_radiation"].to_numpy()
+    times = data["time"].to_numpy()
+    data["storage"] = ohm.calculate_storage_heat_flux_from_coefficients(coefficients, radiative_fluxes, time=times)
+    set_residual(data)
+
+
+def add_sensible_and_latent(data, alpha, beta, storage_column="storage"):
+    estimate_sensible, estimate_latent = penman_monteith.calc_sensible_and_latent_heat(
+        alpha, beta, data["net_radiation"].to_numpy(), data[storage_column].to_numpy(), data["temp"].to_numpy(),
+        data["pressure"].to_numpy())
+    data["model_sensible"] = estimate_sensible
+    data["model_latent"] = estimate_latent
+
+
+lumps_pipeline = Pipeline([
+    Stage("observations", [], load_observations),
+    Stage("longwave", ["observations"], estimate_longwave),
+    Stage("storage", ["longwave"], estimate_storage),
+    Stage("sensible_and_latent", ["storage"], estimate_sensible_and_latent),
+])
+
+
+def get_parameters(config=None):
+    """
+    The parameters of each stage of lumps_pipeline, from an experiment's config. Without a config, the Murray
+    observations with the materials of surface_types.csv and no longwave model.
+
+    :type config: experiments.config.config.Config
+    :rtype: dict
+    """
+    if config is None:
+        site, alignment, longwave_model = datasets.murray, None, None
+        materials, penman_monteith_params, storage_column = data_loader.get_surface_data(), {}, "storage"
+    else:
+        site, alignment, longwave_model = config.site, config.radiation_alignment, config.longwave_model
+        materials, penman_monteith_params = config.surface_data, config.penman_monteith_params
+        storage_column = get_storage_column(config)
+    return {
+        # The file signature reruns everything if the data files change
+        "observations": {"site": site.name, "alignment": alignment,
+                         "files": data_loader.get_signature([site.weather_file, site.radiation_file])},
+        "longwave": {"model": longwave_model or None},
+        "storage": {"coefficients": ohm.get_weighted_coefficients(materials) if materials is not None else None},
+        "sensible_and_latent": {"alpha": penman_monteith_params.get("alpha"),
+                                "beta": penman_monteith_params.get("beta"), "storage_column": storage_column},
+    }
+
+
+def run(config, target=None, **overrides):
+    """
+    Runs lumps_pipeline for an experiment, reusing whatever earlier runs computed with the same parameters.
+
+    :param target: name of the last stage to run; defaults to the whole model
+    :param overrides: parameters to replace, by stage name, e.g. longwave={"model": None}
+    :return: a copy of the stage's output, free for the caller to modify
+    :rtype: pd.DataFrame
+    """
+    parameters = get_parameters(config)
+    parameters.update(overrides)
+    return lumps_pipeline.run(parameters, target).copy()
+
+
+def get_storage_column(config):
+    if "storage_source" in config.experiment:
+        return config.experiment["storage_source"] # used to set it to residual
+    return "storage"
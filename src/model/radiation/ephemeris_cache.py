@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import model.radiation.solar_radiation_calculator as rad
+import util.instrumentation as instrumentation
+from data.util import get_project_root
+from util.location_util import Clouds
+from util.time_util import make_date_time_range
+
+# Part of every key, so bumping it invalidates everything cached by an older version of the radiation calculation
+cache_version = 1
+cache_dir = get_project_root() / "data/interim/ephemeris"
+max_entries = 32  # in-process LRU size
+
+_memory_cache = OrderedDict()
+
+
+@instrumentation.timed("radiation")
+def get_clear_sky_radiation(location, start, end, step="1min", slope_angle=0, slope_azimuth=0, albedo=0,
+                            use_disk=True):
+    """
+    Memoized clear-sky radiation variables for location from start (inclusive) to end (exclusive) every step. Results
+    are kept in an in-process LRU and in an on-disk store under data/interim, both keyed by a hash of the arguments,
+    so the astronomy is only done once per (location, date range, time step, slope, albedo).
+
+    :param location: where to evaluate the radiation
+    :type location: util.location_util.Location
+    :param start: first time; naive times are in location.timezone
+    :param end: end time, exclusive
+    :param step: pandas frequency string, e.g. "1min"
+    :param use_disk: whether to read from and write to the on-disk store
+    :type use_disk: bool
+    :return: (times, radiation variables) like solar_radiation_calculator.get_radiation_variables_for_range. The
+        arrays are shared between callers and are read-only.
+    :rtype: (pd.DatetimeIndex, dict)
+    """
+    key = get_key(location, start, end, step, slope_angle, slope_azimuth, albedo)
+    if key in _memory_cache:
+        instrumentation.count("ephemeris.memory_cache_hits")
+        _memory_cache.move_to_end(key)
+        return _memory_cache[key]
+
+    path = cache_dir / (key + ".npz")
+    times = make_date_time_range(start, end, step, timezone=location.timezone)
+    if use_disk and path.exists():
+        instrumentation.count("ephemeris.disk_cache_hits")
+        with np.load(path) as stored:
+            radiation_variables = {name: stored[name] for name in stored.files}
+    else:
+        instrumentation.count("ephemeris.computed")
+        radiation_variables = rad.get_radiation_variables_series(times, location, slope_angle, slope_azimuth,
+                                                                 Clouds(0, 0, 0), albedo)
+        if use_disk:
+            save(path, radiation_variables)
+
+    for values in radiation_variables.values():
+        values.setflags(write=False)
+    _memory_cache[key] = (times, radiation_variables)
+    if len(_memory_cache) > max_entries:
+        _memory_cache.popitem(last=False)
+    return times, radiation_variables
+
+
+def get_key(location, start, end, step, slope_angle, slope_azimuth, albedo):
+    description = {
+        "version": cache_version,
+        "location": [float(location.latitude), float(location.longitude), location.timezone],
+        "start": str(pd.Timestamp(start)),
+        "end": str(pd.Timestamp(end)),
+        "step": str(pd.Timedelta(step)),
+        "slope": [float(slope_angle), float(slope_azimuth)],
+        "albedo": float(albedo),
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def save(path, radiation_variables):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_suffix(".{}.tmp".format(os.getpid()))
+    with open(temporary_path, "wb") as file:
+        np.savez(file, **radiation_variables)
+    os.replace(temporary_path, path)  # so a concurrent run never reads a half written file
+
+
+def clear_memory_cache():
+    _memory_cache.clear()
@@ -0,0 +1,97 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import model.radiation.solar_radiation_calculator as rad
+from util.location_util import Clouds
+from util.time_util import to_utc_datetime64
+
+max_chunk_bytes = 256 * 2**20  # memory budget for the intermediates of one chunk
+intermediates_per_value = 16  # rough number of float arrays calc_radiation_variables keeps alive at once
+
+
+def calc_gridded_radiation_flux(times, latitude, longitude, slope_angle=0, slope_azimuth=0, clouds=Clouds(0, 0, 0),
+                                albedo=0, chunk_bytes=max_chunk_bytes, processes=1, out=None):
+    """
+    Evaluates the shortwave flux for every cell of a raster at every time. The cells are split into chunks whose
+    intermediates fit in chunk_bytes, and the chunks are spread across a process pool.
+
+    :param times: times to evaluate, as accepted by solar_radiation_calculator.get_radiation_variables_series
+    :type times: array-like
+    :param latitude: degrees, np.array of any shape or a scalar
+    :param longitude: degrees, positive west; must broadcast against latitude
+    :param slope_angle: degrees from horizontal; must broadcast against latitude
+    :param slope_azimuth: degrees clockwise from north of the direction the slope faces; must broadcast against latitude
+    :param chunk_bytes: approximate memory limit for each chunk's calculation
+    :type chunk_bytes: int
+    :param processes: number of worker processes; None uses every core, 1 runs in this process
+    :type processes: int
+    :param out: optional preallocated array (e.g. an np.memmap) of shape cells + (len(times),) to write into
+    :type out: np.array
+    :return: np.array of float, flux with shape cells + (len(times),), where cells is the broadcast shape of the
+        cell arguments
+    :rtype: np.array
+    """
+    utc_times = to_utc_datetime64(times)
+    julian_day = rad.get_julian_day_array(utc_times)
+    hour_fraction = rad.get_hour_float_array(utc_times)
+
+    cells = np.broadcast_arrays(*[np.radians(np.asarray(value, dtype=float))
+                                  for value in (latitude, longitude, slope_angle, slope_azimuth)])
+    cell_shape = cells[0].shape
+    cells = np.stack([cell.ravel() for cell in cells], axis=1)  # (cell, [lat, lon, slope, azimuth])
+
+    if out is None:
+        out = np.empty(cell_shape + (len(utc_times),))
+    flat_out = out.reshape(len(cells), len(utc_times))
+
+    chunks = get_chunks(len(cells), len(utc_times), chunk_bytes)
+    # Clouds can't be pickled (its type name doesn't match its module attribute), so workers get a plain tuple
+    tasks = [(cells[start:stop], julian_day, hour_fraction, tuple(clouds), albedo) for start, stop in chunks]
+    if processes == 1 or len(tasks) == 1:
+        results = map(calc_chunk, tasks)
+        for (start, stop), flux in zip(chunks, results):
+            flat_out[start:stop] = flux
+    else:
+        with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as executor:
+            for (start, stop), flux in zip(chunks, executor.map(calc_chunk, tasks)):
+                flat_out[start:stop] = flux
+    return out
+
+
+def calc_chunk(task):
+    cells, julian_day, hour_fraction, clouds, albedo = task
+    latitude, longitude, slope_angle, slope_azimuth = [cells[:, [column]] for column in range(4)]
+    radiation_variables = rad.calc_radiation_variables(julian_day, hour_fraction, latitude, longitude,
+                                                       slope_angle, slope_azimuth, Clouds(*clouds), albedo,
+                                                       fields=("flux",))
+    return radiation_variables["flux"]
+
+
+def get_chunks(number_of_cells, number_of_times, chunk_bytes):
+    bytes_per_cell = max(1, number_of_times * 8 * intermediates_per_value)
+    cells_per_chunk = max(1, chunk_bytes // bytes_per_cell)
+    return [(start, min(start + cells_per_chunk, number_of_cells))
+            for start in range(0, number_of_cells, cells_per_chunk)]
+
+
+def get_slope_and_aspect(elevation, cell_size):
+    """
+    Derives the slope arguments for calc_gridded_radiation_flux from an elevation raster (e.g. a DEM tile).
+
+    :param elevation: 2D np.array of elevations, rows running north to south and columns west to east
+    :type elevation: np.array
+    :param cell_size: grid spacing in the same units as elevation, either one number or (row spacing, column spacing)
+    :return: (slope_angle, slope_azimuth) in degrees, each shaped like elevation. Flat cells face north.
+    :rtype: (np.array, np.array)
+    """
+    row_spacing, column_spacing = np.broadcast_to(cell_size, (2,))
+    d_z_d_row, d_z_d_column = np.gradient(np.asarray(elevation, dtype=float), row_spacing, column_spacing)
+    d_z_d_east = d_z_d_column
+    d_z_d_north = -d_z_d_row
+    slope_angle = np.degrees(np.arctan(np.hypot(d_z_d_east, d_z_d_north)))
+    # A slope faces downhill, opposite to the gradient
+    slope_azimuth = np.degrees(np.arctan2(-d_z_d_east, -d_z_d_north)) % math.degrees(rad.C)
+    return slope_angle, slope_azimuth
@@ -1,30 +1,113 @@
 import math
-from math import cos, sin, acos, asin
 
+import numpy as np
+
+import util.exceptions as ex
 from util.location_util import Clouds
+from util.time_util import make_date_time_range, to_utc_datetime64
 
 C = 2 * math.pi  # radians in a circle
 S_0 = 1366  # W/m^2, solar "constant"
 
+radiation_fields = ("hour_fraction", "solar_declination", "elevation_angle", "zenith_angle", "local_solar_time",
+                    "solar_azimuth", "angle_of_incidence", "flux")
+# Intermediate steps of the flux calculation, for debugging
+debug_fields = ("flux_debug_1_angle", "flux_debug_2_angle_and_clouds", "flux_debug_3_angle_clouds_and_albedo")
+
 # Returns R_s down
 def calc_radiation_flux(date_time, location, slope_angle=0, slope_azimuth=0, clouds=Clouds(0, 0, 0), albedo=0):
-    radiation_variables = get_radiation_variables(date_time, location, slope_angle, slope_azimuth, clouds, albedo)
+    radiation_variables = get_radiation_variables(date_time, location, slope_angle, slope_azimuth, clouds, albedo,
+                                                  fields=("flux",))
     return radiation_variables["flux"]
 
 
-def get_radiation_variables(date_time, location, slope_angle=0, slope_azimuth=0, clouds=Clouds(0, 0, 0), albedo=0):
-    radiation_variables = dict()
-
-    longitude = math.radians(location.longitude)
-    latitude = math.radians(location.latitude)
-    slope_angle = math.radians(slope_angle)
-    slope_azimuth = math.radians(slope_azimuth)
+def get_radiation_variables(date_time, location, slope_angle=0, slope_azimuth=0, clouds=Clouds(0, 0, 0), albedo=0,
+                            fields=None):
     struct_time = get_utc_timetuple(date_time)
+    radiation_variables = calc_radiation_variables(get_julian_day(struct_time), get_hour_float(struct_time),
+                                                   math.radians(location.latitude), math.radians(location.longitude),
+                                                   math.radians(slope_angle), math.radians(slope_azimuth),
+                                                   clouds, albedo, fields)
+    return {name: float(value) for name, value in radiation_variables.items()}
+
+
+def calc_radiation_flux_series(times, location, slope_angle=0, slope_azimuth=0, clouds=Clouds(0, 0, 0), albedo=0):
+    radiation_variables = get_radiation_variables_series(times, location, slope_angle, slope_azimuth, clouds, albedo,
+                                                         fields=("flux",))
+    return radiation_variables["flux"]
+
 
-    hour_fraction = get_hour_float(struct_time)
+def get_radiation_variables_series(times, location, slope_angle=0, slope_azimuth=0, clouds=Clouds(0, 0, 0),
+                                   albedo=0, fields=None):
+    """
+    Array version of get_radiation_variables. Evaluates the whole time series in one broadcasted pass instead of
+    converting and calculating each timestamp separately.
+
+    :param times: times to evaluate. Timezone-aware times (pd.DatetimeIndex, list of pd.Timestamp) are converted to
+        UTC; naive times and np.datetime64 arrays are taken to already be UTC.
+    :type times: array-like
+    :param location: where to evaluate the radiation
+    :type location: util.location_util.Location
+    :param fields: names from radiation_fields and debug_fields to return; None returns all of them
+    :type fields: tuple
+    :return: dict with the same keys as get_radiation_variables, each an np.array of float co-indexed with times
+    :rtype: dict
+    """
+    utc_times = to_utc_datetime64(times)
+    return calc_radiation_variables(get_julian_day_array(utc_times), get_hour_float_array(utc_times),
+                                    math.radians(location.latitude), math.radians(location.longitude),
+                                    math.radians(slope_angle), math.radians(slope_azimuth), clouds, albedo, fields)
+
+
+def get_radiation_record(times, location, fields=("flux",), slope_angle=0, slope_azimuth=0, clouds=Clouds(0, 0, 0),
+                         albedo=0):
+    """
+    Like get_radiation_variables_series, but returns only the requested fields, packed in a structured array. Use
+    this on hot paths; use get_radiation_variables_series for the debug fields.
+
+    :return: structured np.array with one float field per requested name, co-indexed with times
+    :rtype: np.array
+    """
+    radiation_variables = get_radiation_variables_series(times, location, slope_angle, slope_azimuth, clouds, albedo,
+                                                         fields)
+    record = np.empty(len(times), dtype=[(name, float) for name in fields])
+    for name in fields:
+        record[name] = radiation_variables[name]
+    return record
+
+
+def get_radiation_variables_for_range(start, end, step, location, slope_angle=0, slope_azimuth=0,
+                                      clouds=Clouds(0, 0, 0), albedo=0):
+    """
+    Like get_radiation_variables_series, for the times from start (inclusive) to end (exclusive) every step. Naive
+    start and end are in location.timezone, as in ephemeris_cache.get_clear_sky_radiation.
+
+    :return: (times, radiation variables)
+    :rtype: (pd.DatetimeIndex, dict)
+    """
+    times = make_date_time_range(start, end, step, timezone=location.timezone)
+    return times, get_radiation_variables_series(times, location, slope_angle, slope_azimuth, clouds, albedo)
+
+
+def calc_radiation_variables(julian_day, hour_fraction, latitude, longitude, slope_angle, slope_azimuth, clouds,
+                             albedo, fields=None):
+    """
+    Calculates the radiation variables from the day of the year and UTC hour. All angles are in radians. Arguments
+    may be scalars or np.arrays of any shapes that broadcast against each other.
+
+    Pass fields to only get those variables. Intermediates that aren't needed for them are skipped, e.g. the solar
+    azimuth when the surface is flat.
+    """
+    if fields is None:
+        fields = radiation_fields + debug_fields
+    unknown = set(fields) - set(radiation_fields + debug_fields)
+    if unknown:
+        raise ex.InvalidArgumentError("Unrecognized radiation fields: " + ", ".join(sorted(unknown)))
+
+    radiation_variables = dict()
     radiation_variables["hour_fraction"] = hour_fraction
 
-    solar_declination = get_solar_declination_angle(struct_time)
+    solar_declination = get_solar_declination_angle_for_day(julian_day)
     radiation_variables["solar_declination"] = solar_declination
 
     elevation_angle = get_elevation_angle(hour_fraction, latitude, longitude, solar_declination)
@@ -33,15 +116,20 @@ def get_radiation_variables(date_time, location, slope_angle=0, slope_azimuth=0,
     zenith_angle = to_zenith_angle(elevation_angle)
     radiation_variables["zenith_angle"] = zenith_angle
 
-    local_solar_time = get_local_apparent_solar_time(hour_fraction, longitude)
-    radiation_variables["local_solar_time"] = local_solar_time
+    is_flat = not np.any(slope_angle)
+    if not is_flat or {"local_solar_time", "solar_azimuth"} & set(fields):
+        local_solar_time = get_local_apparent_solar_time(hour_fraction, longitude)
+        radiation_variables["local_solar_time"] = local_solar_time
 
-    solar_azimuth = get_solar_azimuth_angle(latitude, solar_declination, zenith_angle,
-                                            local_solar_time)
-    radiation_variables["solar_azimuth"] = solar_azimuth
+        solar_azimuth = get_solar_azimuth_angle(latitude, solar_declination, zenith_angle,
+                                                local_solar_time)
+        radiation_variables["solar_azimuth"] = solar_azimuth
 
-    angle_of_incidence = get_angle_of_incidence_of_solar_radiation(slope_angle, slope_azimuth, solar_azimuth,
-                                                                   zenith_angle)
+    if is_flat:
+        angle_of_incidence = zenith_angle  # what get_angle_of_incidence_of_solar_radiation reduces to
+    else:
+        angle_of_incidence = get_angle_of_incidence_of_solar_radiation(slope_angle, slope_azimuth, solar_azimuth,
+                                                                       zenith_angle)
     radiation_variables["angle_of_incidence"] = angle_of_incidence
 
     flux_at_angle = get_flux_at_angle(S_0, angle_of_incidence)
@@ -52,7 +140,7 @@ def get_radiation_variables(date_time, location, slope_angle=0, slope_azimuth=0,
     radiation_variables["flux_debug_3_angle_clouds_and_albedo"] = flux_with_albedo
     radiation_variables["flux"] = flux_with_albedo
 
-    return radiation_variables
+    return {name: radiation_variables[name] for name in fields}
 
 
 def get_utc_timetuple(date_time):
@@ -65,9 +153,8 @@ def get_utc_timetuple(date_time):
 
 
 def get_flux_at_angle(perpendicular_flux, angle_of_incidence):
-    if cos(angle_of_incidence) < 0:
-        return 0
-    return perpendicular_flux * cos(angle_of_incidence)
+    cos_angle = np.cos(angle_of_incidence)
+    return np.where(cos_angle < 0, 0, perpendicular_flux * cos_angle)
 
 
 def get_flux_with_clouds(flux, clouds, elevation_angle):
@@ -76,15 +163,13 @@ def get_flux_with_clouds(flux, clouds, elevation_angle):
 
 
 def get_transmissivity(clouds, elevation_angle):
-    return (0.6 + .2*sin(elevation_angle))*(1-.4*clouds.high)*(1-.7*clouds.medium)*(1-.4*clouds.low)
+    return (0.6 + .2*np.sin(elevation_angle))*(1-.4*clouds.high)*(1-.7*clouds.medium)*(1-.4*clouds.low)
 
 
 def get_angle_of_incidence_of_solar_radiation(slope_angle, slope_azimuth, solar_azimuth, zenith_angle):
-    if cos(zenith_angle) < 0:
-        return zenith_angle
-    return acos(
-        cos(slope_angle) * cos(zenith_angle) +
-        sin(slope_angle) * sin(zenith_angle) * cos(solar_azimuth - slope_azimuth))
+    cos_incidence = (np.cos(slope_angle) * np.cos(zenith_angle) +
+                     np.sin(slope_angle) * np.sin(zenith_angle) * np.cos(solar_azimuth - slope_azimuth))
+    return np.where(np.cos(zenith_angle) < 0, zenith_angle, np.arccos(np.clip(cos_incidence, -1, 1)))
 
 
 def get_local_apparent_solar_time(hour_fraction, longitude):
@@ -94,16 +179,11 @@ def get_local_apparent_solar_time(hour_fraction, longitude):
 
 def get_solar_azimuth_angle(latitude, solar_declination, zenith_angle, local_apparent_solar_time):
     h = C/24 * (12-local_apparent_solar_time)
-    cos_alpha = (sin(solar_declination) * cos(latitude) -
-                  cos(solar_declination) * sin(latitude)) * cos(h) / sin(zenith_angle)
-    if cos_alpha > 1:
-        cos_alpha = 1
-    if cos_alpha < -1:
-        cos_alpha = -1
-    alpha = acos(cos_alpha)
-    if local_apparent_solar_time > 12:
-        alpha = C - alpha
-    return alpha
+    with np.errstate(divide="ignore", invalid="ignore"):  # the sun is directly overhead, the clip handles it
+        cos_alpha = (np.sin(solar_declination) * np.cos(latitude) -
+                     np.cos(solar_declination) * np.sin(latitude)) * np.cos(h) / np.sin(zenith_angle)
+    alpha = np.arccos(np.clip(cos_alpha, -1, 1))
+    return np.where(local_apparent_solar_time > 12, C - alpha, alpha)
 
 
 def to_zenith_angle(elevation_angle):
@@ -111,14 +191,17 @@ def to_zenith_angle(elevation_angle):
 
 
 def get_elevation_angle(hour_fraction, latitude, longitude, solar_declination):
-    return asin(
-        sin(latitude) * sin(solar_declination) -
-        cos(latitude) * cos(solar_declination) * cos(C * hour_fraction / 24 - longitude))
+    return np.arcsin(
+        np.sin(latitude) * np.sin(solar_declination) -
+        np.cos(latitude) * np.cos(solar_declination) * np.cos(C * hour_fraction / 24 - longitude))
 
 
 def get_solar_declination_angle(struct_time):
-    julian_day = get_julian_day(struct_time)
-    return .409*cos(C * (julian_day - 173) / 365)
+    return get_solar_declination_angle_for_day(get_julian_day(struct_time))
+
+
+def get_solar_declination_angle_for_day(julian_day):
+    return .409*np.cos(C * (julian_day - 173) / 365)
 
 
 # Python calls this the yearday, some sources use day of year, but Stull calls it the Julian day
@@ -126,5 +209,15 @@ def get_julian_day(struct_time):
     return struct_time.tm_yday
 
 
+def get_julian_day_array(utc_times):
+    return (utc_times.astype("datetime64[D]") - utc_times.astype("datetime64[Y]")).astype(np.int64) + 1
+
+
 def get_hour_float(struct_time):
     return struct_time.tm_hour + struct_time.tm_min / 60.
+
+
+def get_hour_float_array(utc_times):
+    # Truncated to the minute, like get_hour_float
+    minutes = (utc_times - utc_times.astype("datetime64[D]")).astype("timedelta64[m]").astype(np.int64)
+    return minutes / 60.
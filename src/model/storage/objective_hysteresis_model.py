@@ -1,6 +1,8 @@
-import pandas as pd
 import numpy as np
+import pandas as pd
 import util.exceptions as ex
+from util.time_util import to_utc_datetime64
+import util.instrumentation as instrumentation
 
 
 def storage_heat_flux(config, net_forcing, d_net_forcing_d_t=None, time=None):
@@ -8,7 +10,7 @@ def storage_heat_flux(config, net_forcing, d_net_forcing_d_t=None, time=None):
     return calculate_storage_heat_flux(materials, net_forcing, d_net_forcing_d_t=d_net_forcing_d_t, time=time)
 
 
-def calculate_storage_heat_flux(materials, net_forcing, d_net_forcing_d_t=None, time=None):
+def calculate_storage_heat_flux(materials, net_forcing, d_net_forcing_d_t=None, time=None, max_gap=None):
     """
     Estimates the heat storage term of the surface energy balance equation as a partition of Q* (net shortwave and
     infrared radiation) with a hysteresis effect. Pass either d_net_forcing_d_t (rate of change of flux corresponding to
@@ -26,18 +28,58 @@ def calculate_storage_heat_flux(materials, net_forcing, d_net_forcing_d_t=None,
     :type d_net_forcing_d_t: np.array
     :param time: np.array of np.datetime64, array of times for each net_forcing value
     :type time: np.array
+    :param max_gap: when using time, the longest spacing to take the rate of change across, see get_rate_of_change
     :return: np.array of float, estimated delta_Q_s (heat storage) at each time
     :rtype: np.array
     """
 
+    return calculate_storage_heat_flux_from_coefficients(get_weighted_coefficients(materials), net_forcing,
+                                                         d_net_forcing_d_t, time, max_gap)
+
+
+@instrumentation.timed("ohm")
+def calculate_storage_heat_flux_from_coefficients(coefficients, net_forcing, d_net_forcing_d_t=None, time=None,
+                                                  max_gap=None):
+    """
+    calculate_storage_heat_flux for the (a1, a2, a3) of the whole area, see get_weighted_coefficients.
+    """
+    if time is None and d_net_forcing_d_t is None:
+        raise ex.InvalidArgumentError("Must provide either time or d_net_forcing_d_t")
+
+    if d_net_forcing_d_t is None:
+        d_net_forcing_d_t = get_rate_of_change(net_forcing, time, max_gap)
+
+    a1, a2, a3 = coefficients
+    return a1*np.asarray(net_forcing, dtype=float) + a2*np.asarray(d_net_forcing_d_t, dtype=float) + a3
+
+
+@instrumentation.timed("ohm")
+def calculate_storage_heat_flux_batch(coefficients, net_forcing, d_net_forcing_d_t=None, time=None, max_gap=None):
+    """
+    Evaluates the Objective Hysteresis Model for K sets of coefficients at once, e.g. every point of a tuning grid.
+
+    :param coefficients: array of shape (K, 3), the (a1, a2, a3) of each set. Use get_weighted_coefficients to turn a
+        materials dataframe into one set.
+    :type coefficients: np.array
+    :param net_forcing: np.array of float, Q* estimates ordered by time (length N)
+    :type net_forcing: np.array
+    :param d_net_forcing_d_t: np.array of float, time rate of change co-indexed with net_forcing
+    :type d_net_forcing_d_t: np.array
+    :param time: np.array of np.datetime64, array of times for each net_forcing value
+    :type time: np.array
+    :param max_gap: when using time, the longest spacing to take the rate of change across, see get_rate_of_change
+    :return: np.array of float with shape (K, N), estimated delta_Q_s for each coefficient set at each time
+    :rtype: np.array
+    """
     if time is None and d_net_forcing_d_t is None:
         raise ex.InvalidArgumentError("Must provide either time or d_net_forcing_d_t")
 
-    if not d_net_forcing_d_t:
-        d_net_forcing_d_t = get_rate_of_change(net_forcing, time)
+    if d_net_forcing_d_t is None:
+        d_net_forcing_d_t = get_rate_of_change(net_forcing, time, max_gap)
 
-    array_estimate_storage = np.vectorize(estimate_storage, excluded=[2])
-    return array_estimate_storage(net_forcing, d_net_forcing_d_t, materials)
+    coefficients = np.asarray(coefficients, dtype=float).reshape(-1, 3)
+    terms = np.vstack([net_forcing, d_net_forcing_d_t, np.ones(len(net_forcing))])  # (3, N)
+    return coefficients @ terms
 
 
 def estimate_storage(net_forcing, d_net_forcing_d_t, materials):
@@ -51,20 +93,149 @@ def estimate_storage(net_forcing, d_net_forcing_d_t, materials):
     :param materials: materials dataframe from calculate_storage_heat_flux
     :type materials: pd.DataFrame
     """
-    normalization_factor = materials["Fraction"].sum()
+    a1, a2, a3 = get_weighted_coefficients(materials)
+    return a1*net_forcing + a2*d_net_forcing_d_t + a3
+
+
+def get_weighted_coefficients(materials):
+    """
+    Collapses the materials into the single (a1, a2, a3) of the whole area, each material weighted by its coverage
+    fraction.
+
+    :param materials: materials dataframe from calculate_storage_heat_flux
+    :type materials: pd.DataFrame
+    :return: (a1, a2, a3)
+    :rtype: (float, float, float)
+    """
+    fractions = materials["Fraction"].to_numpy(dtype=float)
     # We don't want to assume the fractions add up to 1 since the material type of the whole area might not be known
+    weight = fractions/fractions.sum()
+    return tuple(float(weight @ materials[column].to_numpy(dtype=float)) for column in ["a1", "a2", "a3"])
 
-    weight = materials["Fraction"]/normalization_factor
-    components = weight*(materials["a1"]*net_forcing + materials["a2"]*d_net_forcing_d_t + materials["a3"])
-    estimate = components.sum()
-    return estimate
 
+def get_coefficient_grid(a1_values, a2_values, a3_values):
+    """
+    Every combination of the given coefficient values, as the (K, 3) coefficients of
+    calculate_storage_heat_flux_batch. a1 varies slowest and a3 fastest, like nested loops.
+    """
+    grid = np.meshgrid(a1_values, a2_values, a3_values, indexing="ij")
+    return np.stack([values.ravel() for values in grid], axis=1)
+
+
+def get_rate_of_change(net_forcing, time, max_gap=None):
+    """
+    Time rate of change of Q* in W/m^2/h. Each sample gets the slope between its neighbors, (Q*_i+1 - Q*_i-1) /
+    (t_i+1 - t_i-1), which holds for irregularly spaced samples too. The first and last samples of a run use a one-sided
+    difference.
 
-def get_rate_of_change(net_forcing, time):
-    array_to_hours = np.vectorize(to_hours)
-    time_delta = array_to_hours(get_delta(time))
-    forcing_delta = get_delta(net_forcing)
-    return forcing_delta/time_delta
+    NaN samples (in either array) are skipped: they get a NaN rate and their neighbors use the nearest valid samples
+    instead. Where two valid samples are more than max_gap apart, the series is split there so nothing is
+    differenced across the gap.
+
+    :param net_forcing: np.array of float, Q* ordered by time
+    :type net_forcing: np.array
+    :param time: times of each net_forcing value (np.datetime64, or anything util.time_util.to_utc_datetime64 takes)
+    :type time: np.array
+    :param max_gap: longest spacing to difference across, e.g. "2h"; None never splits the series
+    :return: np.array of float, dQ*/dt co-indexed with net_forcing
+    :rtype: np.array
+    """
+    net_forcing = np.asarray(net_forcing, dtype=float)
+    time = to_utc_datetime64(time)
+    return _rate_of_change(net_forcing, get_hours(time), get_max_gap_hours(max_gap))
+
+
+def get_rate_of_change_chunked(net_forcing, time, max_gap=None, chunk_size=2**22, out=None):
+    """
+    get_rate_of_change for series too long to convert in one go, such as np.memmap arrays of multi-year records. Only
+    one chunk (plus the nearest valid sample on each side) is read into memory at a time.
+
+    :param time: np.array of UTC np.datetime64
+    :param chunk_size: number of samples per chunk
+    :type chunk_size: int
+    :param out: optional preallocated array (e.g. an np.memmap) to write the rates into
+    :type out: np.array
+    :return: np.array of float, dQ*/dt co-indexed with net_forcing
+    :rtype: np.array
+    """
+    length = len(net_forcing)
+    if out is None:
+        out = np.empty(length)
+    max_gap_hours = get_max_gap_hours(max_gap)
+    for start in range(0, length, chunk_size):
+        stop = min(start + chunk_size, length)
+        before = find_valid_sample(net_forcing, time, start - 1, -1, chunk_size)
+        after = find_valid_sample(net_forcing, time, stop, 1, chunk_size)
+        indexes = np.arange(start, stop)
+        if before is not None:
+            indexes = np.hstack([before, indexes])
+        if after is not None:
+            indexes = np.hstack([indexes, after])
+        window_forcing = np.asarray(net_forcing[indexes], dtype=float)
+        window_time = np.asarray(time[indexes], dtype="datetime64[ns]")
+        rate = _rate_of_change(window_forcing, get_hours(window_time), max_gap_hours)
+        offset = 0 if before is None else 1
+        out[start:stop] = rate[offset:offset + stop - start]
+    return out
+
+
+def _rate_of_change(net_forcing, hours, max_gap_hours):
+    rate = np.full(len(net_forcing), np.nan)
+    valid = np.flatnonzero(~np.isnan(net_forcing) & ~np.isnan(hours))
+    if len(valid) == 0:
+        return rate
+    valid_forcing = net_forcing[valid]
+    valid_hours = hours[valid]
+
+    # Each valid sample's neighbors, falling back to the sample itself at the ends of a run
+    previous = np.arange(-1, len(valid) - 1)
+    following = np.arange(1, len(valid) + 1)
+    run_starts = np.zeros(len(valid), dtype=bool)
+    run_starts[0] = True
+    if max_gap_hours is not None:
+        run_starts[1:] = np.diff(valid_hours) > max_gap_hours
+    run_ends = np.roll(run_starts, -1)
+    run_ends[-1] = True
+    previous[run_starts] = np.flatnonzero(run_starts)
+    following[run_ends] = np.flatnonzero(run_ends)
+
+    # A one-sample run has no rate of change, its 0/0 is NaN
+    single = run_starts & run_ends
+    forcing_delta = valid_forcing[following] - valid_forcing[previous]
+    time_delta = valid_hours[following] - valid_hours[previous]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate[valid] = forcing_delta/time_delta
+    rate[valid[single]] = np.nan
+    return rate
+
+
+def find_valid_sample(net_forcing, time, index, direction, block_size):
+    # Nearest index from index on (inclusive, going in direction) where neither array is missing
+    length = len(net_forcing)
+    while 0 <= index < length:
+        end = index + direction*block_size
+        indexes = np.arange(index, end, direction)
+        indexes = indexes[(indexes >= 0) & (indexes < length)]
+        forcing = np.asarray(net_forcing[indexes], dtype=float)
+        times = np.asarray(time[indexes], dtype="datetime64[ns]")
+        found = np.flatnonzero(~np.isnan(forcing) & ~np.isnat(times))
+        if len(found):
+            return indexes[found[0]]
+        index = end
+    return None
+
+
+def get_hours(time):
+    # Hours since the first known time, NaN where the time is missing
+    known = np.flatnonzero(~np.isnat(time))
+    origin = time[known[0]] if len(known) else np.datetime64(0, "ns")
+    return to_hours(time - origin)
+
+
+def get_max_gap_hours(max_gap):
+    if max_gap is None:
+        return None
+    return pd.Timedelta(max_gap)/pd.Timedelta(hours=1)
 
 
 def to_hours(time_delta):
@@ -0,0 +1,108 @@
+import numpy as np
+
+import model.storage.objective_hysteresis_model as ohm
+import util.exceptions as ex
+from util.time_util import to_utc_datetime64
+
+schemes = ("backward", "centered")
+
+
+class StreamingStorageEstimator:
+    """
+    Objective Hysteresis Model storage for (time, Q*) samples that arrive one at a time or in small batches, e.g. from
+    a station feed. Only the last two samples are kept between calls.
+
+    The scheme sets how dQ*/dt is estimated:
+        "backward" - (Q*_i - Q*_i-1)/(t_i - t_i-1). Each sample is emitted as soon as it arrives. The first sample has
+            no rate of change, so its storage is NaN.
+        "centered" - (Q*_i+1 - Q*_i-1)/(t_i+1 - t_i-1), the same estimate calculate_storage_heat_flux uses. Each
+            sample is emitted once the next one arrives; call flush() after the last sample to emit it. The emitted
+            series matches calculate_storage_heat_flux over the whole series.
+    """
+
+    def __init__(self, coefficients, scheme="centered"):
+        """
+        :param coefficients: (a1, a2, a3), see objective_hysteresis_model.get_weighted_coefficients
+        :type coefficients: (float, float, float)
+        :param scheme: "backward" or "centered"
+        :type scheme: str
+        """
+        if scheme not in schemes:
+            raise ex.InvalidArgumentError("Unrecognized derivative scheme: " + str(scheme))
+        self.coefficients = np.asarray(coefficients, dtype=float)
+        self.scheme = scheme
+        self.times = np.array([], dtype="datetime64[ns]")
+        self.net_forcing = np.array([], dtype=float)
+        self.pending = False  # whether the last sample kept still has to be emitted
+
+    @classmethod
+    def from_materials(cls, materials, scheme="centered"):
+        return cls(ohm.get_weighted_coefficients(materials), scheme)
+
+    def update(self, time, net_forcing):
+        """
+        Adds one sample.
+
+        :return: (times, storage) emitted by this sample, see update_many
+        :rtype: (np.array, np.array)
+        """
+        return self.update_many([time], [net_forcing])
+
+    def update_many(self, times, net_forcing):
+        """
+        Adds samples, which must come after every sample already added.
+
+        :param times: times of the samples; timezone-aware times are converted to UTC
+        :param net_forcing: Q* of the samples
+        :return: (times, storage) of the samples that are now complete, as np.arrays of UTC np.datetime64 and float
+        :rtype: (np.array, np.array)
+        """
+        new_times = to_utc_datetime64(times)
+        new_net_forcing = np.asarray(net_forcing, dtype=float)
+        if len(new_times) == 0:
+            return new_times, new_net_forcing
+        all_times = np.concatenate([self.times, new_times])
+        all_net_forcing = np.concatenate([self.net_forcing, new_net_forcing])
+        is_stream_start = len(self.times) == 0
+
+        if self.scheme == "backward":
+            emit = np.arange(len(self.times), len(all_times))
+            rate = get_rate(all_net_forcing, all_times, emit - 1, emit)
+            if is_stream_start:
+                rate[0] = np.nan
+            self.pending = False
+        else:
+            emit = np.arange(len(self.times) - 1 if self.pending else len(self.times), len(all_times) - 1)
+            # The first sample of the stream has no previous one, so it gets a forward difference
+            previous = np.maximum(emit - 1, 0)
+            rate = get_rate(all_net_forcing, all_times, previous, emit + 1)
+            self.pending = True
+
+        self.times = all_times[-2:]
+        self.net_forcing = all_net_forcing[-2:]
+        return all_times[emit], self.estimate(all_net_forcing[emit], rate)
+
+    def flush(self):
+        """
+        Emits the last sample of a centered stream with a backward difference, like the end of
+        calculate_storage_heat_flux. Does nothing for a backward stream.
+
+        :return: (times, storage), see update_many
+        :rtype: (np.array, np.array)
+        """
+        if not self.pending:
+            return np.array([], dtype="datetime64[ns]"), np.array([], dtype=float)
+        self.pending = False
+        last = len(self.times) - 1
+        rate = get_rate(self.net_forcing, self.times, np.array([max(last - 1, 0)]), np.array([last]))
+        return self.times[[last]], self.estimate(self.net_forcing[[last]], rate)
+
+    def estimate(self, net_forcing, d_net_forcing_d_t):
+        a1, a2, a3 = self.coefficients
+        return a1*net_forcing + a2*d_net_forcing_d_t + a3
+
+
+def get_rate(net_forcing, times, start, end):
+    hours = (times[end] - times[start])/np.timedelta64(1, 'h')
+    with np.errstate(divide="ignore", invalid="ignore"):  # a lone sample has no rate of change
+        return (net_forcing[end] - net_forcing[start])/hours
@@ -1,12 +1,29 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import data.murray_data_loader as data_loader
+import model.penman_monteith.penman_monteith as penman_monteith
 import model.penman_monteith.tuning.learn_parameters as pm
+import model.storage.objective_hysteresis_model as ohm
 import pandas as pd
 import numpy as np
 from model import lumps
+from model.storage.residual import set_residual
+import util.instrumentation as instrumentation
+import util.search as search
+from util.exceptions import ConfigValueNotRecognized
 
 # Given that the penman-monteith equations partition Q_E and Q_H perfectly when given the residual,
 # it would've made more sense to fit the OHM coefficients against the residual directly instead of
 # doing all this.
 
+# Observations for evaluating materials coefficients, co-indexed np.arrays of float. net_radiation includes the
+# modeled longwave and d_net_radiation_d_t is in W/m^2/h.
+Observations = namedtuple("Observations", ["net_radiation", "d_net_radiation_d_t", "temp", "pressure", "latent_heat",
+                                           "sensible_heat", "residual"])
+
 def get_best_model_output(config):
     iterations = config.experiment["tuning_iterations"]
 
@@ -14,19 +31,18 @@ def get_best_model_output(config):
     best_params = None
     best_materials_coefficients = None
     best_penman_monteith_params = None
+    progress = instrumentation.Progress("Materials tuning iterations", total=iterations, interval=0)
     for i in range(0, iterations):
         best_params = (best_materials_coefficients, best_penman_monteith_params)
-        print("....Starting iteration " + str(i) + "....\n\n\n")
         config.set_output_dir(config.output_dir / str(i))
         config.penman_monteith_params["disabled"] = True
         best_materials_coefficients = get_best_materials_coefficients(config)
         config.penman_monteith_params.pop("disabled")
         set_materials(config, best_materials_coefficients)
         best_penman_monteith_params, error = get_best_penman_monteith_params(config)
-        print("....Iteration " + str(i) + " error: " + str(error) + "....\n\n\n")
         config.penman_monteith_params.update(best_penman_monteith_params)
-        print(str(config.surface_data))
-        print(str(config.penman_monteith_params))
+        progress.update(error=error, a1=best_materials_coefficients[0], a2=best_materials_coefficients[1],
+                        a3=best_materials_coefficients[2], **best_penman_monteith_params)
         config.set_output_dir(config.output_dir.parent)
         done = False
         if errors and not error < errors[-1]:
@@ -59,23 +75,133 @@ def write_best(config, best_materials_coefficients, best_penman_monteith_params,
 
 def get_best_materials_coefficients(config):
     params = config.experiment["surface_materials_tuning_params"]
-    errors = pd.DataFrame(columns=["a1", "a2", "a3", "error"])
-    for a1 in get_parameter_space(params["a1"]):
-        print("\ta1")
-        for a2 in get_parameter_space(params["a2"]):
-            print("\t\ta2")
-            for a3 in get_parameter_space(params["a3"]):
-                print("\t\t\ta3")
-                set_materials(config, [a1, a2, a3])
-                model_output = lumps.get_model_output(config)
-                error = pm.calculate_normalized_squared_error(model_output["latent_heat"],
-                                                      model_output["sensible_heat"],
-                                                      model_output["model_latent"],
-                                                      model_output["model_sensible"])
-                errors.loc[len(errors.index)] = [a1, a2, a3, error]
-                print(errors.iloc[-1])
-    min = errors[errors["error"] == errors["error"].min()].iloc[0]
-    return [min["a1"], min["a2"], min["a3"]]
+    names = ["a1", "a2", "a3"]
+    observations = get_observations(config)
+    alpha = config.penman_monteith_params["alpha"]
+    beta = config.penman_monteith_params["beta"]
+    storage_source = lumps.get_storage_column(config)
+
+    def evaluate(grid):
+        return get_coefficient_errors(grid, observations, alpha, beta, storage_source,
+                                      processes=params.get("processes", 1))
+
+    options = search.get_refine_options(params)
+    evaluate, known = pm.journal_evaluations(config, evaluate, options.pop("warm_start", False),
+                                             model="ohm_materials_coefficients", data=np.stack(observations),
+                                             alpha=alpha, beta=beta, storage_source=storage_source)
+    method = params.get("method", "grid")
+    if method == "grid":
+        grid = ohm.get_coefficient_grid(*[get_parameter_space(params[name]) for name in names])
+        errors = evaluate(grid)
+    elif method == "refine":
+        grid, errors = search.refine_grid(evaluate, [params[name]["range"] for name in names],
+                                          [params[name]["number"] for name in names], initial=known, **options)
+    else:
+        raise ConfigValueNotRecognized("Unrecognized materials coefficients tuning method: " + str(method))
+    return list(grid[search.get_best_index(errors)])
+
+
+def get_observations(config):
+    """
+    What evaluating materials coefficients needs from the observations, with the experiment's longwave model applied.
+
+    :return: one co-indexed np.array per field
+    :rtype: Observations
+    """
+    data = data_loader.get_energy_balance_data(config.radiation_alignment, config.site)
+    if config.longwave_model:
+        lumps.estimate_longwave(config, data)
+    net_radiation = data["net_radiation"].to_numpy()
+    set_residual(data)
+    return Observations(
+        net_radiation=net_radiation,
+        d_net_radiation_d_t=ohm.get_rate_of_change(net_radiation, data["time"].to_numpy()),
+        temp=data["temp"].to_numpy(),
+        pressure=data["pressure"].to_numpy(),
+        latent_heat=data["latent_heat"].to_numpy(),
+        sensible_heat=data["sensible_heat"].to_numpy(),
+        residual=data["residual"].to_numpy())
+
+
+def get_coefficient_errors(coefficients, observations, alpha, beta, storage_source="storage", processes=1,
+                           max_elements=2**22):
+    """
+    Average normalized squared error of the model for each set of OHM coefficients, with Penman-Monteith's alpha and
+    beta fixed. Nothing is read from or written to a Config, so the sets can be spread across a process pool: the
+    observations are put in shared memory once, each worker evaluates blocks of sets with the batched storage and
+    Penman-Monteith calculations, and the errors are written into one preallocated array.
+
+    :param coefficients: array of shape (K, 3), the (a1, a2, a3) of each set, e.g. from
+        objective_hysteresis_model.get_coefficient_grid
+    :type coefficients: np.array
+    :type observations: Observations
+    :param storage_source: "storage" to partition with the modeled storage, "residual" for the observed residual
+    :param processes: number of worker processes; None uses every core, 1 runs in this process
+    :type processes: int
+    :param max_elements: largest (sets x times) block to evaluate at once
+    :type max_elements: int
+    :return: np.array of shape (K,)
+    :rtype: np.array
+    """
+    coefficients = np.asarray(coefficients, dtype=float).reshape(-1, 3)
+    errors = np.empty(len(coefficients))
+    block = max(1, max_elements // max(1, len(observations.net_radiation)))
+    blocks = [(start, min(start + block, len(coefficients))) for start in range(0, len(coefficients), block)]
+    progress = instrumentation.Progress("Coefficient sets evaluated", total=len(coefficients))
+    if processes == 1 or len(blocks) == 1:
+        for start, stop in blocks:
+            errors[start:stop] = evaluate_coefficients(coefficients[start:stop], observations, alpha, beta,
+                                                       storage_source)
+            progress.update(stop - start)
+        progress.close()
+        return errors
+
+    stacked = np.stack(observations)
+    shared = shared_memory.SharedMemory(create=True, size=stacked.nbytes)
+    try:
+        np.ndarray(stacked.shape, dtype=stacked.dtype, buffer=shared.buf)[:] = stacked
+        with ProcessPoolExecutor(max_workers=processes or os.cpu_count(), initializer=attach_observations,
+                                 initargs=(shared.name, stacked.shape)) as executor:
+            tasks = [(coefficients[start:stop], alpha, beta, storage_source) for start, stop in blocks]
+            for (start, stop), block_errors in zip(blocks, executor.map(evaluate_shared, tasks)):
+                errors[start:stop] = block_errors
+                progress.update(stop - start)
+        progress.close()
+    finally:
+        shared.close()
+        shared.unlink()
+    return errors
+
+
+@instrumentation.timed("error")
+def evaluate_coefficients(coefficients, observations, alpha, beta, storage_source="storage"):
+    if storage_source == "residual":
+        storage = observations.residual
+    else:
+        storage = ohm.calculate_storage_heat_flux_batch(coefficients, observations.net_radiation,
+                                                        d_net_forcing_d_t=observations.d_net_radiation_d_t)
+    estimate_sensible, estimate_latent = penman_monteith.calc_sensible_and_latent_heat(
+        alpha, beta, observations.net_radiation, storage, observations.temp, observations.pressure)
+    latent_stats = pm._get_statistical_vars(pd.Series(observations.latent_heat))
+    sensible_stats = pm._get_statistical_vars(pd.Series(observations.sensible_heat))
+    error_by_row = pm.average_error_by_row(observations.latent_heat, observations.sensible_heat, estimate_latent,
+                                           estimate_sensible, latent_stats, sensible_stats)
+    return np.broadcast_to(pm.average_rows(error_by_row), (len(coefficients),))
+
+
+_worker_observations = None
+
+
+def attach_observations(name, shape):
+    global _worker_observations
+    shared = shared_memory.SharedMemory(name=name)
+    # The views keep the buffer alive, so keep the SharedMemory too until the worker exits
+    _worker_observations = (shared, Observations(*np.ndarray(shape, dtype=float, buffer=shared.buf)))
+
+
+def evaluate_shared(task):
+    coefficients, alpha, beta, storage_source = task
+    return evaluate_coefficients(coefficients, _worker_observations[1], alpha, beta, storage_source)
 
 
 def get_parameter_space(param):
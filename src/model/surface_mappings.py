@@ -0,0 +1,143 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import model.penman_monteith.penman_monteith as penman_monteith
+import model.pipeline as pipeline
+import model.storage.objective_hysteresis_model as ohm
+import util.instrumentation as instrumentation
+import util.search as search
+from model.storage.residual import set_residual
+from model.penman_monteith.tuning import learn_parameters
+from util.exceptions import ConfigValueNotRecognized
+
+# table has a row per mapping: its (a1, a2, a3), alpha, beta and ANSE. storage, sensible and latent have a column
+# per mapping, co-indexed with the observations.
+Comparison = namedtuple("Comparison", ["table", "storage", "sensible", "latent"])
+
+
+def compare_mappings(config, mapping_names=None):
+    """
+    Runs the model for many surface materials mappings in one pass. The mappings are compiled into a stacked
+    (mappings, 3) coefficient matrix, and storage, Penman-Monteith and the error are evaluated as (mappings, time)
+    arrays, so the observations are loaded and prepared once rather than once per mapping. With tuning_params, alpha
+    and beta are tuned for each mapping, see tune_mappings.
+
+    :type config: experiments.config.config.Config
+    :param mapping_names: names of mappings in surface_materials; defaults to all of them
+    :rtype: Comparison
+    """
+    if mapping_names is None:
+        mapping_names = config.get_mapping_names()
+    coefficients = get_mapping_coefficients(config.get_surface_data(mapping_names), mapping_names)
+    storage_column = pipeline.get_storage_column(config)
+
+    params = config.penman_monteith_params
+    if "tuning_params" in params and "disabled" not in params:
+        alpha, beta = tune_mappings(config, coefficients, storage_column)
+    else:
+        alpha, beta = np.full(len(coefficients), params["alpha"]), np.full(len(coefficients), params["beta"])
+
+    data = get_observations(config)
+    storage = get_storage(data, coefficients)
+    sensible, latent, errors = get_fluxes_and_errors(get_error_terms(data, storage, storage_column),
+                                                     alpha[:, np.newaxis], beta[:, np.newaxis])
+
+    table = pd.DataFrame({"a1": coefficients[:, 0], "a2": coefficients[:, 1], "a3": coefficients[:, 2],
+                          "alpha": alpha, "beta": beta, "anse": errors},
+                         index=pd.Index(mapping_names, name="mapping"))
+    index = data["time"]
+    return Comparison(table, *[pd.DataFrame(values.T, index=index, columns=table.index)
+                               for values in [storage, sensible, latent]])
+
+
+def get_mapping_coefficients(surface_data, mapping_names):
+    """
+    The coverage-weighted (a1, a2, a3) of each mapping, like ohm.get_weighted_coefficients for each one's materials.
+
+    :param surface_data: stacked materials, see Config.get_surface_data
+    :type surface_data: pd.DataFrame
+    :return: array of shape (len(mapping_names), 3), in the order of mapping_names
+    :rtype: np.array
+    """
+    mappings = surface_data["Mapping"]
+    fractions = surface_data["Fraction"].astype(float)
+    weights = fractions/fractions.groupby(mappings).transform("sum")
+    weighted = surface_data[["a1", "a2", "a3"]].astype(float).mul(weights, axis=0)
+    return weighted.groupby(mappings).sum().reindex(mapping_names).to_numpy()
+
+
+def tune_mappings(config, coefficients, storage_column="storage"):
+    """
+    Tunes alpha and beta for every mapping at once, against the same observations as learn_parameters.auto_tune. The
+    grid method evaluates the whole (mappings, grid points, time) tensor; least_squares solves each mapping exactly.
+
+    :param coefficients: array of shape (mappings, 3)
+    :return: (alpha, beta), arrays of shape (mappings,)
+    :rtype: (np.array, np.array)
+    """
+    params = config.penman_monteith_params["tuning_params"]
+    alpha_range, beta_range = params["alpha"], params["beta"]
+    method = params.get("method", "grid")
+    data = get_observations(config, longwave={"model": None})  # like learn_parameters.get_observations
+    storage = get_storage(data, coefficients)
+
+    if method == "least_squares":
+        best = [learn_parameters.fit_least_squares(
+            data.assign(storage=mapping_storage) if storage_column == "storage" else data, storage_column,
+            alpha_range, beta_range) for mapping_storage in storage]
+        return np.array([alpha for alpha, _, _ in best]), np.array([beta for _, beta, _ in best])
+    if method != "grid":
+        raise ConfigValueNotRecognized("Mappings are compared with grid or least_squares tuning, not " + str(method))
+
+    number = params.get("number")
+    points = search.get_grid([alpha_range[0], beta_range[0]], [alpha_range[1], beta_range[1]], [number, number])
+    terms = get_error_terms(data, storage[:, np.newaxis, :], storage_column)  # (mappings, grid points, time)
+    _, _, errors = get_fluxes_and_errors(terms, points[np.newaxis, :, 0, np.newaxis],
+                                         points[np.newaxis, :, 1, np.newaxis])
+    best = np.argmin(np.broadcast_to(errors, (len(coefficients), len(points))), axis=1)
+    return points[best, 0], points[best, 1]
+
+
+def get_observations(config, **overrides):
+    # The radiation as the storage stage would get it, with the residual, which doesn't depend on the materials
+    data = pipeline.run(config, "longwave", **overrides)
+    set_residual(data)
+    return data
+
+
+def get_storage(data, coefficients):
+    return ohm.calculate_storage_heat_flux_batch(coefficients, data["net_radiation"].to_numpy(),
+                                                 time=data["time"].to_numpy())
+
+
+def get_error_terms(data, storage, storage_column="storage"):
+    """
+    learn_parameters.ErrorTerms with an available heat for each mapping's storage, or for the experiment's
+    storage_source, the same for every mapping, if it isn't the modeled storage.
+
+    :param storage: modeled storage of each mapping, with time along the last axis
+    :type storage: np.array
+    """
+    if storage_column != "storage":
+        storage = data[storage_column].to_numpy()
+    terms = learn_parameters.get_error_terms(data.assign(storage=0.), "storage")  # available heat of Q* alone
+    return terms._replace(available_heat=terms.available_heat - storage)
+
+
+@instrumentation.timed("error")
+def get_fluxes_and_errors(terms, alpha, beta):
+    """
+    Q_H, Q_E and the average normalized squared error, for alpha and beta that broadcast against each other and, along
+    their last axis, against the observations.
+
+    :type terms: learn_parameters.ErrorTerms
+    :return: (Q_H, Q_E, errors), errors without the time axis
+    """
+    with instrumentation.stage("penman_monteith"):
+        sensible = penman_monteith.calc_sensible_heat(alpha, beta, terms.available_heat, terms.gamma, terms.delta)
+        latent = penman_monteith.calc_latent_heat(alpha, beta, terms.available_heat, terms.gamma, terms.delta)
+    error_by_row = learn_parameters.average_error_by_row(terms.actual_latent, terms.actual_sensible, latent, sensible,
+                                                         terms.latent_stats, terms.sensible_stats)
+    return sensible, latent, learn_parameters.average_rows(error_by_row)
@@ -20,6 +20,6 @@ class LinePlot(BasePlot):
     def plot_data(self, fig, ax):
         for y in self.y_data:
             x = self.x_axis
-            if y.x_axis:
+            if y.x_axis is not None:
                 x = y.x_axis
             ax.plot(x, y.data, *y.style.args, label=y.name, **y.style.kwargs)
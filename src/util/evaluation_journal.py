@@ -0,0 +1,130 @@
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+
+from data.util import get_project_root
+import util.instrumentation as instrumentation
+
+# Part of every context, so bump it whenever the storage, Penman-Monteith or error calculations change, or errors
+# computed by the old code would be looked up as if they were current
+journal_version = 1
+journal_path = get_project_root() / "data/interim/evaluations.sqlite"
+batch_size = 500  # points per query, under SQLite's limit on query parameters
+
+_journals = dict()
+
+
+class EvaluationJournal:
+    """
+    Append-only SQLite store of model errors. Each error is keyed by a context, the fingerprint of everything other
+    than the parameters that it depends on (the data, the fixed model options), and by the parameter vector. Results
+    are committed as soon as they're recorded, so an interrupted tuning run loses nothing, and a rerun or a later
+    experiment over the same data looks its points up instead of evaluating them again.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or journal_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.path), timeout=60)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS evaluations (context TEXT NOT NULL, "
+                                    "point TEXT NOT NULL, error REAL, recorded REAL, PRIMARY KEY (context, point))")
+
+    def lookup(self, context, points):
+        """
+        :param points: array of shape (K, number of parameters)
+        :return: (errors, whether each point was found); errors are NaN where not found
+        :rtype: (np.array, np.array)
+        """
+        keys = [get_point_key(point) for point in np.asarray(points, dtype=float).reshape(len(points), -1)]
+        found = dict()
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            rows = self.connection.execute(
+                "SELECT point, error FROM evaluations WHERE context = ? AND point IN ({})".format(
+                    ",".join("?" * len(batch))), [context] + batch)
+            found.update(rows)
+        is_found = np.array([key in found for key in keys], dtype=bool)
+        errors = np.array([np.nan if found.get(key) is None else found[key] for key in keys], dtype=float)
+        return errors, is_found
+
+    def record(self, context, points, errors):
+        now = time.time()
+        rows = [(context, get_point_key(point), None if np.isnan(error) else float(error), now)
+                for point, error in zip(np.asarray(points, dtype=float).reshape(len(points), -1), errors)]
+        with self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO evaluations VALUES (?, ?, ?, ?)", rows)
+
+    def get_evaluations(self, context):
+        """
+        Every point recorded for a context, e.g. to warm-start a search.
+
+        :return: (points, errors), ordered as recorded
+        :rtype: (np.array, np.array)
+        """
+        rows = self.connection.execute("SELECT point, error FROM evaluations WHERE context = ? ORDER BY rowid",
+                                       [context]).fetchall()
+        points = np.array([json.loads(point) for point, _ in rows], dtype=float)
+        errors = np.array([np.nan if error is None else error for _, error in rows], dtype=float)
+        return points, errors
+
+    def journaled(self, evaluate, context):
+        """
+        Wraps a function from points to errors so that recorded points are looked up and only the rest evaluated.
+        """
+        def evaluate_new(points):
+            points = np.asarray(points, dtype=float)
+            errors, is_found = self.lookup(context, points)
+            instrumentation.count("journal.points_found", int(is_found.sum()))
+            instrumentation.count("journal.points_evaluated", int((~is_found).sum()))
+            if not is_found.all():
+                new_errors = np.asarray(evaluate(points[~is_found]), dtype=float)
+                errors[~is_found] = new_errors
+                self.record(context, points[~is_found], new_errors)
+            return errors
+        return evaluate_new
+
+    def close(self):
+        self.connection.close()
+
+
+def get_journal(path=None):
+    """
+    A journal shared within this process, opened on first use.
+
+    :rtype: EvaluationJournal
+    """
+    path = Path(path or journal_path)
+    if path not in _journals:
+        _journals[path] = EvaluationJournal(path)
+    return _journals[path]
+
+
+def get_context(**description):
+    """
+    Fingerprint of what an error depends on besides the parameters, and of journal_version. np.arrays are hashed by
+    their contents, anything else has to be JSON-serializable.
+
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    digest.update("version {}".format(journal_version).encode())
+    for name in sorted(description):
+        value = description[name]
+        digest.update(name.encode())
+        if isinstance(value, np.ndarray):
+            value = np.ascontiguousarray(value)
+            digest.update(str((value.dtype.str, value.shape)).encode())
+            digest.update(value.tobytes())
+        else:
+            digest.update(json.dumps(value, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def get_point_key(point):
+    # repr of a float round-trips exactly, so equal points always get equal keys
+    return json.dumps([float(value) for value in point])
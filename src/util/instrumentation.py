@@ -0,0 +1,176 @@
+import contextlib
+import functools
+import json
+import os
+import time
+from collections import defaultdict
+
+# Set this environment variable to anything but "" to turn instrumentation on at import, so a calibration (and the
+# processes its pools start) can be profiled without editing code
+trace_variable = "LUMPS_TRACE"
+max_events = 100000  # trace events kept; the stage totals keep counting past it
+default_interval = 5.  # seconds between progress reports
+
+_enabled = bool(os.environ.get(trace_variable))
+_stages = dict()  # totals of each stage by name
+_counters = defaultdict(int)
+_events = []
+_open_stages = []  # time spent in the stages nested in each open stage
+_origin = time.perf_counter()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """
+    Forgets everything recorded in this process so far, e.g. between the experiments a worker process runs.
+    """
+    global _origin
+    _stages.clear()
+    _counters.clear()
+    del _events[:]
+    _origin = time.perf_counter()
+
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Times the enclosed block as a run of the named stage, when instrumentation is on. Stages can nest: each keeps its
+    total time and its self time, the total less the time of the stages nested in it.
+    """
+    if not _enabled:
+        yield
+        return
+    _open_stages.append(0.)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        record(name, start, end, _open_stages.pop())
+
+
+def timed(name):
+    """
+    Decorator that times every call of a function as a run of the named stage, see stage.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with stage(name):
+                return function(*args, **kwargs)
+        return timed_function
+    return decorate
+
+
+def record(name, start, end, nested_seconds=0.):
+    seconds = end - start
+    totals = _stages.setdefault(name, {"calls": 0, "seconds": 0., "self_seconds": 0., "max_seconds": 0.})
+    totals["calls"] += 1
+    totals["seconds"] += seconds
+    totals["self_seconds"] += seconds - nested_seconds
+    totals["max_seconds"] = max(totals["max_seconds"], seconds)
+    if _open_stages:
+        _open_stages[-1] += seconds
+    if len(_events) < max_events:
+        _events.append({"name": name, "ph": "X", "ts": (start - _origin)*1e6, "dur": seconds*1e6,
+                        "pid": os.getpid(), "tid": 0})
+
+
+def count(name, number=1):
+    """
+    Adds to a counter, when instrumentation is on.
+    """
+    if _enabled:
+        _counters[name] += number
+
+
+def get_summary():
+    """
+    :return: {"stages": totals of each stage (calls, seconds, self_seconds, max_seconds), "counters": {name: count}}
+    :rtype: dict
+    """
+    return {"stages": {name: dict(totals) for name, totals in _stages.items()}, "counters": dict(_counters)}
+
+
+def format_summary():
+    summary = get_summary()
+    lines = ["{:<32} {:>8} {:>10} {:>10} {:>10}".format("stage", "calls", "seconds", "self", "max")]
+    for name, totals in sorted(summary["stages"].items(), key=lambda item: -item[1]["self_seconds"]):
+        lines.append("{:<32} {calls:>8} {seconds:>10.3f} {self_seconds:>10.3f} {max_seconds:>10.3f}".format(
+            name, **totals))
+    lines.extend("{:<32} {:>8}".format(name, number) for name, number in sorted(summary["counters"].items()))
+    return "\n".join(lines)
+
+
+def write_trace(path):
+    """
+    Writes what this process recorded as JSON in the Chrome trace event format, which chrome://tracing and Perfetto
+    open as a timeline, with the totals of get_summary alongside. Processes started by a pool record their own.
+    """
+    trace = dict(get_summary(), traceEvents=list(_events), displayTimeUnit="ms")
+    with open(path, "w") as file:
+        json.dump(trace, file, indent=1)
+
+
+class Progress:
+    """
+    Reports the progress of a long loop at most once every interval seconds, rather than on every iteration. A loop
+    that finishes within the interval prints nothing.
+    """
+
+    def __init__(self, description, total=None, interval=default_interval):
+        self.description = description
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.values = dict()
+        self.reports = 0
+        self.start = self.last_report = time.perf_counter()
+        self.reported = 0  # self.done at the last report
+
+    def update(self, number=1, **values):
+        """
+        :param number: iterations just finished
+        :param values: latest values to show with the progress, e.g. error=0.5
+        """
+        self.done += number
+        self.values.update(values)
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.report(now)
+
+    def close(self):
+        # The final state, if the loop ran long enough to have reported at all
+        if self.reports and self.done != self.reported:
+            self.report(time.perf_counter())
+
+    def report(self, now):
+        elapsed = now - self.start
+        done = str(self.done) if self.total is None else "{}/{}".format(self.done, self.total)
+        values = "".join(" {}={}".format(name, format_value(value)) for name, value in self.values.items())
+        print("{}: {} in {:.1f}s ({:.1f}/s){}".format(self.description, done, elapsed, self.done/max(elapsed, 1e-9),
+                                                     values), flush=True)
+        self.last_report = now
+        self.reported = self.done
+        self.reports += 1
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return "{:.6g}".format(value)
+    return str(value)
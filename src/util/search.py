@@ -0,0 +1,115 @@
+import numpy as np
+
+import util.exceptions as ex
+
+
+def refine_grid(evaluate, ranges, number, keep=4, refine_number=5, tolerance=1e-3, budget=None, initial=None):
+    """
+    Coarse-to-fine minimization over a box. A grid of number points per parameter is evaluated first. Then, round
+    by round, a finer grid of refine_number points per parameter is evaluated around each of the best candidates,
+    spanning one spacing of the previous grid either side. The number of candidates kept is halved every round
+    (successive halving), down to one.
+
+    :param evaluate: function from an array of points, shape (K, number of parameters), to their errors, shape (K,)
+    :param ranges: (low, high) of each parameter
+    :param number: points per parameter of the coarse grid; one number for all parameters or one per parameter
+    :param keep: how many of the best points the first refinement starts around
+    :type keep: int
+    :param refine_number: points per parameter of each refinement grid, at least 4 so that the spacing shrinks
+    :type refine_number: int
+    :param tolerance: stop once the spacing is below this fraction of every range
+    :type tolerance: float
+    :param budget: most evaluations to spend in total, at least the size of the coarse grid; a round that doesn't fit
+        isn't started. None for no limit.
+    :type budget: int
+    :param initial: (points, errors) already known, e.g. from util.evaluation_journal, to warm-start from. Those in
+        the ranges compete with the evaluated points for refinement and aren't evaluated again.
+    :return: (every point evaluated or known, shape (M, number of parameters), and its error, shape (M,)), known
+        points first, then in evaluation order
+    :rtype: (np.array, np.array)
+    :raises InvalidArgumentError: when no point evaluated so far has a finite error to refine around
+    """
+    if refine_number < 4:
+        raise ex.InvalidArgumentError("refine_number has to be at least 4 for the grids to get finer")
+    ranges = np.asarray(ranges, dtype=float).reshape(-1, 2)
+    low, high = ranges[:, 0], ranges[:, 1]
+    number = np.broadcast_to(number, (len(ranges),))
+    points = get_grid(low, high, number)
+    if budget is not None and len(points) > budget:
+        raise ex.InvalidArgumentError("The coarse grid of {} points is over the budget".format(len(points)))
+    spacing = np.where(number > 1, (high - low) / np.maximum(number - 1, 1), 0)
+
+    all_points, all_errors = [np.empty((0, len(ranges)))], [np.empty(0)]
+    if initial is not None:
+        known_points = np.asarray(initial[0], dtype=float).reshape(-1, len(ranges))
+        in_ranges = np.all((known_points >= low) & (known_points <= high), axis=1)
+        all_points.append(known_points[in_ranges])
+        all_errors.append(np.asarray(initial[1], dtype=float)[in_ranges])
+    evaluated = set(map(tuple, all_points[-1]))
+    points = get_new_points(points, evaluated)
+
+    evaluations = 0
+    while len(points):
+        errors = np.asarray(evaluate(points), dtype=float)
+        evaluated.update(map(tuple, points))
+        evaluations += len(points)
+        all_points.append(points)
+        all_errors.append(errors)
+
+        if np.all(spacing <= tolerance * (high - low)):
+            break
+        known_errors = np.concatenate(all_errors)
+        order = np.argsort(known_errors, kind="stable")[:keep]
+        candidates = np.concatenate(all_points)[order[np.isfinite(known_errors[order])]]
+        if not len(candidates):
+            raise ex.InvalidArgumentError("None of the {} points evaluated has a finite error".format(
+                len(known_errors)))
+        grids = [get_grid(np.maximum(candidate - spacing, low), np.minimum(candidate + spacing, high),
+                          np.where(spacing > 0, refine_number, 1)) for candidate in candidates]
+        points = get_new_points(np.concatenate(grids) if grids else np.empty((0, len(ranges))), evaluated)
+        if budget is not None and evaluations + len(points) > budget:
+            break
+        spacing = spacing * 2 / (refine_number - 1)
+        keep = max(1, keep // 2)
+
+    return np.concatenate(all_points), np.concatenate(all_errors)
+
+
+def get_best_index(errors):
+    """
+    The index of the lowest error, ignoring NaN, which an error over missing or unusable data can be.
+
+    :raises InvalidArgumentError: when every error is NaN
+    :rtype: int
+    """
+    errors = np.asarray(errors, dtype=float)
+    if np.all(np.isnan(errors)):
+        raise ex.InvalidArgumentError("None of the {} errors is a number".format(errors.size))
+    return int(np.nanargmin(errors))
+
+
+def get_refine_options(params):
+    """
+    The refine_grid options set in a tuning parameters block, and warm_start, whether to start from the evaluations
+    journaled by earlier runs, see util.evaluation_journal.
+
+    :type params: dict
+    :rtype: dict
+    """
+    return {name: params[name] for name in ["keep", "refine_number", "tolerance", "budget", "warm_start"]
+            if name in params}
+
+
+def get_new_points(points, evaluated):
+    return np.array([point for point in np.unique(points, axis=0) if tuple(point) not in evaluated]) \
+        .reshape(-1, points.shape[1])
+
+
+def get_grid(low, high, number):
+    """
+    Every combination of number[i] evenly spaced values from low[i] to high[i], the first parameter varying slowest.
+
+    :rtype: np.array
+    """
+    axes = [np.linspace(start, stop, num=int(count)) for start, stop, count in zip(low, high, number)]
+    return np.stack([values.ravel() for values in np.meshgrid(*axes, indexing="ij")], axis=1)
@@ -1,4 +1,6 @@
 import datetime
+
+import pandas as pd
 import pytz
 
 
@@ -10,3 +12,23 @@ def make_date_time(month=7, day=1, hour=0, timezone="US/Mountain", year=2021, se
 
 def localize_date_time(date_time, timezone):
     return pytz.timezone(timezone).localize(date_time, is_dst=None)
+
+
+def make_date_time_range(start, end, step="1min", timezone=None):
+    """
+    Evenly spaced times from start (inclusive) to end (exclusive). Pass a timezone to localize naive start and end.
+
+    :rtype: pd.DatetimeIndex
+    """
+    return pd.date_range(start=start, end=end, freq=step, tz=timezone, inclusive="left")
+
+
+def to_utc_datetime64(times):
+    """
+    Converts times to an np.array of UTC np.datetime64. Timezone-aware times are converted; naive times are taken to
+    already be UTC.
+    """
+    times = pd.DatetimeIndex(times)
+    if times.tz is not None:
+        times = times.tz_convert("UTC").tz_localize(None)
+    return times.to_numpy(dtype="datetime64[ns]")
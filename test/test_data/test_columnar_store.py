@@ -0,0 +1,49 @@
+import data.columnar_store as columnar_store
+import data.ingest as ingest
+import data.validation_data_loader as validation_data
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+
+class TestColumnarStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(columnar_store, "store_dir", Path(self.directory.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def test_round_trip(self):
+        data = pd.DataFrame({
+            "time": pd.date_range("2005-08-20", periods=3, freq="30min", tz="US/Mountain"),
+            "Rs down": [0., 1.5, 3.],
+            "count": [1, 2, 3],
+        })
+        columnar_store.write_store("test", data, validation_data.dugway_file, {"Rs down": "W/m^2"})
+        pd.testing.assert_frame_equal(columnar_store.read_frame("test", validation_data.dugway_file), data)
+
+        schema, columns = columnar_store.open_columns("test")
+        self.assertIsInstance(columns["Rs down"], np.memmap)
+        self.assertFalse(columns["Rs down"].flags.writeable)
+        self.assertEqual(schema["columns"][1]["units"], "W/m^2")
+        self.assertEqual(schema["columns"][0]["timezone"], "US/Mountain")
+
+    def test_stale_or_missing_store_is_ignored(self):
+        self.assertIsNone(columnar_store.read_frame("dugway", validation_data.dugway_file))
+        source = ingest.get_sources()["dugway"]
+        self.assertTrue(ingest.ingest(source))
+        self.assertFalse(ingest.ingest(source))
+        pd.testing.assert_frame_equal(validation_data.get_dugway_data(), validation_data.read_dugway_data())
+
+        with mock.patch.object(columnar_store, "get_source_signature", return_value={"changed": True}):
+            self.assertIsNone(columnar_store.read_frame("dugway", validation_data.dugway_file))
+            self.assertTrue(ingest.ingest(source))
+
+
+if __name__ == '__main__':
+    unittest.main()
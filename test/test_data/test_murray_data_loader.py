@@ -0,0 +1,96 @@
+import data.columnar_store as columnar_store
+import data.datasets as datasets
+import data.murray_data_loader as loader
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+import numpy as np
+import pandas as pd
+from util.exceptions import InvalidArgumentError
+
+
+class TestMurrayDataLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        for module, name, path in [(loader, "cache_dir", "cache"), (columnar_store, "store_dir", "columns")]:
+            patcher = mock.patch.object(module, name, Path(self.directory.name) / path)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+        loader.clear_memory_cache()
+        self.addCleanup(loader.clear_memory_cache)
+
+    def test_parses_local_times(self):
+        times, radiation = loader.get_radiation_data()
+        self.assertEqual(len(times), 97)
+        self.assertEqual(times[0], np.datetime64("2005-08-20T06:00"))  # midnight MDT, in UTC
+        self.assertEqual(times[-1], np.datetime64("2005-08-21T06:00"))
+        data = loader.get_energy_balance_data()
+        self.assertEqual(len(data), 48)
+        self.assertEqual(data["time"].iloc[1], pd.Timestamp("2005-08-20 00:30"))
+        np.testing.assert_array_equal(data["net_radiation"], radiation[:-1:2])
+
+    def test_repeat_calls_are_served_from_memory_then_disk(self):
+        first = loader.get_energy_balance_data()
+        first["net_radiation"] = 0  # callers get their own copy
+        with mock.patch.object(pd, "read_csv") as read_csv:
+            second = loader.get_energy_balance_data()
+            loader.clear_memory_cache()
+            from_disk = loader.get_energy_balance_data()
+        read_csv.assert_not_called()
+        self.assertGreater(second["net_radiation"].abs().sum(), 0)
+        pd.testing.assert_frame_equal(from_disk, second)
+
+    def test_changed_source_is_reread(self):
+        loader.get_weather_data()
+        with mock.patch.object(loader, "get_signature", return_value="changed"), \
+                mock.patch.object(loader, "parse_weather_data", return_value=pd.DataFrame({"a": [1.]})) as read:
+            self.assertEqual(list(loader.get_weather_data().columns), ["a"])
+        read.assert_called_once()
+
+    def test_current_store_is_read_without_disk_cache(self):
+        site = datasets.murray
+        columnar_store.write_store(site.name + "_weather", loader.parse_weather_data(site), site.weather_file,
+                                   parameters=site.date)
+        with mock.patch.object(loader, "parse_weather_data") as parse:
+            data = loader.get_weather_data()
+        parse.assert_not_called()
+        self.assertEqual(list(data.columns), ["time", "windspeed", "temp", "latent_heat", "sensible_heat", "pressure"])
+        self.assertFalse((Path(self.directory.name) / "cache" / (site.name + "_weather.npz")).exists())
+
+    def test_radiation_through_the_clocks_going_back(self):
+        path = Path(self.directory.name) / "solar.csv"
+        times = ["10/30/2005 00:30 MDT", "10/30/2005 01:00 MDT", "10/30/2005 01:30 MDT", "10/30/2005 01:00 MST",
+                 "10/30/2005 01:30 MST", "10/30/2005 02:00 MST"]
+        path.write_text("#\n" * 6 + "Station_ID,Date_Time,solar\n,,W/m**2\n" +
+                        "".join("MSI01,{},{}\n".format(time, index) for index, time in enumerate(times)))
+        site = datasets.murray._replace(name="fall_back", radiation_file=str(path), radiation_column="solar")
+        radiation_times, _ = loader.get_radiation_data(site)
+        np.testing.assert_array_equal(radiation_times, np.arange("2005-10-30T06:30", "2005-10-30T09:30", 30,
+                                                                 dtype="datetime64[m]"))
+        weather = pd.DataFrame({"time": pd.to_datetime(["2005-10-30 01:00", "2005-10-30 01:00", "2005-10-30 02:00"]),
+                                "pressure": 860., "temp": 10., "sensible_heat": 0., "latent_heat": 0.})
+        data = loader.get_energy_balance_frame(weather, *loader.get_radiation_data(site),
+                                               timezone=site.location.timezone)
+        np.testing.assert_array_equal(data["net_radiation"], np.array([1, 3, 5])*(1 - site.albedo))
+
+    def test_chunks_match_whole_record(self):
+        for alignment in [None, {"method": "mean", "interval": "30min", "label": "start"}]:
+            whole = loader.get_energy_balance_data(alignment)
+            pieces = list(loader.iterate_energy_balance_data(alignment, chunk_rows=7, overlap="1h"))
+            self.assertEqual(len(pieces), 7)
+            pd.testing.assert_frame_equal(pd.concat(pieces, ignore_index=True), whole)
+
+    def test_weather_times_run_over_midnight(self):
+        times, previous = loader.get_weather_times("2005-08-20", pd.Series(["22:00", "23:30"]))
+        times, _ = loader.get_weather_times("2005-08-20", pd.Series(["00:00", "12:00", "00:30"]), previous)
+        np.testing.assert_array_equal(times, pd.DatetimeIndex(["2005-08-21 00:00", "2005-08-21 12:00",
+                                                               "2005-08-22 00:30"]))
+
+    def test_site_registry(self):
+        self.assertIs(datasets.get_site("murray"), datasets.murray)
+        self.assertEqual(loader.albedo, datasets.murray.albedo)
+        with self.assertRaises(InvalidArgumentError):
+            datasets.get_site("nowhere")
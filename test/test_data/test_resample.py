@@ -0,0 +1,63 @@
+import data.resample as resample
+import unittest
+import numpy as np
+import pandas as pd
+from util.exceptions import InvalidArgumentError
+
+
+class TestResample(unittest.TestCase):
+
+    def setUp(self):
+        self.minutes = pd.date_range("2005-08-20", periods=121, freq="1min")
+        self.ramp = np.arange(121, dtype=float)  # the value is the minute
+        self.half_hours = pd.date_range("2005-08-20", periods=4, freq="30min")
+
+    def test_asof_exact_and_tolerance(self):
+        quarter_hours = pd.date_range("2005-08-20", periods=9, freq="15min")
+        values = np.arange(9, dtype=float)
+        np.testing.assert_array_equal(
+            resample.align(quarter_hours, values, self.half_hours, tolerance="0s"), values[:-1:2])
+
+        targets = pd.DatetimeIndex(["2005-08-20 00:05", "2005-08-20 00:10", "2005-08-20 03:00"])
+        np.testing.assert_array_equal(resample.asof(quarter_hours, values, targets), [0, 1, 8])
+        np.testing.assert_array_equal(resample.asof(quarter_hours, values, targets, direction="forward"),
+                                      [1, 1, np.nan])
+        np.testing.assert_array_equal(resample.asof(quarter_hours, values, targets, tolerance="5min"),
+                                      [0, 1, np.nan])
+
+    def test_block_mean_and_integral(self):
+        means = resample.block_mean(self.minutes, self.ramp, self.half_hours, label="start")
+        np.testing.assert_allclose(means, [15, 45, 75, 105])
+        means = resample.align(self.minutes, self.ramp, self.half_hours, method="mean")  # label end, inferred interval
+        np.testing.assert_allclose(means, [np.nan, 15, 45, 75])
+        integrals = resample.block_integral(self.minutes, self.ramp, self.half_hours, label="start")
+        np.testing.assert_allclose(integrals, np.array([15, 45, 75, 105]) * 1800)
+
+    def test_blocks_skip_missing_data(self):
+        values = np.column_stack([self.ramp, np.where(self.ramp < 20, np.nan, self.ramp)])
+        means = resample.block_mean(self.minutes, values, self.half_hours, interval="30min", label="start",
+                                    min_coverage=.3)
+        np.testing.assert_allclose(means[0], [15, 25])
+        means = resample.block_mean(self.minutes, values, self.half_hours, interval="30min", label="start")
+        self.assertTrue(np.isnan(means[0, 1]))
+
+        gappy = np.delete(np.arange(121), np.arange(5, 25))
+        means = resample.block_mean(self.minutes[gappy], self.ramp[gappy], self.half_hours[:1], interval="30min",
+                                    label="start", min_coverage=.25, max_gap="2min")
+        np.testing.assert_allclose(means, [(2 * 4 + 27.5 * 5) / 9])  # minutes 0 to 4 and 25 to 30
+
+    def test_block_edges_between_samples(self):
+        quarter_hours = pd.date_range("2005-08-20", periods=9, freq="15min")
+        targets = pd.DatetimeIndex(["2005-08-20 00:10"])
+        mean = resample.block_mean(quarter_hours, np.arange(9) * 15., targets, interval="10min", label="start")
+        np.testing.assert_allclose(mean, [15])
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(InvalidArgumentError):
+            resample.align(self.minutes, self.ramp, self.half_hours, method="median")
+        with self.assertRaises(InvalidArgumentError):
+            resample.asof(self.minutes[::-1], self.ramp, self.half_hours)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from experiments.config.config import Config
+import experiments.run_experiment as run_experiment
+from experiments.run_experiment import select_experiments
+from util.exceptions import ConfigValueNotRecognized
+
+
+def make_config():
+    config = Config()
+    config.config = {"experiments": {1: {}, 1.1: {}, "2 - autotune": {}, 6.1: {}, 6.3: {}}}
+    return config
+
+
+class TestRunExperiment(unittest.TestCase):
+
+    def test_select_experiments(self):
+        config = make_config()
+        self.assertEqual(select_experiments(["6.*", "1"], config), ["1", "6.1", "6.3"])
+        self.assertEqual(select_experiments(["all"], config), ["1", "1.1", "2 - autotune", "6.1", "6.3"])
+        self.assertEqual(select_experiments(["7*"], config), [])
+
+    def test_find_experiment(self):
+        config = make_config()
+        self.assertEqual(config.find_experiment("1.1"), 1.1)
+        self.assertEqual(config.find_experiment("2 - autotune"), "2 - autotune")
+        with self.assertRaises(ConfigValueNotRecognized):
+            config.find_experiment("3")
+
+    def test_every_configured_experiment_is_found(self):
+        config = Config().read()
+        for name in select_experiments(["all"], config):
+            self.assertIn(config.find_experiment(name), config.config["experiments"])
+
+    def test_failing_experiment_is_a_summary_row(self):
+        row = run_experiment.run_named("no such experiment")
+        self.assertEqual(row["experiment"], "no such experiment")
+        self.assertTrue(row["failure"].startswith("ConfigValueNotRecognized"))
+
+    def test_empty_batch(self):
+        summary = run_experiment.run_batch([], processes=1)
+        self.assertEqual(len(summary), 0)
+        self.assertEqual(list(summary.columns), ["anse", "seconds", "failure"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+import pandas as pd
+import model.ensemble as ensemble
+import model.penman_monteith.penman_monteith as penman_monteith
+import model.storage.objective_hysteresis_model as ohm
+
+materials = pd.DataFrame({"Fraction": [.5, .3, .2], "Material": ["grass", "roof", "grass"],
+                          "a1": [.3, .1, .3], "a2": [.5, .2, .5], "a3": [-30., -5., -30.]})
+net_radiation = np.array([-50., 100., 300., 450., 200., -20.])
+d_net_radiation_d_t = np.array([150., 175., 175., -50., -235., -220.])
+temp = np.array([15., 18., 22., 25., 21., 16.])
+pressure = np.full(6, 860.)
+
+
+class TestEnsemble(unittest.TestCase):
+
+    def test_members_without_spread_are_nominal(self):
+        members = ensemble.sample_members(materials, .5, 4., {}, 3)
+        np.testing.assert_allclose(members.coefficients, np.tile(ohm.get_weighted_coefficients(materials), (3, 1)))
+        np.testing.assert_array_equal(members.alpha, [.5]*3)
+        np.testing.assert_array_equal(members.beta, [4.]*3)
+
+    def test_surfaces_of_a_material_share_its_coefficients(self):
+        distributions = {"a1": {"scale": .5, "relative": True}}
+        members = ensemble.sample_members(materials.assign(Fraction=[.5, 0., .5]), .5, 4., distributions, 100, seed=1)
+        separate = ensemble.sample_members(materials.assign(Fraction=[.5, 0., .5], Material=["a", "b", "c"]), .5, 4.,
+                                           distributions, 100, seed=1)
+        # With both surfaces drawing the same a1, the weighted a1 spreads as much as one material's does
+        self.assertGreater(members.coefficients[:, 0].std(), separate.coefficients[:, 0].std()*1.2)
+        np.testing.assert_array_equal(members.coefficients[:, 1:], np.tile([.5, -30.], (100, 1)))
+
+    def test_bounds_and_distributions(self):
+        rng = np.random.default_rng(0)
+        values = ensemble.sample([.5], {"distribution": "uniform", "scale": 1, "bounds": [0, 1]}, 1000, rng)
+        self.assertEqual((values.min(), values.max()), (0, 1))
+        with self.assertRaises(ensemble.ConfigValueNotRecognized):
+            ensemble.sample([.5], {"distribution": "cauchy", "scale": 1}, 10, rng)
+
+    def test_bands_match_members_run_one_by_one(self):
+        distributions = {"fraction": {"scale": .2, "relative": True, "bounds": [0, None]},
+                         "a3": {"distribution": "uniform", "scale": 10}, "alpha": {"scale": .05}}
+        members = ensemble.sample_members(materials, .5, 4., distributions, 50, seed=2)
+        percentiles = [10, 50, 90]
+        # A budget of a few time steps at a time
+        bands = ensemble.get_percentile_bands(members, net_radiation, d_net_radiation_d_t, temp, pressure,
+                                              percentiles, memory_budget=50*ensemble.arrays_per_block*8*4)
+
+        storage = np.array([ohm.calculate_storage_heat_flux_from_coefficients(coefficients, net_radiation,
+                                                                             d_net_radiation_d_t)
+                            for coefficients in members.coefficients])
+        fluxes = [penman_monteith.calc_sensible_and_latent_heat(alpha, beta, net_radiation, member_storage, temp,
+                                                                pressure)
+                  for alpha, beta, member_storage in zip(members.alpha, members.beta, storage)]
+        expected = {"storage": storage, "model_sensible": np.array([sensible for sensible, _ in fluxes]),
+                    "model_latent": np.array([latent for _, latent in fluxes])}
+        for output in ensemble.outputs:
+            np.testing.assert_allclose(bands[output], np.percentile(expected[output], percentiles, axis=0))
+
+    def test_bands_with_vapor_pressure_table(self):
+        members = ensemble.sample_members(materials, .5, 4., {"alpha": {"scale": .05}}, 20, seed=3)
+        exact = ensemble.get_percentile_bands(members, net_radiation, d_net_radiation_d_t, temp, pressure)
+        tabulated = ensemble.get_percentile_bands(members, net_radiation, d_net_radiation_d_t, temp, pressure,
+                                                  vapor_pressure_table=True)
+        for output in ensemble.outputs:
+            np.testing.assert_allclose(tabulated[output], exact[output], atol=1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
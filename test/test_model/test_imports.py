@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+src = Path(__file__).parent.parent.parent / "src"
+
+compute_modules = [
+    "model.ensemble",
+    "model.lumps",
+    "model.pipeline",
+    "model.surface_mappings",
+    "model.radiation.solar_radiation_calculator",
+    "model.radiation.gridded_radiation",
+    "model.storage.objective_hysteresis_model",
+    "model.storage.tuning.learn_materials_coefficients",
+    "model.penman_monteith.moisture_variables",
+    "model.penman_monteith.tuning.learn_parameters",
+    "data.murray_data_loader",
+]
+
+
+class TestImports(unittest.TestCase):
+
+    def test_compute_modules_import_without_plotting_or_files(self):
+        script = "import sys\n" + "".join("import " + module + "\n" for module in compute_modules) + \
+                 "print(sorted(name for name in ('matplotlib', 'seaborn') if name in sys.modules))\n"
+        with tempfile.TemporaryDirectory() as directory:
+            result = subprocess.run([sys.executable, "-c", script], cwd=directory, capture_output=True, text=True,
+                                    env=dict(os.environ, PYTHONPATH=str(src)), check=True)
+            self.assertEqual(result.stdout.strip(), "[]")
+            self.assertEqual(os.listdir(directory), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
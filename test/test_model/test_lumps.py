@@ -0,0 +1,26 @@
+import unittest
+import pandas as pd
+from experiments.config.config import Config
+from model import lumps
+
+
+def make_config(**experiment):
+    config = Config()
+    config.experiment = experiment
+    config.penman_monteith_params = {"alpha": 0.4444444444444444, "beta": 13.333333333333334}
+    config.longwave_model = "burridge_gadd"
+    config.surface_data = pd.DataFrame({"Fraction": [.6, .4], "a1": [.5, .3], "a2": [.3, .2], "a3": [-30., -20.]})
+    return config
+
+
+class TestLumps(unittest.TestCase):
+
+    def test_chunked_output_matches_whole_record(self):
+        whole = lumps.get_model_output(make_config())
+        for chunk_rows in [1, 5, 48]:
+            chunked = lumps.get_model_output(make_config(chunk_rows=chunk_rows))
+            pd.testing.assert_frame_equal(chunked, whole)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import model.penman_monteith.penman_monteith as penman_monteith
+import model.penman_monteith.tuning.learn_parameters as learn_parameters
+import unittest
+import numpy as np
+import pandas as pd
+
+
+def make_observations(alpha, beta, noise=0):
+    random = np.random.default_rng(1)
+    data = pd.DataFrame({
+        "net_radiation": np.linspace(-50, 600, 48),
+        "storage": np.linspace(-30, 120, 48),
+        "temp": random.uniform(15, 35, 48),
+        "pressure": random.uniform(855, 870, 48),
+    })
+    sensible, latent = penman_monteith.calc_sensible_and_latent_heat(
+        alpha, beta, data["net_radiation"].to_numpy(), data["storage"].to_numpy(), data["temp"].to_numpy(),
+        data["pressure"].to_numpy())
+    data["sensible_heat"] = sensible + random.normal(0, noise, 48)
+    data["latent_heat"] = latent + random.normal(0, noise, 48)
+    return data
+
+
+class TestLearnParameters(unittest.TestCase):
+
+    def test_least_squares_recovers_exact_parameters(self):
+        alpha, beta, error = learn_parameters.fit_least_squares(make_observations(0.6, 4))
+        self.assertAlmostEqual(alpha, 0.6)
+        self.assertAlmostEqual(beta, 4)
+        self.assertAlmostEqual(error, 0)
+
+    def test_least_squares_error_matches_normalized_squared_error(self):
+        data = make_observations(0.6, 4, noise=20)
+        alpha, beta, error = learn_parameters.fit_least_squares(data)
+        sensible, latent = penman_monteith.calc_sensible_and_latent_heat(
+            alpha, beta, data["net_radiation"], data["storage"], data["temp"].to_numpy(), data["pressure"])
+        expected = learn_parameters.calculate_normalized_squared_error(data["latent_heat"], data["sensible_heat"],
+                                                                       latent, sensible)
+        self.assertAlmostEqual(error, expected)
+
+    def test_least_squares_within_ranges_beats_grid(self):
+        data = make_observations(0.6, 4, noise=20)
+        alpha, beta, error = learn_parameters.fit_least_squares(data, alpha_range=(0.2, 0.5), beta_range=(5, 10))
+        self.assertTrue(0.2 <= alpha <= 0.5 and 5 <= beta <= 10)
+        design, target = learn_parameters.get_least_squares_system(data)
+        grid_errors = [learn_parameters.get_least_squares_error(design, target, grid_alpha, grid_beta)
+                       for grid_alpha in np.linspace(0.2, 0.5, 31) for grid_beta in np.linspace(5, 10, 51)]
+        self.assertLessEqual(error, min(grid_errors) + 1e-12)
+
+    def test_error_surface_matches_each_grid_point(self):
+        data = make_observations(0.6, 4, noise=20)
+        alphas, betas = np.linspace(0, 1, 4), np.linspace(0, 20, 3)
+        surface = learn_parameters.get_error_surface(data, alphas, betas, max_elements=100)
+        self.assertEqual(surface.shape, (4, 3))
+        for i, alpha in enumerate(alphas):
+            for j, beta in enumerate(betas):
+                sensible, latent = penman_monteith.calc_sensible_and_latent_heat(
+                    alpha, beta, data["net_radiation"], data["storage"], data["temp"].to_numpy(), data["pressure"])
+                expected = learn_parameters.calculate_normalized_squared_error(
+                    data["latent_heat"], data["sensible_heat"], latent, sensible)
+                self.assertAlmostEqual(surface[i, j], expected)
+
+    def test_point_errors_match_error_surface(self):
+        data = make_observations(0.6, 4, noise=20)
+        alphas, betas = np.linspace(0, 1, 4), np.linspace(0, 20, 3)
+        surface = learn_parameters.get_error_surface(data, alphas, betas)
+        alpha_grid, beta_grid = np.meshgrid(alphas, betas, indexing="ij")
+        errors = learn_parameters.get_point_errors(data, alpha_grid.ravel(), beta_grid.ravel(), max_elements=100)
+        np.testing.assert_allclose(errors, surface.ravel())
+
+    def test_missing_observations_are_skipped_alike(self):
+        data = make_observations(0.6, 4, noise=20)
+        data.loc[[3, 17], "latent_heat"] = np.nan
+        sensible, latent = penman_monteith.calc_sensible_and_latent_heat(
+            0.5, 6, data["net_radiation"], data["storage"], data["temp"].to_numpy(), data["pressure"])
+        expected = learn_parameters.calculate_normalized_squared_error(data["latent_heat"], data["sensible_heat"],
+                                                                       latent, sensible)
+        self.assertFalse(np.isnan(expected))
+        self.assertAlmostEqual(learn_parameters.get_error_surface(data, [0.5], [6])[0, 0], expected)
+        self.assertAlmostEqual(learn_parameters.get_point_errors(data, [0.5], [6])[0], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
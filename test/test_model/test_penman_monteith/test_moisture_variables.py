@@ -0,0 +1,46 @@
+import model.penman_monteith.moisture_variables as moisture_vars
+import model.penman_monteith.penman_monteith as penman_monteith
+import unittest
+import numpy as np
+
+
+class TestMoistureVariables(unittest.TestCase):
+
+    def test_e_s_at_freezing(self):
+        self.assertAlmostEqual(moisture_vars.clausius_clapeyron_e_s(0), moisture_vars.e_0)
+
+    def test_slope_matches_finite_difference(self):
+        temps = np.array([-10., 5, 20, 35])
+        e_s, slope = moisture_vars.saturation_vapor_pressure_and_slope(temps)
+        np.testing.assert_allclose(e_s, moisture_vars.clausius_clapeyron_e_s(temps))
+        finite_difference = (moisture_vars.clausius_clapeyron_e_s(temps + 1e-4) -
+                             moisture_vars.clausius_clapeyron_e_s(temps - 1e-4)) / 2e-4
+        np.testing.assert_allclose(slope, finite_difference, rtol=1e-6)
+
+    def test_table_within_error_bound(self):
+        table = moisture_vars.SaturationVaporPressureTable(t_min=-20, t_max=45, step=.05)
+        temps = np.random.default_rng(2).uniform(-20, 45, 10000)
+        e_s, slope = moisture_vars.saturation_vapor_pressure_and_slope(temps)
+        self.assertLessEqual(np.abs(table.e_s(temps) - e_s).max(), table.max_error_e_s)
+        self.assertLessEqual(np.abs(table.slope(temps) - slope).max(), table.max_error_slope)
+        self.assertAlmostEqual(table.slope(60), moisture_vars.slope_e_s(60))
+
+    def test_partitioning_with_table_matches_exact(self):
+        temps = np.random.default_rng(3).uniform(-20, 45, 1000)
+        net_radiation = np.linspace(-80, 800, 1000)
+        exact = penman_monteith.calc_sensible_and_latent_heat(.5, 4., net_radiation, 50., temps, 860.)
+        tabulated = penman_monteith.calc_sensible_and_latent_heat(.5, 4., net_radiation, 50., temps, 860.,
+                                                                  vapor_pressure_table=True)
+        table = moisture_vars.get_saturation_vapor_pressure_table()
+        np.testing.assert_array_less(np.abs(table.slope(temps) - moisture_vars.slope_e_s(temps)),
+                                     table.max_error_slope + 1e-15)
+        # Q_E = alpha*A/(1 + gamma/delta) changes by alpha*|A|*gamma/(delta + gamma)^2 per hPa/K of delta
+        gamma = moisture_vars.get_psychrometric_constant(860.)
+        delta = moisture_vars.slope_e_s(temps)
+        bound = .5*np.abs(net_radiation - 50.)*gamma/(delta + gamma)**2*table.max_error_slope
+        for exact_flux, tabulated_flux in zip(exact, tabulated):
+            np.testing.assert_array_less(np.abs(tabulated_flux - exact_flux), bound*1.01 + 1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import math
+import model.penman_monteith.penman_monteith as penman_monteith
+import model.pipeline as pipeline
+import unittest
+import numpy as np
+import pandas as pd
+
+
+def scalar_sensible_and_latent_heat(alpha, beta, net_radiation, heat_storage, temp, pressure):
+    # The per-row computation the model did before it worked on whole columns, with math.exp on one row at a time
+    T = temp + 273.15
+    e_s = 6.113 * math.exp(2.5e6/461*(1/273.15 - 1/T))
+    delta = 2.5e6/461 * 1/(T*T) * e_s
+    gamma = 1004/2.5e6 * pressure / 0.622
+    available_heat = net_radiation - heat_storage
+    sensible = ((1 - alpha) + gamma/delta)/(1 + gamma/delta)*available_heat - beta
+    latent = alpha/(1 + gamma/delta)*available_heat + beta
+    return sensible, latent
+
+
+class TestPenmanMonteith(unittest.TestCase):
+
+    def test_columns_match_rows(self):
+        data = pd.DataFrame({
+            "net_radiation": [-60., 150., np.nan, 520., 300.],
+            "storage": [-20., 40., 80., np.nan, 90.],
+            "temp": [14., 19., 25., 31., np.nan],
+            "pressure": [861., 860., 859., 858., 858.],
+        })
+        pipeline.add_sensible_and_latent(data, .45, 6.)
+        for index, row in data.iterrows():
+            sensible, latent = scalar_sensible_and_latent_heat(.45, 6., row["net_radiation"], row["storage"],
+                                                               row["temp"], row["pressure"])
+            np.testing.assert_allclose([data.at[index, "model_sensible"], data.at[index, "model_latent"]],
+                                       [sensible, latent], rtol=1e-12)
+        self.assertEqual(data[["model_sensible", "model_latent"]].isna().sum(axis=1).tolist(), [0, 0, 2, 2, 2])
+
+    def test_floats_match_arrays(self):
+        sensible, latent = penman_monteith.calc_sensible_and_latent_heat(.45, 6., np.array([100., 400.]), 20.,
+                                                                         np.array([18., 27.]), 860.)
+        self.assertEqual(penman_monteith.calc_sensible_and_latent_heat(.45, 6., 400., 20., 27., 860.),
+                         (sensible[1], latent[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
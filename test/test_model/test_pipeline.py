@@ -0,0 +1,60 @@
+import unittest
+import pandas as pd
+import model.pipeline as pipeline
+from experiments.config.config import Config
+
+
+def make_config(alpha=.6, a1=.5):
+    config = Config()
+    config.experiment = {}
+    config.penman_monteith_params = {"alpha": alpha, "beta": 4.}
+    config.longwave_model = "burridge_gadd"
+    config.surface_data = pd.DataFrame({"Fraction": [1], "a1": [a1], "a2": [.3], "a3": [-30.]})
+    return config
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        pipeline.lumps_pipeline.clear()
+        self.addCleanup(pipeline.lumps_pipeline.clear)
+
+    def get_runs(self, config):
+        before = dict(pipeline.lumps_pipeline.runs)
+        output = pipeline.run(config)
+        return output, {name: runs - before[name] for name, runs in pipeline.lumps_pipeline.runs.items()}
+
+    def test_only_affected_stages_rerun(self):
+        first, runs = self.get_runs(make_config())
+        self.assertEqual(set(runs.values()), {1})
+
+        _, runs = self.get_runs(make_config(alpha=.5))
+        self.assertEqual(runs, {"observations": 0, "longwave": 0, "storage": 0, "sensible_and_latent": 1})
+        _, runs = self.get_runs(make_config(a1=.7))
+        self.assertEqual(runs, {"observations": 0, "longwave": 0, "storage": 1, "sensible_and_latent": 1})
+
+        first["model_latent"] = 0  # callers get copies
+        again, runs = self.get_runs(make_config())
+        self.assertEqual(set(runs.values()), {0})
+        self.assertGreater(again["model_latent"].abs().sum(), 0)
+
+    def test_keys_are_made_of_config_values(self):
+        key = pipeline.lumps_pipeline.get_key(pipeline.get_parameters(make_config()), "sensible_and_latent")
+        self.assertEqual(key, pipeline.lumps_pipeline.get_key(pipeline.get_parameters(make_config()),
+                                                              "sensible_and_latent"))
+        _, observations_key, _ = pipeline.lumps_pipeline.get_key(pipeline.get_parameters(make_config()),
+                                                                 "observations")
+        self.assertIn('"site": "murray"', observations_key)
+        with self.assertRaises(TypeError):  # rather than keying on the object's repr
+            pipeline.lumps_pipeline.get_key({"observations": {"site": object()}}, "observations")
+
+    def test_cache_is_bounded(self):
+        small = pipeline.Pipeline([pipeline.Stage("double", [], lambda parameters: 2 * parameters)], max_entries=2)
+        for value in [1, 2, 3, 1]:
+            self.assertEqual(small.run({"double": value}), 2 * value)
+        self.assertEqual(small.runs["double"], 4)
+        self.assertEqual(len(small._cache), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
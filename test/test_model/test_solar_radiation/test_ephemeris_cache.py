@@ -0,0 +1,58 @@
+import model.radiation.ephemeris_cache as cache
+import model.radiation.solar_radiation_calculator as calc
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+import numpy as np
+from util.location_util import Location
+
+murray = Location(40.67250, 111.80220, "US/Mountain")
+
+
+class TestEphemerisCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(cache, "cache_dir", Path(self.directory.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+        cache.clear_memory_cache()
+
+    def test_matches_calculation(self):
+        times, radiation_variables = cache.get_clear_sky_radiation(murray, "2005-08-20", "2005-08-21", albedo=.18)
+        self.assertEqual(len(times), 1440)
+        expected = calc.calc_radiation_flux_series(times, murray, albedo=.18)
+        np.testing.assert_array_equal(radiation_variables["flux"], expected)
+
+    def test_naive_times_match_uncached_range(self):
+        times, radiation_variables = cache.get_clear_sky_radiation(murray, "2005-08-20", "2005-08-21", "15min",
+                                                                   use_disk=False)
+        range_times, range_variables = calc.get_radiation_variables_for_range("2005-08-20", "2005-08-21", "15min",
+                                                                               murray)
+        self.assertTrue(range_times.equals(times))
+        self.assertEqual(str(range_times.tz), murray.timezone)
+        np.testing.assert_array_equal(range_variables["flux"], radiation_variables["flux"])
+
+    def test_repeat_calls_are_served_from_memory_then_disk(self):
+        _, first = cache.get_clear_sky_radiation(murray, "2005-08-20", "2005-08-21", albedo=.18)
+        _, second = cache.get_clear_sky_radiation(murray, "2005-08-20", "2005-08-21", albedo=.18)
+        self.assertIs(first["flux"], second["flux"])
+        self.assertFalse(second["flux"].flags.writeable)
+
+        cache.clear_memory_cache()
+        with mock.patch.object(calc, "get_radiation_variables_series") as calculation:
+            _, from_disk = cache.get_clear_sky_radiation(murray, "2005-08-20", "2005-08-21", albedo=.18)
+        calculation.assert_not_called()
+        np.testing.assert_array_equal(from_disk["flux"], first["flux"])
+
+    def test_key_changes_with_arguments(self):
+        key = cache.get_key(murray, "2005-08-20", "2005-08-21", "1min", 0, 0, .18)
+        self.assertEqual(key, cache.get_key(murray, "2005-08-20", "2005-08-21", "60s", 0, 0, .18))
+        self.assertNotEqual(key, cache.get_key(murray, "2005-08-20", "2005-08-21", "1min", 0, 0, .2))
+        self.assertNotEqual(key, cache.get_key(murray, "2005-08-20", "2005-08-22", "1min", 0, 0, .18))
+
+
+if __name__ == '__main__':
+    unittest.main()
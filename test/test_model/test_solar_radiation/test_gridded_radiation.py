@@ -0,0 +1,39 @@
+import model.radiation.gridded_radiation as grid
+import model.radiation.solar_radiation_calculator as calc
+import unittest
+import numpy as np
+from util.location_util import Location
+from util.time_util import make_date_time_range
+
+times = make_date_time_range("2021-06-21", "2021-06-22", step="30min", timezone="US/Mountain")
+
+
+class TestGriddedRadiation(unittest.TestCase):
+
+    def test_cells_match_series(self):
+        latitude = np.array([[40.0, 41.0], [42.0, 43.0]])
+        slope_angle = np.array([[0, 10], [20, 30]])
+        flux = grid.calc_gridded_radiation_flux(times, latitude, 111.9, slope_angle, 180, albedo=.18,
+                                                chunk_bytes=1)
+        self.assertEqual(flux.shape, (2, 2, len(times)))
+        for index in np.ndindex(latitude.shape):
+            location = Location(latitude[index], 111.9, "US/Mountain")
+            expected = calc.calc_radiation_flux_series(times, location, slope_angle[index], 180, albedo=.18)
+            np.testing.assert_allclose(flux[index], expected, atol=1e-9)
+
+    def test_process_pool_matches_serial(self):
+        latitude = np.linspace(30, 50, 12)
+        serial = grid.calc_gridded_radiation_flux(times, latitude, 111.9, chunk_bytes=1)
+        parallel = grid.calc_gridded_radiation_flux(times, latitude, 111.9, chunk_bytes=1, processes=2)
+        np.testing.assert_array_equal(serial, parallel)
+
+    def test_slope_and_aspect_of_south_facing_plane(self):
+        rows = np.arange(5)[:, None] * np.ones(5)
+        elevation = 100 - 10 * rows  # rows run north to south, so this drops toward the south
+        slope_angle, slope_azimuth = grid.get_slope_and_aspect(elevation, 10)
+        np.testing.assert_allclose(slope_angle, 45)
+        np.testing.assert_allclose(slope_azimuth, 180)
+
+
+if __name__ == '__main__':
+    unittest.main()
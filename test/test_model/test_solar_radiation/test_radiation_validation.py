@@ -0,0 +1,18 @@
+import experiments.validate_radiation as validation
+import unittest
+
+# Current errors (W/m^2) plus some slack; a change that makes the model worse than this should be looked at
+max_rmse = {"dugway": 20, "bllast": 18}
+
+
+class TestRadiationValidation(unittest.TestCase):
+
+    def test_error_against_observations(self):
+        for dataset_name, limit in max_rmse.items():
+            results = validation.validate(dataset_name, repeats=1)
+            self.assertLess(results["rmse"], limit, dataset_name)
+            self.assertGreater(results["r"], .99, dataset_name)
+
+
+if __name__ == '__main__':
+    unittest.main()
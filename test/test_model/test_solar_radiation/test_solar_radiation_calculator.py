@@ -2,8 +2,10 @@ import model.radiation.solar_radiation_calculator as calc
 import datetime
 import unittest
 import math
-from util.location_util import Location
-from util.time_util import make_date_time
+import numpy as np
+from util.location_util import Location, Clouds
+from util.time_util import make_date_time, make_date_time_range
+from util.exceptions import InvalidArgumentError
 
 vancouver = Location(49.25, 123.1, "US/Pacific")
 
@@ -48,6 +50,33 @@ class TestSolarRadiation(unittest.TestCase):
         radiation_variables = calc.get_radiation_variables(date_time, lannemezan)
         self.assertAlmostEqual(radiation_variables["local_solar_time"], 9 + 59/60, places=0)
 
+    def test_series_matches_single_timestamps(self):
+        times = make_date_time_range("2021-03-05", "2021-03-06", step="7min", timezone=vancouver.timezone)
+        kwargs = dict(slope_angle=20, slope_azimuth=135, clouds=Clouds(.2, .1, .3), albedo=.18)
+        series = calc.get_radiation_variables_series(times, vancouver, **kwargs)
+        for name, values in series.items():
+            expected = [calc.get_radiation_variables(date_time, vancouver, **kwargs)[name] for date_time in times]
+            np.testing.assert_allclose(values, expected, atol=1e-9, err_msg=name)
+
+    def test_series_takes_utc_datetime64(self):
+        date_time = make_date_time(month=3, day=5, hour=15, timezone=vancouver.timezone)
+        utc_times = np.array(["2021-03-05T23:00"], dtype="datetime64[ns]")
+        flux = calc.calc_radiation_flux_series(utc_times, vancouver)
+        self.assertAlmostEqual(flux[0], calc.calc_radiation_flux(date_time, vancouver))
+
+    def test_record_has_only_requested_fields(self):
+        times = make_date_time_range("2021-03-05", "2021-03-06", step="1h", timezone=vancouver.timezone)
+        record = calc.get_radiation_record(times, vancouver, fields=("elevation_angle", "flux"), albedo=.18)
+        self.assertEqual(record.dtype.names, ("elevation_angle", "flux"))
+        diagnostic = calc.get_radiation_variables_series(times, vancouver, albedo=.18)
+        self.assertIn("flux_debug_1_angle", diagnostic)
+        for name in record.dtype.names:
+            np.testing.assert_allclose(record[name], diagnostic[name], atol=1e-12)
+
+    def test_unknown_field(self):
+        with self.assertRaises(InvalidArgumentError):
+            calc.get_radiation_record([make_date_time()], vancouver, fields=("flux", "sunshine"))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+import pandas as pd
+import model.storage.objective_hysteresis_model as ohm
+import model.storage.tuning.learn_materials_coefficients as learn
+from experiments.config.config import Config
+from model import lumps
+from model.penman_monteith.tuning.learn_parameters import calculate_normalized_squared_error
+
+
+def make_config(coefficients):
+    config = Config()
+    config.experiment = {}
+    config.penman_monteith_params = {"alpha": .6, "beta": 4.}
+    config.longwave_model = "burridge_gadd"
+    config.surface_data = pd.DataFrame({"Fraction": [1], "a1": [coefficients[0]], "a2": [coefficients[1]],
+                                        "a3": [coefficients[2]]})
+    return config
+
+
+class TestLearnMaterialsCoefficients(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = ohm.get_coefficient_grid([.5, .75], [0, .2, .4], [-40, -20])
+        self.observations = learn.get_observations(make_config(self.grid[0]))
+
+    def test_errors_match_model_output(self):
+        errors = learn.get_coefficient_errors(self.grid, self.observations, .6, 4.)
+        for coefficients, error in zip(self.grid[[0, 5, -1]], errors[[0, 5, -1]]):
+            output = lumps.get_model_output(make_config(coefficients))
+            expected = calculate_normalized_squared_error(output["latent_heat"], output["sensible_heat"],
+                                                          output["model_latent"], output["model_sensible"])
+            self.assertAlmostEqual(error, expected, places=10)
+
+    def test_process_pool_matches_serial(self):
+        serial = learn.get_coefficient_errors(self.grid, self.observations, .6, 4.)
+        pooled = learn.get_coefficient_errors(self.grid, self.observations, .6, 4., processes=2, max_elements=100)
+        np.testing.assert_array_equal(pooled, serial)
+
+    def test_residual_storage_ignores_coefficients(self):
+        errors = learn.get_coefficient_errors(self.grid, self.observations, .6, 4., storage_source="residual")
+        np.testing.assert_allclose(errors, errors[0])
+
+    def test_missing_observations_are_skipped(self):
+        latent_heat = self.observations.latent_heat.copy()
+        latent_heat[[5, 20]] = np.nan
+        observations = self.observations._replace(latent_heat=latent_heat)
+        errors = learn.get_coefficient_errors(self.grid, observations, .6, 4.)
+        self.assertFalse(np.any(np.isnan(errors)))
+        output = lumps.get_model_output(make_config(self.grid[5]))
+        expected = calculate_normalized_squared_error(pd.Series(latent_heat), output["sensible_heat"],
+                                                      output["model_latent"], output["model_sensible"])
+        self.assertAlmostEqual(errors[5], expected, places=10)
+
+
+if __name__ == '__main__':
+    unittest.main()
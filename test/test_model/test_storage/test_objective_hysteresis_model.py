@@ -0,0 +1,65 @@
+import model.storage.objective_hysteresis_model as ohm
+import unittest
+import numpy as np
+import pandas as pd
+
+materials = pd.DataFrame({
+    "Surface Type": ["Grass", "Roof", "Road"],
+    "Fraction": [0.2, 0.3, 0.1],
+    "a1": [0.32, 0.14, 0.36],
+    "a2": [0.54, 0.33, 0.23],
+    "a3": [-27.4, -6, -19.3],
+})
+net_forcing = np.array([-50., 0, 200, 600, 400, 20])
+d_net_forcing_d_t = np.array([0., 25, 150, 50, -100, -190])
+
+
+class TestObjectiveHysteresisModel(unittest.TestCase):
+
+    def test_weights_materials_by_fraction(self):
+        storage = ohm.calculate_storage_heat_flux(materials, net_forcing, d_net_forcing_d_t=d_net_forcing_d_t)
+        weight = materials["Fraction"] / materials["Fraction"].sum()
+        for index in range(len(net_forcing)):
+            expected = (weight * (materials["a1"] * net_forcing[index] + materials["a2"] * d_net_forcing_d_t[index]
+                                  + materials["a3"])).sum()
+            self.assertAlmostEqual(storage[index], expected)
+
+    def test_batch_matches_single_coefficient_sets(self):
+        coefficients = ohm.get_coefficient_grid([0.1, 0.5], [0, 0.3], [-20, -10, 0])
+        self.assertEqual(coefficients.shape, (12, 3))
+        np.testing.assert_array_equal(coefficients[1], [0.1, 0, -10])
+        storage = ohm.calculate_storage_heat_flux_batch(coefficients, net_forcing, d_net_forcing_d_t=d_net_forcing_d_t)
+        self.assertEqual(storage.shape, (12, len(net_forcing)))
+        for (a1, a2, a3), row in zip(coefficients, storage):
+            single = pd.DataFrame({"Fraction": [1], "a1": [a1], "a2": [a2], "a3": [a3]})
+            np.testing.assert_allclose(row, ohm.calculate_storage_heat_flux(
+                single, net_forcing, d_net_forcing_d_t=d_net_forcing_d_t), atol=1e-9)
+
+    def test_rate_of_change_matches_centered_difference(self):
+        times = np.datetime64("2005-08-20T00:00") + np.arange(6) * np.timedelta64(30, "m")
+        rate = ohm.get_rate_of_change(net_forcing, times)
+        expected = ohm.get_delta(net_forcing) / (ohm.get_delta(times) / np.timedelta64(1, "h"))
+        np.testing.assert_allclose(rate, expected)
+
+    def test_rate_of_change_skips_missing_samples_and_splits_gaps(self):
+        hours = np.array([0, 1, 2, 3, 10, 11, 20])
+        times = np.datetime64("2005-08-20T00:00") + hours * np.timedelta64(1, "h")
+        forcing = np.array([0., 10, np.nan, 40, 100, 90, 0])
+        rate = ohm.get_rate_of_change(forcing, times, max_gap="2h")
+        np.testing.assert_allclose(rate, [10, 40 / 3, np.nan, 15, -10, -10, np.nan])
+        unsplit = ohm.get_rate_of_change(forcing, times)
+        np.testing.assert_allclose(unsplit[[3, 6]], [(100 - 10) / 9, -90 / 9])
+
+    def test_chunked_rate_of_change_matches_whole_series(self):
+        random = np.random.default_rng(0)
+        times = np.datetime64("2005-08-20T00:00") + np.cumsum(random.integers(1, 40, 500)) * np.timedelta64(1, "m")
+        forcing = random.normal(size=500)
+        forcing[random.random(500) < .1] = np.nan
+        forcing[100:130] = np.nan
+        expected = ohm.get_rate_of_change(forcing, times, max_gap="1h")
+        chunked = ohm.get_rate_of_change_chunked(forcing, times, max_gap="1h", chunk_size=16)
+        np.testing.assert_allclose(chunked, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
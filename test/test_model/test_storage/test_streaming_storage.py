@@ -0,0 +1,41 @@
+import model.storage.objective_hysteresis_model as ohm
+from model.storage.streaming_storage import StreamingStorageEstimator
+import unittest
+import numpy as np
+
+coefficients = (0.3, 0.4, -20)
+times = np.datetime64("2005-08-20T00:00") + np.array([0, 30, 60, 90, 150, 180, 210], dtype="timedelta64[m]")
+net_forcing = np.array([-50., 0, 200, 600, 400, 20, -30])
+
+
+class TestStreamingStorage(unittest.TestCase):
+
+    def test_centered_matches_whole_series(self):
+        d_net_forcing_d_t = ohm.get_delta(net_forcing) / (ohm.get_delta(times) / np.timedelta64(1, 'h'))
+        expected = ohm.calculate_storage_heat_flux_batch([coefficients], net_forcing,
+                                                         d_net_forcing_d_t=d_net_forcing_d_t)[0]
+        for batch_size in [1, 3]:
+            estimator = StreamingStorageEstimator(coefficients)
+            emitted = []
+            for start in range(0, len(times), batch_size):
+                emitted.append(estimator.update_many(times[start:start + batch_size],
+                                                     net_forcing[start:start + batch_size]))
+            emitted.append(estimator.flush())
+            emitted_times = np.concatenate([batch[0] for batch in emitted])
+            storage = np.concatenate([batch[1] for batch in emitted])
+            np.testing.assert_array_equal(emitted_times, times)
+            np.testing.assert_allclose(storage, expected)
+
+    def test_backward_emits_immediately(self):
+        estimator = StreamingStorageEstimator(coefficients, scheme="backward")
+        first_times, first_storage = estimator.update(times[0], net_forcing[0])
+        self.assertEqual(len(first_times), 1)
+        self.assertTrue(np.isnan(first_storage[0]))
+        _, storage = estimator.update(times[1], net_forcing[1])
+        a1, a2, a3 = coefficients
+        self.assertAlmostEqual(storage[0], a1 * 0 + a2 * 50 / 0.5 + a3)
+        self.assertEqual(len(estimator.flush()[0]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
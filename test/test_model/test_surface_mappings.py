@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+import model.pipeline as pipeline
+import model.storage.objective_hysteresis_model as ohm
+import model.surface_mappings as surface_mappings
+from experiments.config.config import Config
+from model.penman_monteith.tuning import learn_parameters
+
+
+def make_config(penman_monteith_params):
+    config = Config().read()
+    config.experiment = {}
+    config.penman_monteith_params = penman_monteith_params
+    config.longwave_model = "burridge_gadd"
+    return config
+
+
+class TestSurfaceMappings(unittest.TestCase):
+
+    def test_coefficients_match_each_mapping(self):
+        config = Config().read()
+        names = config.get_mapping_names()[::-1]
+        coefficients = surface_mappings.get_mapping_coefficients(config.get_surface_data(names), names)
+        for name, mapping_coefficients in zip(names, coefficients):
+            config.load_surface_data(name)
+            np.testing.assert_allclose(mapping_coefficients, ohm.get_weighted_coefficients(config.surface_data))
+
+    def test_comparison_matches_a_run_per_mapping(self):
+        config = make_config({"alpha": .5, "beta": 4.4})
+        comparison = surface_mappings.compare_mappings(config, [3, 1])
+        self.assertEqual(list(comparison.table.index), [3, 1])
+        for name in [3, 1]:
+            config.load_surface_data(name)
+            output = pipeline.run(config)
+            np.testing.assert_allclose(comparison.storage[name], output["storage"])
+            np.testing.assert_allclose(comparison.sensible[name], output["model_sensible"])
+            np.testing.assert_allclose(comparison.latent[name], output["model_latent"])
+            error = learn_parameters.calculate_normalized_squared_error(
+                output["latent_heat"], output["sensible_heat"], output["model_latent"], output["model_sensible"])
+            self.assertAlmostEqual(comparison.table.loc[name, "anse"], error)
+
+    def test_grid_tuning_matches_tuning_each_mapping(self):
+        tuning_params = {"alpha": [0.3, 0.6], "beta": [4, 6], "number": 4}
+        config = make_config({"tuning_params": tuning_params})
+        comparison = surface_mappings.compare_mappings(config, [1, 2])
+        for name in [1, 2]:
+            config.load_surface_data(name)
+            errors = learn_parameters.get_errors(tuning_params["alpha"], tuning_params["beta"], 4, "storage", config)
+            best = errors.iloc[int(np.argmin(errors["error"]))]
+            self.assertEqual((comparison.table.loc[name, "alpha"], comparison.table.loc[name, "beta"]),
+                             (best["alpha"], best["beta"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+import numpy as np
+import util.evaluation_journal as evaluation_journal
+import util.search as search
+
+
+class TestEvaluationJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = Path(self.directory.name) / "evaluations.sqlite"
+        self.evaluated = []
+
+    def evaluate(self, points):
+        self.evaluated.extend(map(tuple, points))
+        return np.where(points[:, 0] > 2, np.nan, points.sum(axis=1) / 3)
+
+    def test_only_new_points_are_evaluated_across_runs(self):
+        journal = evaluation_journal.EvaluationJournal(self.path)
+        evaluate = journal.journaled(self.evaluate, "context")
+        first = evaluate(np.array([[0., 1.], [3., 1.]]))
+        journal.close()
+
+        resumed = evaluation_journal.EvaluationJournal(self.path)  # e.g. after an interrupted run
+        errors = resumed.journaled(self.evaluate, "context")(np.array([[3., 1.], [0., 1.], [1., 1.]]))
+        np.testing.assert_array_equal(errors, [np.nan, first[0], 2 / 3])
+        self.assertEqual(first[0], 1 / 3)  # exactly, not to a printed precision
+        self.assertEqual(self.evaluated, [(0, 1), (3, 1), (1, 1)])
+
+        resumed.journaled(self.evaluate, "other context")(np.array([[0., 1.]]))
+        self.assertEqual(len(self.evaluated), 4)
+        points, errors = resumed.get_evaluations("context")
+        np.testing.assert_array_equal(points, [[0, 1], [3, 1], [1, 1]])
+        resumed.close()
+
+    def test_context_depends_on_array_contents(self):
+        data = np.arange(4.)
+        context = evaluation_journal.get_context(model="a", data=data, alpha=.5)
+        self.assertEqual(context, evaluation_journal.get_context(alpha=.5, data=data.copy(), model="a"))
+        self.assertNotEqual(context, evaluation_journal.get_context(model="a", data=data + 1, alpha=.5))
+
+    def test_context_depends_on_journal_version(self):
+        context = evaluation_journal.get_context(model="a")
+        with mock.patch.object(evaluation_journal, "journal_version", evaluation_journal.journal_version + 1):
+            self.assertNotEqual(context, evaluation_journal.get_context(model="a"))
+
+    def test_warm_start_reuses_known_points(self):
+        def bowl(points):
+            self.evaluated.extend(map(tuple, points))
+            return (points[:, 0] - .3)**2 + (points[:, 1] - .6)**2
+
+        points, errors = search.refine_grid(bowl, [(0, 1), (0, 1)], 5, tolerance=1e-2)
+        evaluations = len(self.evaluated)
+        warm_points, warm_errors = search.refine_grid(bowl, [(0, 1), (0, 1)], 5, tolerance=1e-2,
+                                                      initial=(points, errors))
+        self.assertEqual(len(self.evaluated), evaluations)
+        self.assertEqual(warm_errors.min(), errors.min())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import contextlib
+import io
+import json
+import tempfile
+import time
+import unittest
+from pathlib import Path
+import util.instrumentation as instrumentation
+
+
+@instrumentation.timed("outer")
+def outer():
+    with instrumentation.stage("inner"):
+        time.sleep(.01)
+    instrumentation.count("outer.calls")
+    return 1
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        was_enabled = instrumentation.is_enabled()
+        self.addCleanup(lambda: (instrumentation.enable if was_enabled else instrumentation.disable)())
+        self.addCleanup(instrumentation.reset)
+        instrumentation.reset()
+
+    def test_disabled_records_nothing(self):
+        instrumentation.disable()
+        self.assertEqual(outer(), 1)
+        self.assertEqual(instrumentation.get_summary(), {"stages": {}, "counters": {}})
+
+    def test_nested_stages(self):
+        instrumentation.enable()
+        outer()
+        outer()
+        summary = instrumentation.get_summary()
+        self.assertEqual(summary["counters"], {"outer.calls": 2})
+        stages = summary["stages"]
+        self.assertEqual((stages["outer"]["calls"], stages["inner"]["calls"]), (2, 2))
+        self.assertGreaterEqual(stages["inner"]["seconds"], .02)
+        self.assertAlmostEqual(stages["outer"]["self_seconds"], stages["outer"]["seconds"] - stages["inner"]["seconds"])
+        self.assertEqual(stages["inner"]["self_seconds"], stages["inner"]["seconds"])
+
+    def test_trace(self):
+        instrumentation.enable()
+        outer()
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "trace.json"
+            instrumentation.write_trace(path)
+            with open(path) as file:
+                trace = json.load(file)
+        self.assertEqual([event["name"] for event in trace["traceEvents"]], ["inner", "outer"])
+        self.assertEqual(trace["counters"], {"outer.calls": 1})
+        self.assertIn("inner", instrumentation.format_summary())
+
+    def test_progress_is_rate_limited(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            progress = instrumentation.Progress("quick", total=1000)
+            for _ in range(1000):
+                progress.update(error=.5)
+            progress.close()
+        self.assertEqual(output.getvalue(), "")
+
+        with contextlib.redirect_stdout(output):
+            progress = instrumentation.Progress("slow", total=3, interval=0)
+            for error in [3., 2., 1.]:
+                progress.update(error=error)
+        self.assertEqual([line.split(" in ")[0] for line in output.getvalue().splitlines()],
+                         ["slow: 1/3", "slow: 2/3", "slow: 3/3"])
+        self.assertTrue(output.getvalue().endswith("error=1\n"))
+
+
+if __name__ == '__main__':
+    unittest.main()
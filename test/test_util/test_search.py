@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+import util.search as search
+from util.exceptions import InvalidArgumentError
+
+
+def bowl(points):
+    return (points[:, 0] - 0.3137)**2 + 0.01*(points[:, 1] + 12.34)**2
+
+
+class TestSearch(unittest.TestCase):
+
+    def test_refines_to_tolerance(self):
+        points, errors = search.refine_grid(bowl, [(0, 1), (-80, 0)], 5, tolerance=1e-4)
+        best = points[np.argmin(errors)]
+        self.assertAlmostEqual(best[0], 0.3137, delta=1e-4)
+        self.assertAlmostEqual(best[1], -12.34, delta=80e-4)
+        self.assertEqual(len(np.unique(points, axis=0)), len(points))
+        self.assertLess(len(points), 1000)  # a grid this fine would be 10^8 points
+
+    def test_budget_and_fixed_parameters(self):
+        points, errors = search.refine_grid(bowl, [(0, 1), (-20, -20)], [9, 1], budget=30)
+        self.assertLessEqual(len(points), 30)
+        np.testing.assert_array_equal(points[:, 1], -20)
+        np.testing.assert_array_equal(errors, bowl(points))
+        with self.assertRaises(InvalidArgumentError):
+            search.refine_grid(bowl, [(0, 1), (-80, 0)], 9, budget=30)
+        with self.assertRaises(InvalidArgumentError):
+            search.refine_grid(bowl, [(0, 1), (-80, 0)], 5, refine_number=3)
+
+    def test_nan_errors_are_never_best(self):
+        def gappy_bowl(points):
+            errors = bowl(points)
+            errors[points[:, 0] < 0.3] = np.nan
+            return errors
+
+        points, errors = search.refine_grid(gappy_bowl, [(0, 1), (-80, 0)], 5, tolerance=1e-4)
+        best = points[search.get_best_index(errors)]
+        self.assertAlmostEqual(best[0], 0.3137, places=3)
+        with self.assertRaises(InvalidArgumentError):
+            search.refine_grid(lambda points: np.full(len(points), np.nan), [(0, 1), (-80, 0)], 5)
+        with self.assertRaises(InvalidArgumentError):
+            search.get_best_index([np.nan, np.nan])
+
+    def test_refine_options(self):
+        params = {"method": "refine", "number": 9, "budget": 60, "warm_start": True}
+        self.assertEqual(search.get_refine_options(params), {"budget": 60, "warm_start": True})
+
+
+if __name__ == '__main__':
+    unittest.main()